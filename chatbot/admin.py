@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Destination, Hotel, Restaurant, Attraction, ChatHistory, UserProfile
+from .models import Destination, Hotel, Restaurant, Attraction, ChatHistory, UserProfile, ConversationMemory, ArchivedChatHistory
 
 # Register your models here.
 
@@ -45,12 +45,33 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(ChatHistory)
 class ChatHistoryAdmin(admin.ModelAdmin):
-    list_display = ('session_id', 'user', 'timestamp', 'response_time')
-    list_filter = ('timestamp', 'user')
+    list_display = ('session_id', 'user', 'timestamp', 'response_time', 'time_to_first_token', 'is_cached', 'intent')
+    list_filter = ('timestamp', 'is_cached', 'intent', 'user')
     search_fields = ('user_message', 'session_id', 'user__username')
-    readonly_fields = ('timestamp', 'response_time')
+    readonly_fields = ('timestamp', 'response_time', 'time_to_first_token')
     ordering = ('-timestamp',)
     date_hierarchy = 'timestamp'
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user')
+
+@admin.register(ArchivedChatHistory)
+class ArchivedChatHistoryAdmin(admin.ModelAdmin):
+    list_display = ('session_id', 'user', 'timestamp', 'archived_at')
+    list_filter = ('archived_at',)
+    search_fields = ('session_id', 'user__username')
+    ordering = ('-timestamp',)
+    show_full_result_count = False  # bảng lớn: không COUNT(*) mỗi lần mở danh sách
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(ConversationMemory)
+class ConversationMemoryAdmin(admin.ModelAdmin):
+    list_display = ('session_id', 'summarized_until', 'updated_at')
+    search_fields = ('session_id', 'summary')
+    readonly_fields = ('updated_at',)
+    ordering = ('-updated_at',)
@@ -0,0 +1,182 @@
+# Near-duplicate answer cache in front of the LLM
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from . import metrics
+from .config import ANSWER_CACHE_SETTINGS
+from .text import fold_text
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+class AnswerCache:
+    """Cache câu trả lời theo câu hỏi đã chuẩn hóa, có so khớp gần đúng.
+
+    - Khớp chính xác trên câu hỏi đã bỏ dấu/dấu câu.
+    - Khớp gần đúng bằng MinHash + LSH trên shingle ký tự, xác nhận lại bằng
+      độ tương đồng Jaccard ước lượng >= SIMILARITY_THRESHOLD.
+    - Mỗi entry gắn với version của travel context, TTL và loại bỏ theo LRU.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, threshold=0.85,
+                 num_perm=64, bands=16, shingle_size=3, seed=42):
+        assert num_perm % bands == 0, "num_perm phải chia hết cho bands"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._entries = OrderedDict()  # key -> entry dict, thứ tự LRU
+        self._buckets = {}             # (version, band, band_hash) -> set(key)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    # --- MinHash ---------------------------------------------------------
+
+    def _shingles(self, normalized):
+        text = normalized.replace(" ", "_")
+        k = self.shingle_size
+        if len(text) <= k:
+            return {text}
+        return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+    def _signature(self, normalized):
+        hashes = [zlib.crc32(s.encode("utf-8")) for s in self._shingles(normalized)]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._perms
+        )
+
+    def _band_keys(self, version, signature):
+        rows = self.rows
+        return [
+            (version, band, hash(signature[band * rows:(band + 1) * rows]))
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def _numbers(normalized):
+        # "tháng 3" và "tháng 5" rất giống nhau theo shingle nhưng khác nghĩa
+        return frozenset(token for token in normalized.split() if any(c.isdigit() for c in token))
+
+    # --- Public API ------------------------------------------------------
+
+    def get(self, message, version):
+        """Trả về câu trả lời đã cache hoặc None"""
+        normalized = fold_text(message)
+        if not normalized:
+            return None
+        key = (version, normalized)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["answer"]
+
+        # Tính signature ngoài lock
+        signature = self._signature(normalized)
+        numbers = self._numbers(normalized)
+
+        with self._lock:
+            best_key, best_score = None, 0.0
+            for band_key in self._band_keys(version, signature):
+                for candidate in self._buckets.get(band_key, ()):
+                    entry = self._entries.get(candidate)
+                    if entry is None or entry["expires_at"] <= now or entry["numbers"] != numbers:
+                        continue
+                    score = sum(
+                        1 for x, y in zip(signature, entry["signature"]) if x == y
+                    ) / self.num_perm
+                    if score > best_score:
+                        best_key, best_score = candidate, score
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                self.similar_hits += 1
+                return self._entries[best_key]["answer"]
+            self.misses += 1
+        return None
+
+    def set(self, message, version, answer):
+        """Lưu câu trả lời cho câu hỏi"""
+        normalized = fold_text(message)
+        if not normalized:
+            return
+        key = (version, normalized)
+        signature = self._signature(normalized)
+        entry = {
+            "answer": answer,
+            "expires_at": time.time() + self.ttl,
+            "signature": signature,
+            "numbers": self._numbers(normalized),
+            "band_keys": self._band_keys(version, signature),
+        }
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for band_key in entry["band_keys"]:
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for band_key in entry["band_keys"]:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        """Bộ đếm hit/miss"""
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_SETTINGS['MAX_ENTRIES'],
+    ttl=ANSWER_CACHE_SETTINGS['TTL'],
+    threshold=ANSWER_CACHE_SETTINGS['SIMILARITY_THRESHOLD'],
+)
+metrics.REGISTRY.gauge_callback(
+    "chatbot_answer_cache_entries", "Số câu trả lời trong answer cache", lambda: answer_cache.stats()["entries"]
+)
+
+
+def get_cached_answer(message, version):
+    if not ANSWER_CACHE_SETTINGS['ENABLED']:
+        return None
+    return answer_cache.get(message, version)
+
+
+def cache_answer(message, version, answer):
+    if ANSWER_CACHE_SETTINGS['ENABLED']:
+        answer_cache.set(message, version, answer)
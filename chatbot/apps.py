@@ -4,3 +4,23 @@ from django.apps import AppConfig
 class ChatbotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chatbot'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import metrics, signals  # noqa: F401
+        from .config import CHAT_BUFFER_SETTINGS, RETENTION_SETTINGS
+
+        # Cộng thời gian truy vấn DB vào Server-Timing/metrics của request hiện tại
+        connection_created.connect(metrics.install_db_timer, dispatch_uid="metrics_db_timer")
+
+        if CHAT_BUFFER_SETTINGS['ENABLED'] and CHAT_BUFFER_SETTINGS['SPOOL_DIR']:
+            # Replay spool còn sót (sau crash) ngay khi process nhận request đầu tiên
+            from django.core.signals import request_started
+            from .chat_buffer import chat_buffer
+            request_started.connect(chat_buffer.start, dispatch_uid="chat_buffer_start")
+
+        if RETENTION_SETTINGS['ENABLED'] and RETENTION_SETTINGS['RUN_INTERVAL'] > 0:
+            # Chỉ chạy trong process phục vụ request (không chạy khi migrate/lệnh quản trị)
+            from django.core.signals import request_started
+            from . import retention
+            request_started.connect(retention.start, dispatch_uid="chat_retention_start")
@@ -6,6 +6,9 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from .models import UserProfile
+from . import db_router
+from .chat_buffer import pending_chats, unwritten
+from .pagination import keyset_paginate, count_total, parse_per_page, InvalidCursor
 import json
 
 def register_view(request):
@@ -83,44 +86,60 @@ def profile_view(request):
 
 @login_required
 def user_chat_history(request):
-    """Get chat history for logged in user"""
-    from .models import ChatHistory
+    """Get chat history for logged in user (cursor pagination, mới nhất trước)"""
+    from .models import ArchivedChatHistory, ChatHistory
     
-    page = int(request.GET.get('page', 1))
-    per_page = int(request.GET.get('per_page', 50))
+    # Đọc từ replica; user vừa chat thì đọc primary (read-your-writes)
+    with db_router.read_replica(f"user:{request.user.pk}"):
+        per_page = parse_per_page(request.GET.get('per_page'), default=50)
     
-    # Get all chat history for this user
-    from django.core.paginator import Paginator
+        history_queryset = ChatHistory.objects.filter(user=request.user)
+        # Bản ghi cũ đã được retention chuyển sang bảng archive: trộn vào theo cùng thứ tự
+        archived_queryset = ArchivedChatHistory.objects.filter(user=request.user)
+        # Tin nhắn mới nhất có thể còn trong write-behind buffer (đứng đầu trang đầu tiên);
+        # lấy trước khi đọc DB để bản ghi vừa được flush không bị mất
+        pending = pending_chats(user_id=request.user.pk)[::-1]
     
-    history_queryset = ChatHistory.objects.filter(
-        user=request.user
-    ).order_by('-timestamp')
-    
-    paginator = Paginator(history_queryset, per_page)
-    history_page = paginator.get_page(page)
+        try:
+            history_page = keyset_paginate(
+                history_queryset, request.GET.get('cursor'), per_page, descending=True,
+                also=(archived_queryset,)
+            )
+        except InvalidCursor as e:
+            return JsonResponse({"error": "invalid_cursor", "message": str(e)}, status=400)
+
+        chats = list(history_page)
+        pending = unwritten(pending, chats)
+        if not history_page.has_previous:
+            chats = pending + chats
     
-    history_data = [
-        {
-            "session_id": chat.session_id,
-            "user_message": chat.user_message,
-            "bot_response": chat.bot_response,
-            "timestamp": chat.timestamp.strftime("%d/%m/%Y %H:%M"),
-            "response_time": chat.response_time,
-        }
-        for chat in history_page
-    ]
+        history_data = [
+            {
+                "session_id": chat.session_id,
+                "user_message": chat.user_message,
+                "bot_response": chat.bot_response,
+                "timestamp": chat.timestamp.strftime("%d/%m/%Y %H:%M"),
+                "response_time": chat.response_time,
+            }
+            for chat in chats
+        ]
 
-    if request.headers.get('Accept') == 'application/json':
-        return JsonResponse({
-            "history": history_data,
-            "total": paginator.count,
-            "page": page,
-            "has_next": history_page.has_next(),
-            "has_previous": history_page.has_previous()
-        })
+        if request.headers.get('Accept') == 'application/json':
+            total = count_total(
+                history_queryset, request.GET.get('count'), f"user_chat_history_count:{request.user.pk}",
+                also=(archived_queryset,)
+            )
+            return JsonResponse({
+                "history": history_data,
+                "total": total + len(pending) if total is not None else None,
+                "next": history_page.next_cursor,
+                "prev": history_page.prev_cursor,
+                "has_next": history_page.has_next,
+                "has_previous": history_page.has_previous
+            })
     
-    context = {
-        'history': history_page,
-        'paginator': paginator
-    }
-    return render(request, 'chatbot/user_history.html', context)
\ No newline at end of file
+        context = {
+            'history': chats,
+            'page': history_page
+        }
+        return render(request, 'chatbot/user_history.html', context)
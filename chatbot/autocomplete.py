@@ -0,0 +1,329 @@
+# Gợi ý khi gõ (typeahead): mảng khóa đã sắp xếp + tìm nhị phân trên văn bản đã bỏ dấu, hoàn toàn trong bộ nhớ
+#
+# Mỗi tên được đánh chỉ mục theo mọi hậu tố bắt đầu ở đầu từ ("khach san grand da lat", "grand da lat",
+# "da lat", "lat") nên gõ "lat" cũng ra Đà Lạt. Tiền tố khớp nhiều khóa (> SMALL_RANGE) được tính sẵn
+# danh sách gợi ý theo rating, các tiền tố còn lại duyệt trực tiếp một đoạn ngắn của mảng.
+#
+# Đồng bộ với DB: mỗi signal thay đổi catalog ghi (loại, id) vào cache theo version vừa tăng;
+# process nào cũng đọc các thay đổi đó và chỉ cập nhật vài bản ghi liên quan. Thiếu thay đổi nào
+# (bulk import, cache bị xóa...) thì dựng lại toàn bộ ở thread nền.
+import threading
+from bisect import bisect_left, insort
+from django.core.cache import cache
+from django.db import connections
+from .catalog_cache import get_catalog_version
+from .config import AUTOCOMPLETE_SETTINGS
+from .models import Destination, Hotel, Restaurant, Attraction
+from .text import fold_text
+
+DESTINATION, CITY, COUNTRY, HOTEL, ATTRACTION = "destination", "city", "country", "hotel", "attraction"
+MODEL_KINDS = {Destination: DESTINATION, Hotel: HOTEL, Restaurant: None, Attraction: ATTRACTION}
+
+_SEPARATOR = "\x00"
+_MAX_CHAR = "\U0010ffff"
+
+
+def _suffixes(text):
+    words = fold_text(text).split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+    """Mảng khóa "<hậu tố>\\x00<entry>" đã sắp xếp, thông tin từng entry và gợi ý tính sẵn cho tiền tố phổ biến"""
+
+    def __init__(self, keep, small_range):
+        self.keep = keep                # số gợi ý giữ cho mỗi tiền tố tính sẵn (dư để cập nhật không phải tính lại)
+        self.small_range = small_range
+        self.keys = []
+        self.entries = {}               # entry -> (type, id, name, detail, rating)
+        self.entry_keys = {}            # entry -> [khóa]
+        self.top = {}                   # tiền tố -> [entry] theo rating giảm dần
+        self.version = None
+        # Thành phố/quốc gia là gợi ý riêng, rating = rating cao nhất của các điểm đến trong đó
+        self.members = {}               # entry thành phố/quốc gia -> {destination_id: rating}
+        self.groups = {}                # destination_id -> (entry thành phố, entry quốc gia)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _order(self, entry):
+        _, _, name, _, rating = self.entries[entry]
+        return -rating, name
+
+    def _rank(self, entries, limit):
+        return sorted(entries, key=self._order)[:limit]
+
+    def _range(self, prefix, lo=0, hi=None):
+        lo = bisect_left(self.keys, prefix, lo, hi if hi is not None else len(self.keys))
+        return lo, bisect_left(self.keys, prefix + _MAX_CHAR, lo, hi if hi is not None else len(self.keys))
+
+    def _scan(self, lo, hi, limit):
+        return self._rank({key.rsplit(_SEPARATOR, 1)[1] for key in self.keys[lo:hi]}, limit)
+
+    # --- Dựng toàn bộ --------------------------------------------------------
+
+    def add(self, entry, kind, pk, name, detail, rating, texts):
+        """Thêm entry khi dựng index (gọi finish() sau cùng)"""
+        self.entries[entry] = (kind, pk, name, detail, rating or 0.0)
+        keys = [f"{suffix}{_SEPARATOR}{entry}" for text in texts for suffix in _suffixes(text)]
+        self.entry_keys[entry] = keys
+        self.keys.extend(keys)
+
+    def finish(self):
+        self.keys.sort()
+        self.top = {}
+        self._build_top("", 0, len(self.keys))
+
+    def _build_top(self, prefix, lo, hi):
+        """Gợi ý cho keys[lo:hi] (cùng tiền tố), ghép từ gợi ý của các tiền tố con; lưu lại nếu đoạn lớn"""
+        if hi - lo <= self.small_range or prefix.endswith(_SEPARATOR):
+            return self._scan(lo, hi, self.keep)
+        candidates = set()
+        length = len(prefix) + 1
+        i = lo
+        while i < hi:
+            child = self.keys[i][:length]
+            j = self._range(child, i, hi)[1]
+            candidates.update(self._build_top(child, i, j))
+            i = j
+        self.top[prefix] = self._rank(candidates, self.keep)
+        return self.top[prefix]
+
+    # --- Cập nhật từng entry -------------------------------------------------
+
+    def _prefixes(self, keys):
+        """Các tiền tố đã tính sẵn bị ảnh hưởng bởi các khóa"""
+        prefixes = set()
+        for key in keys:
+            suffix = key.split(_SEPARATOR, 1)[0]
+            prefixes.update(suffix[:n] for n in range(len(suffix) + 1) if suffix[:n] in self.top)
+        return prefixes
+
+    def remove(self, entry):
+        keys = self.entry_keys.pop(entry, None)
+        if keys is None:
+            return
+        for key in keys:
+            i = bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                del self.keys[i]
+        stale = []
+        for prefix in self._prefixes(keys):
+            top = self.top[prefix]
+            if entry in top:
+                top.remove(entry)
+                if len(top) < self.keep // 2:
+                    stale.append(prefix)
+        del self.entries[entry]
+        # Hết phần dư: tính lại từ mảng khóa (hiếm, chỉ khi nhiều entry đầu bảng cùng bị xóa)
+        for prefix in stale:
+            self.top[prefix] = self._scan(*self._range(prefix), self.keep)
+
+    def put(self, entry, kind, pk, name, detail, rating, texts):
+        """Thêm hoặc cập nhật một entry"""
+        self.remove(entry)
+        self.entries[entry] = (kind, pk, name, detail, rating or 0.0)
+        keys = sorted({f"{suffix}{_SEPARATOR}{entry}" for text in texts for suffix in _suffixes(text)})
+        self.entry_keys[entry] = keys
+        for key in keys:
+            insort(self.keys, key)
+        order = self._order(entry)
+        for prefix in self._prefixes(keys):
+            top = self.top[prefix]
+            i = 0
+            while i < len(top) and self._order(top[i]) <= order:
+                i += 1
+            if i < self.keep:
+                top.insert(i, entry)
+                del top[self.keep:]
+
+    # --- Thành phố/quốc gia --------------------------------------------------
+
+    def _put_group(self, entry, kind, name, detail):
+        members = self.members.get(entry)
+        if members:
+            self.put(entry, kind, None, name, detail, max(members.values()), [name])
+        else:
+            self.members.pop(entry, None)
+            self.remove(entry)
+
+    def set_destination(self, pk, name, city, country, rating):
+        """Điểm đến và nhóm thành phố/quốc gia của nó (rating = cao nhất trong nhóm)"""
+        self.remove_destination(pk)
+        city_entry, country_entry = f"{CITY}:{fold_text(city)}", f"{COUNTRY}:{fold_text(country)}"
+        self.groups[pk] = (city_entry, country_entry)
+        self.members.setdefault(city_entry, {})[pk] = rating or 0.0
+        self.members.setdefault(country_entry, {})[pk] = rating or 0.0
+        self.put(f"{DESTINATION}:{pk}", DESTINATION, pk, name, f"{city}, {country}", rating, [name])
+        self._put_group(city_entry, CITY, city, country)
+        self._put_group(country_entry, COUNTRY, country, "")
+
+    def remove_destination(self, pk):
+        self.remove(f"{DESTINATION}:{pk}")
+        groups = self.groups.pop(pk, None)
+        if groups is None:
+            return
+        for group_entry in groups:
+            self.members.get(group_entry, {}).pop(pk, None)
+            if group_entry in self.entries:
+                kind, _, name, detail, _ = self.entries[group_entry]
+                self._put_group(group_entry, kind, name, detail)
+
+    # --- Truy vấn ------------------------------------------------------------
+
+    def search(self, query, limit):
+        prefix = fold_text(query)
+        if not prefix:
+            return []
+        top = self.top.get(prefix)
+        entries = top[:limit] if top is not None else self._scan(*self._range(prefix), limit)
+        return [
+            {"type": kind, "id": pk, "name": name, "detail": detail, "rating": round(rating, 1)}
+            for kind, pk, name, detail, rating in (self.entries[entry] for entry in entries)
+        ]
+
+
+# --- Dựng/đồng bộ với DB --------------------------------------------------------
+
+def _new_index():
+    return PrefixIndex(AUTOCOMPLETE_SETTINGS['MAX_LIMIT'] * 2, AUTOCOMPLETE_SETTINGS['SMALL_RANGE'])
+
+
+def _child_rows(model, **filters):
+    return model.objects.filter(**filters).values_list("pk", "name", "destination__city", "rating")
+
+
+def build_index(version=None):
+    """Dựng index từ toàn bộ catalog (mỗi model một query, chỉ lấy các cột cần)"""
+    index = _new_index()
+    groups = {}
+    for pk, name, city, country, rating in Destination.objects.values_list(
+        "pk", "name", "city", "country", "rating"
+    ).iterator():
+        index.add(f"{DESTINATION}:{pk}", DESTINATION, pk, name, f"{city}, {country}", rating, [name])
+        city_entry, country_entry = f"{CITY}:{fold_text(city)}", f"{COUNTRY}:{fold_text(country)}"
+        index.groups[pk] = (city_entry, country_entry)
+        index.members.setdefault(city_entry, {})[pk] = rating or 0.0
+        index.members.setdefault(country_entry, {})[pk] = rating or 0.0
+        groups.setdefault(city_entry, (CITY, city, country))
+        groups.setdefault(country_entry, (COUNTRY, country, ""))
+    for entry, (kind, name, detail) in groups.items():
+        index.add(entry, kind, None, name, detail, max(index.members[entry].values()), [name])
+    for model, kind in ((Hotel, HOTEL), (Attraction, ATTRACTION)):
+        for pk, name, city, rating in _child_rows(model).iterator():
+            index.add(f"{kind}:{pk}", kind, pk, name, city, rating, [name])
+    index.finish()
+    index.version = version
+    return index
+
+
+def _change_key(version):
+    return f"autocomplete_change:{version}"
+
+
+def record_change(model, pk, version):
+    """Gọi từ signal sau khi tăng catalog version: ghi lại bản ghi vừa đổi để các process cập nhật từng phần"""
+    if model in MODEL_KINDS:
+        cache.set(_change_key(version), (MODEL_KINDS[model], pk), AUTOCOMPLETE_SETTINGS['CHANGE_TTL'])
+
+
+def _apply_changes(index, changes):
+    """Đọc lại các bản ghi đã đổi (bản ghi không còn thì xóa khỏi index)"""
+    changed = {}
+    for kind, pk in changes:
+        if kind is not None:
+            changed.setdefault(kind, set()).add(pk)
+    destination_ids = changed.get(DESTINATION, set())
+    destinations = {
+        row[0]: row for row in Destination.objects.filter(pk__in=destination_ids).values_list(
+            "pk", "name", "city", "country", "rating")
+    }
+    children = {}
+    for model, kind in ((Hotel, HOTEL), (Attraction, ATTRACTION)):
+        # Đổi tên thành phố của điểm đến thì chi tiết của khách sạn/điểm tham quan thuộc nó cũng đổi
+        rows = list(_child_rows(model, pk__in=changed.get(kind, ())))
+        if destination_ids:
+            rows += list(_child_rows(model, destination_id__in=destination_ids))
+        children[kind] = (changed.get(kind, set()), rows)
+
+    with _lock:
+        for pk in destination_ids:
+            if pk in destinations:
+                _, name, city, country, rating = destinations[pk]
+                index.set_destination(pk, name, city, country, rating)
+            else:
+                index.remove_destination(pk)
+        for kind, (pks, rows) in children.items():
+            found = set()
+            for pk, name, city, rating in rows:
+                found.add(pk)
+                index.put(f"{kind}:{pk}", kind, pk, name, city, rating, [name])
+            for pk in pks - found:
+                index.remove(f"{kind}:{pk}")
+
+
+def _catch_up(index, version):
+    """Áp các thay đổi từ index.version tới version; False nếu thiếu thay đổi nào (cần dựng lại)"""
+    if index.version is None or not 0 < version - index.version <= AUTOCOMPLETE_SETTINGS['MAX_CHANGES']:
+        return False
+    keys = [_change_key(v) for v in range(index.version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return False
+    _apply_changes(index, changes.values())
+    index.version = version
+    return True
+
+
+_index = None
+_lock = threading.Lock()        # đọc/ghi index
+_build_lock = threading.Lock()  # chỉ một luồng đồng bộ/dựng lại
+_rebuilding = False
+
+
+def _rebuild(version):
+    global _index, _rebuilding
+    try:
+        _index = build_index(version)
+    except Exception as e:
+        print(f"Autocomplete index build error: {str(e)}")
+    finally:
+        _rebuilding = False
+
+
+def _rebuild_in_background(version):
+    try:
+        _rebuild(version)
+    finally:
+        connections.close_all()
+
+
+def get_index():
+    """Index hiện tại: cập nhật từng phần theo các thay đổi đã ghi, thiếu thì dựng lại (nền nếu đã có index cũ)"""
+    global _rebuilding
+    version = get_catalog_version()
+    if _index is not None and _index.version == version:
+        return _index
+    with _build_lock:
+        if _index is None:
+            _rebuild(version)
+        elif _index.version != version and not _rebuilding:
+            try:
+                caught_up = _catch_up(_index, version)
+            except Exception as e:
+                print(f"Autocomplete update error: {str(e)}")
+                caught_up = False
+            if not caught_up:
+                _rebuilding = True
+                threading.Thread(target=_rebuild_in_background, args=(version,), daemon=True).start()
+    return _index
+
+
+def suggest(query, limit=None):
+    """Gợi ý cho chuỗi đang gõ, xếp theo rating"""
+    limit = max(1, min(limit or AUTOCOMPLETE_SETTINGS['DEFAULT_LIMIT'], AUTOCOMPLETE_SETTINGS['MAX_LIMIT']))
+    index = get_index()
+    if index is None:
+        return []
+    with _lock:
+        return index.search(query, limit)
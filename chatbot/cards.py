@@ -0,0 +1,212 @@
+# Thẻ tri thức (knowledge card) theo điểm đến: bản tóm tắt gọn dựng sẵn, đọc bằng một truy vấn theo khóa chính
+#
+# Mỗi card gồm thông tin điểm đến, top khách sạn/nhà hàng/điểm tham quan, số lượng và khoảng giá,
+# ở hai dạng: data (JSON; API danh sách chỉ đọc các khóa SUMMARY_FIELDS) và text (đưa thẳng vào prompt).
+# Signal dựng lại card của điểm đến bị ảnh hưởng sau khi commit; seed/import hàng loạt gọi rebuild_cards()
+# cho toàn bộ. Request đọc không bao giờ dựng/ghi card.
+import threading
+import time
+from django.db import router, transaction
+from django.db.models import Count, Max, Min
+from .config import CARD_SETTINGS
+from .db_router import PRIMARY
+from .models import Destination, Hotel, Restaurant, Attraction, DestinationCard
+
+CHUNK_SIZE = 500
+
+DESTINATION_COLUMNS = ("pk", "name", "city", "country", "description", "best_time_to_visit", "average_cost", "rating")
+HOTEL_COLUMNS = ("pk", "destination_id", "name", "star_rating", "price_per_night", "rating")
+RESTAURANT_COLUMNS = ("pk", "destination_id", "name", "cuisine_type", "price_range", "rating")
+ATTRACTION_COLUMNS = ("pk", "destination_id", "name", "category", "entry_fee", "rating")
+# Các khóa của card trả về cho API danh sách (search_destinations)
+SUMMARY_FIELDS = ("id", "name", "city", "country", "description", "rating", "average_cost", "best_time")
+
+
+def _summary(description):
+    return description[:200] + "..." if len(description) > 200 else description
+
+
+def _price_range(stats):
+    if not stats.get("n"):
+        return None
+    return [float(stats["low"]), float(stats["high"])]
+
+
+def _top_rows(model, columns, destination_ids, using):
+    """Top N bản ghi theo rating của từng điểm đến (chỉ các cột cần)"""
+    rows = model.objects.using(using).filter(destination_id__in=destination_ids).order_by("destination_id", "-rating", "pk")
+    top = {}
+    for row in rows.values_list(*columns):
+        items = top.setdefault(row[1], [])
+        if len(items) < CARD_SETTINGS['TOP_N']:
+            items.append(row)
+    return top
+
+
+def _stats(model, price_field, destination_ids, using):
+    aggregates = {"n": Count("pk")}
+    if price_field:
+        aggregates.update(low=Min(price_field), high=Max(price_field))
+    rows = model.objects.using(using).filter(destination_id__in=destination_ids).order_by()
+    return {row["destination_id"]: row for row in rows.values("destination_id").annotate(**aggregates)}
+
+
+def card_text(data, categories):
+    """Phần text của card cho prompt: mỗi loại một dòng, TEXT_TOP_N mục"""
+    n = CARD_SETTINGS['TEXT_TOP_N']
+    lines = [
+        f"Điểm đến: {data['name']} ({data['city']}, {data['country']}) - đánh giá {data['rating']:.1f}/5, "
+        f"chi phí ~{data['average_cost']:.0f} USD/ngày, thời điểm đẹp: {data['best_time']}"
+    ]
+    if data["hotels"]:
+        low, high = data["hotel_price"]
+        lines.append(f"Khách sạn ({data['hotel_count']}, {low:.0f}-{high:.0f} USD/đêm): " + "; ".join(
+            f"{h['name']} {h['star_rating']} sao {h['price_per_night']:.0f} USD {h['rating']:.1f}/5"
+            for h in data["hotels"][:n]
+        ))
+    if data["restaurants"]:
+        lines.append(f"Nhà hàng ({data['restaurant_count']}): " + "; ".join(
+            f"{r['name']} ({r['cuisine_type']}, {r['price_range']}) {r['rating']:.1f}/5"
+            for r in data["restaurants"][:n]
+        ))
+    if data["attractions"]:
+        low, high = data["entry_fee"]
+        lines.append(f"Tham quan ({data['attraction_count']}, vé {low:.0f}-{high:.0f} USD): " + "; ".join(
+            f"{a['name']} ({categories.get(a['category'], a['category'])}) {a['rating']:.1f}/5"
+            for a in data["attractions"][:n]
+        ))
+    return "\n  ".join(lines)
+
+
+def _build_chunk(destination_ids, models, using):
+    destination_model, hotel_model, restaurant_model, attraction_model, card_model = models
+    categories = dict(attraction_model._meta.get_field("category").choices)
+    hotels = _top_rows(hotel_model, HOTEL_COLUMNS, destination_ids, using)
+    restaurants = _top_rows(restaurant_model, RESTAURANT_COLUMNS, destination_ids, using)
+    attractions = _top_rows(attraction_model, ATTRACTION_COLUMNS, destination_ids, using)
+    hotel_stats = _stats(hotel_model, "price_per_night", destination_ids, using)
+    restaurant_stats = _stats(restaurant_model, None, destination_ids, using)
+    attraction_stats = _stats(attraction_model, "entry_fee", destination_ids, using)
+
+    cards = []
+    destinations = destination_model.objects.using(using).filter(pk__in=destination_ids).order_by()
+    for pk, name, city, country, description, best_time, average_cost, rating in destinations.values_list(
+        *DESTINATION_COLUMNS
+    ):
+        data = {
+            "id": pk,
+            "name": name,
+            "city": city,
+            "country": country,
+            "description": _summary(description),
+            "rating": rating,
+            "average_cost": float(average_cost),
+            "best_time": best_time,
+            "hotel_count": hotel_stats.get(pk, {}).get("n", 0),
+            "hotel_price": _price_range(hotel_stats.get(pk, {})),
+            "hotels": [
+                {"id": h[0], "name": h[2], "star_rating": h[3], "price_per_night": float(h[4]), "rating": h[5]}
+                for h in hotels.get(pk, ())
+            ],
+            "restaurant_count": restaurant_stats.get(pk, {}).get("n", 0),
+            "restaurants": [
+                {"id": r[0], "name": r[2], "cuisine_type": r[3], "price_range": r[4], "rating": r[5]}
+                for r in restaurants.get(pk, ())
+            ],
+            "attraction_count": attraction_stats.get(pk, {}).get("n", 0),
+            "entry_fee": _price_range(attraction_stats.get(pk, {})),
+            "attractions": [
+                {"id": a[0], "name": a[2], "category": a[3], "entry_fee": float(a[4]), "rating": a[5]}
+                for a in attractions.get(pk, ())
+            ],
+        }
+        cards.append(card_model(destination_id=pk, data=data, text=card_text(data, categories)))
+    return cards
+
+
+def rebuild_cards(destination_ids=None, models=None, using="default"):
+    """Dựng lại card của các điểm đến (None: toàn bộ), theo từng lô điểm đến; trả về {destination_id: card}"""
+    models = models or (Destination, Hotel, Restaurant, Attraction, DestinationCard)
+    destination_model, card_model = models[0], models[-1]
+    built = {}
+    with transaction.atomic(using=using):
+        if destination_ids is None:
+            card_model.objects.using(using).all().delete()
+            destination_ids = list(destination_model.objects.using(using).order_by("pk").values_list("pk", flat=True))
+        else:
+            destination_ids = list(destination_ids)
+        for i in range(0, len(destination_ids), CHUNK_SIZE):
+            chunk = destination_ids[i:i + CHUNK_SIZE]
+            cards = _build_chunk(chunk, models, using)
+            card_model.objects.using(using).filter(destination_id__in=chunk).delete()
+            card_model.objects.using(using).bulk_create(cards)
+            built.update((card.destination_id, card) for card in cards)
+    return built
+
+
+# --- Cập nhật theo signal -----------------------------------------------------
+
+# Theo từng thread: callback on_commit chạy trên thread đã commit, lần dựng của thread khác
+# có thể đã đọc dữ liệu trước khi transaction này commit
+_local = threading.local()
+
+
+def _rebuild_if_stale(destination_id, requested_at):
+    # Lần dựng bắt đầu sau khi thay đổi được ghi nhận đã đọc dữ liệu mới nhất: bỏ qua
+    # (vd. xóa nhiều khách sạn của cùng điểm đến trong một transaction chỉ dựng lại một lần)
+    built_at = _local.__dict__.setdefault("built_at", {})  # destination_id -> lúc bắt đầu dựng
+    if built_at.get(destination_id, -1.0) >= requested_at:
+        return
+    started = time.monotonic()
+    try:
+        rebuild_cards([destination_id])
+        built_at[destination_id] = started
+    except Exception as e:
+        print(f"Destination card build error: {str(e)}")
+
+
+def schedule_rebuild(destination_id):
+    """Gọi từ signal: dựng lại card của điểm đến sau khi transaction hiện tại commit"""
+    if destination_id is None:
+        return
+    requested_at = time.monotonic()
+    transaction.on_commit(lambda: _rebuild_if_stale(destination_id, requested_at))
+
+
+# --- Đọc ----------------------------------------------------------------------
+
+def get_cards(destination_ids):
+    """{destination_id: DestinationCard}, một truy vấn theo khóa chính, chỉ đọc.
+
+    Card chưa có trên replica (chưa kịp replicate) thì đọc lại từ primary. Request không dựng card:
+    card chỉ được dựng bởi signal (sau commit) và lệnh rebuild_destination_cards/seed/import, nên điểm
+    đến chưa có card (hoặc đã bị xóa) đơn giản không có trong kết quả và caller tự đọc bảng gốc.
+    """
+    destination_ids = list(destination_ids)
+    cards = DestinationCard.objects.in_bulk(destination_ids)
+    missing = [pk for pk in destination_ids if pk not in cards]
+    if missing and router.db_for_read(DestinationCard) != PRIMARY:
+        cards.update(DestinationCard.objects.using(PRIMARY).in_bulk(missing))
+    return cards
+
+
+def get_summaries(destination_ids):
+    """{destination_id: dict gọn SUMMARY_FIELDS} cho API danh sách, chỉ đọc.
+
+    Chỉ lấy các khóa cần trong JSON của card (json_extract trong SQL), không đọc danh sách khách sạn/
+    nhà hàng/tham quan; điểm đến chưa có card thì đọc các cột tương ứng của Destination.
+    """
+    destination_ids = list(destination_ids)
+    rows = DestinationCard.objects.filter(destination_id__in=destination_ids).values_list(
+        "destination_id", *(f"data__{field}" for field in SUMMARY_FIELDS)
+    )
+    summaries = {row[0]: dict(zip(SUMMARY_FIELDS, row[1:])) for row in rows}
+    missing = [pk for pk in destination_ids if pk not in summaries]
+    if missing:
+        destinations = Destination.objects.filter(pk__in=missing).values_list(*DESTINATION_COLUMNS)
+        for pk, name, city, country, description, best_time, average_cost, rating in destinations:
+            summaries[pk] = {
+                "id": pk, "name": name, "city": city, "country": country, "description": _summary(description),
+                "rating": rating, "average_cost": float(average_cost), "best_time": best_time,
+            }
+    return summaries
@@ -0,0 +1,113 @@
+# Version của dữ liệu catalog (Destination/Hotel/Restaurant/Attraction) dùng chung giữa các process
+#
+# Version nằm trong CACHES['default']: chỉ dùng chung giữa các worker khi cache là Redis (REDIS_URL).
+# Với LocMemCache mặc định, mỗi process có version riêng và sửa catalog chỉ làm mới cache của process
+# đã nhận thay đổi; process khác phục vụ dữ liệu cũ tới hết timeout (chỉ phù hợp khi chạy một worker).
+import hashlib
+import threading
+import time
+from django.core.cache import cache
+from django.db import close_old_connections, connections
+from . import metrics
+from .config import CATALOG_CACHE_SETTINGS
+
+CATALOG_VERSION_KEY = "catalog_version"
+
+
+def get_catalog_version():
+    """Version hiện tại; tăng mỗi khi dữ liệu catalog thay đổi"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Tăng version (atomic với cache.incr)"""
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Key chưa tồn tại (cache bị xóa/restart)
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        return cache.incr(CATALOG_VERSION_KEY)
+
+
+# --- Cache dữ liệu suy ra từ catalog (context, kết quả tìm kiếm) --------------
+#
+# Khóa có version: sửa catalog -> bump version -> khóa mới, không cần xóa từng key.
+# Mỗi giá trị được lưu kèm bản "stale" (khóa không version) để khi khóa mới chưa có,
+# chỉ một request dựng lại (single-flight qua cache.add) còn các request khác dùng bản cũ.
+
+def _build_and_store(key, builder, timeout, version):
+    value = builder()
+    refresh_at = time.time() + timeout * CATALOG_CACHE_SETTINGS['REFRESH_RATIO']
+    cache.set(f"{key}:v{version}", (value, refresh_at), timeout)
+    # Bản stale sống lâu hơn để còn dùng được trong lúc dựng lại
+    cache.set(f"{key}:stale", value, timeout * 2)
+    return value
+
+
+def _refresh_in_background(key, builder, timeout, version, lock_key):
+    # Thread riêng ngoài vòng đời request: tự dọn kết nối DB như request_started/finished
+    close_old_connections()
+    try:
+        _build_and_store(key, builder, timeout, version)
+    except Exception as e:
+        print(f"Catalog cache refresh error: {str(e)}")
+    finally:
+        cache.delete(lock_key)
+        connections.close_all()
+
+
+def get_or_build(key, builder, timeout=3600):
+    """Giá trị cache của builder() cho version catalog hiện tại.
+
+    - Đúng version: trả về ngay; quá REFRESH_RATIO * timeout thì một thread nền làm mới trước khi hết hạn.
+    - Chưa có (version mới/hết hạn): một request giữ lock và dựng lại, các request khác nhận bản stale;
+      nếu chưa từng có bản stale thì chờ tối đa LOCK_WAIT giây rồi tự dựng.
+
+    builder có thể chạy trên thread nền: chỉ dùng tham số đã chuẩn hóa, không giữ HttpRequest.
+    """
+    version = get_catalog_version()
+    lock_key = f"{key}:lock"
+    cache_name = key.split(":", 1)[0]
+    lock_timeout = CATALOG_CACHE_SETTINGS['LOCK_TIMEOUT']
+
+    cached = cache.get(f"{key}:v{version}")
+    if cached is not None:
+        metrics.CACHE_REQUESTS.labels(cache_name, "hit").inc()
+        value, refresh_at = cached
+        if (CATALOG_CACHE_SETTINGS['REFRESH_AHEAD'] and time.time() >= refresh_at
+                and cache.add(lock_key, 1, lock_timeout)):
+            threading.Thread(
+                target=_refresh_in_background, args=(key, builder, timeout, version, lock_key), daemon=True
+            ).start()
+        return value
+
+    deadline = time.time() + CATALOG_CACHE_SETTINGS['LOCK_WAIT']
+    while not cache.add(lock_key, 1, lock_timeout):
+        stale = cache.get(f"{key}:stale")
+        if stale is not None:
+            metrics.CACHE_REQUESTS.labels(cache_name, "stale").inc()
+            return stale
+        if time.time() >= deadline:
+            metrics.CACHE_REQUESTS.labels(cache_name, "miss").inc()
+            return builder()
+        time.sleep(0.05)
+        cached = cache.get(f"{key}:v{version}")
+        if cached is not None:
+            metrics.CACHE_REQUESTS.labels(cache_name, "hit").inc()
+            return cached[0]
+
+    metrics.CACHE_REQUESTS.labels(cache_name, "miss").inc()
+    try:
+        return _build_and_store(key, builder, timeout, version)
+    finally:
+        cache.delete(lock_key)
+
+
+def hashed_key(prefix, *parts):
+    """Khóa cache ngắn, an toàn cho memcached/redis từ tham số tùy ý (vd. câu truy vấn)"""
+    digest = hashlib.md5("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return f"{prefix}:{digest}"
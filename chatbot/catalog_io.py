@@ -0,0 +1,299 @@
+# Import/export catalog theo luồng (CSV/JSONL): bộ nhớ cố định, ghi theo lô, upsert theo khóa tự nhiên
+import contextlib
+import csv
+import gzip
+import json
+import sys
+import time
+from decimal import Decimal
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from . import facets
+from .models import Destination, Hotel, Restaurant, Attraction
+
+MODELS = {
+    "destination": Destination,
+    "hotel": Hotel,
+    "restaurant": Restaurant,
+    "attraction": Attraction,
+}
+
+# Khóa tự nhiên dùng để upsert (không có id của đối tác trong dữ liệu)
+NATURAL_KEYS = {
+    Destination: ("name", "city", "country"),
+    Hotel: ("destination", "name"),
+    Restaurant: ("destination", "name"),
+    Attraction: ("destination", "name"),
+}
+
+# Cột tham chiếu điểm đến khi import/export các model con
+DESTINATION_COLUMNS = ("destination_id", "destination_name", "destination_city", "destination_country")
+
+
+class RowError(Exception):
+    pass
+
+
+def data_fields(model):
+    """Các field nhập được: bỏ khóa chính và các field tự sinh (created_at/updated_at)"""
+    return [f for f in model._meta.concrete_fields if not f.primary_key and f.editable]
+
+
+# --- Đọc/ghi file ---------------------------------------------------------------
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith(".gz") else path
+    return "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def open_text(path, mode="r"):
+    """Mở file text (hỗ trợ .gz và "-" cho stdin/stdout)"""
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if "r" in mode else sys.stdout)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def read_rows(stream, fmt):
+    """Yield (số dòng, dict) từng dòng một"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_num, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError as e:
+                    yield line_num, RowError(f"JSON không hợp lệ: {e}")
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Không serialize được {type(value).__name__}")
+
+
+class RowWriter:
+    def __init__(self, stream, fmt, columns):
+        self.stream = stream
+        self.fmt = fmt
+        self.columns = columns
+        if fmt == "csv":
+            self._csv = csv.writer(stream)
+            self._csv.writerow(columns)
+
+    def write(self, values):
+        if self.fmt == "csv":
+            self._csv.writerow(values)
+        else:
+            self.stream.write(json.dumps(dict(zip(self.columns, values)), ensure_ascii=False,
+                                         default=_json_default) + "\n")
+
+
+# --- Tra cứu điểm đến trong bộ nhớ ---------------------------------------------
+
+class DestinationLookup:
+    """Ánh xạ (tên, thành phố[, quốc gia]) -> id, nạp một lần cho cả file"""
+
+    def __init__(self):
+        self.ids = set()
+        self.by_full_key = {}
+        self.by_name_city = {}
+        for pk, name, city, country in Destination.objects.values_list("pk", "name", "city", "country").iterator():
+            self.add(pk, name, city, country)
+
+    def add(self, pk, name, city, country):
+        self.ids.add(pk)
+        self.by_full_key[(name.casefold(), city.casefold(), country.casefold())] = pk
+        key = (name.casefold(), city.casefold())
+        # Trùng tên + thành phố ở nhiều quốc gia: bắt buộc phải có cột quốc gia
+        self.by_name_city[key] = None if key in self.by_name_city else pk
+
+    def resolve(self, row):
+        """Ưu tiên khóa tự nhiên (file export dùng được giữa các DB), không có thì dùng destination_id"""
+        name = (row.get("destination_name") or "").strip().casefold()
+        city = (row.get("destination_city") or "").strip().casefold()
+        country = (row.get("destination_country") or "").strip().casefold()
+        if name and city:
+            pk = self.by_full_key.get((name, city, country)) if country else self.by_name_city.get((name, city))
+            if pk is None:
+                raise RowError(f"Không tìm thấy (hoặc không xác định duy nhất) điểm đến {name}/{city}/{country}")
+            return pk
+        raw_id = row.get("destination_id")
+        if raw_id is None or not str(raw_id).strip():
+            raise RowError("Thiếu destination_name + destination_city hoặc destination_id")
+        try:
+            pk = int(raw_id)
+        except (TypeError, ValueError):
+            raise RowError(f"destination_id không hợp lệ: {raw_id}")
+        if pk not in self.ids:
+            raise RowError(f"Không có điểm đến id={pk}")
+        return pk
+
+
+# --- Import -------------------------------------------------------------------
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.invalid = 0
+        self.start = time.time()
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.start
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.rows} dòng ({self.created} thêm, {self.updated} cập nhật, {self.invalid} lỗi) "
+                f"- {self.rate:.0f} dòng/s")
+
+
+class CatalogImporter:
+    """Đọc từng dòng, validate bằng validators của model, ghi theo lô trong transaction"""
+
+    def __init__(self, model, upsert=True, batch_size=2000, dry_run=False):
+        self.model = model
+        self.upsert = upsert
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.fields = {f.name: f for f in data_fields(model)}
+        self.natural_key = NATURAL_KEYS[model]
+        self.lookup = DestinationLookup() if "destination" in self.fields else None
+        self.stats = ImportStats()
+        self._batch = {}  # khóa tự nhiên -> instance (trùng trong lô: dòng sau thắng)
+        self._columns = set()
+
+    def build(self, row):
+        """Tạo instance (chưa lưu) từ một dòng; raise RowError/ValidationError nếu không hợp lệ"""
+        if isinstance(row, RowError):
+            raise row
+        values = {}
+        for name, field in self.fields.items():
+            if name == "destination":
+                values["destination_id"] = self.lookup.resolve(row)
+            elif name in row and row[name] is not None:
+                value = row[name]
+                if isinstance(value, str):
+                    value = value.strip()
+                    if value == "" and field.has_default():
+                        continue
+                values[name] = value
+        obj = self.model(**values)
+        obj.clean_fields(exclude=["destination"])
+        obj.clean()
+        if self.model is Hotel:
+            # bulk_create/bulk_update không qua pre_save: tự tính bitset tiện nghi
+            obj.amenity_bits = facets.amenity_bits(obj.amenities)
+        self._columns.update(k for k in row if k in self.fields)
+        return obj
+
+    def key_of(self, obj):
+        return tuple(
+            obj.destination_id if name == "destination" else getattr(obj, name)
+            for name in self.natural_key
+        )
+
+    def add(self, obj):
+        self._batch[self.key_of(obj)] = obj
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, {}
+        creates, updates = list(batch.values()), []
+        if self.upsert:
+            existing = self._existing_ids(batch)
+            creates = []
+            for key, obj in batch.items():
+                if key in existing:
+                    obj.pk = existing[key]
+                    updates.append(obj)
+                else:
+                    creates.append(obj)
+        if not self.dry_run:
+            with transaction.atomic():
+                if creates:
+                    self.model.objects.bulk_create(creates, batch_size=self.batch_size)
+                if updates:
+                    now = timezone.now()
+                    for obj in updates:
+                        obj.updated_at = now
+                    # Chỉ cập nhật các cột có trong file
+                    update_fields = [f for f in self.fields if f not in self.natural_key and f in self._columns]
+                    if "amenities" in update_fields:
+                        update_fields.append("amenity_bits")
+                    self.model.objects.bulk_update(updates, update_fields + ["updated_at"], batch_size=self.batch_size)
+        self.stats.created += len(creates)
+        self.stats.updated += len(updates)
+
+    def _existing_ids(self, batch):
+        """Một truy vấn cho cả lô: khóa tự nhiên -> id các bản ghi đã có"""
+        names = {obj.name for obj in batch.values()}
+        queryset = self.model.objects.filter(name__in=names)
+        if "destination" in self.natural_key:
+            queryset = queryset.filter(destination_id__in={obj.destination_id for obj in batch.values()})
+        columns = ["pk"] + [f"{name}_id" if name == "destination" else name for name in self.natural_key]
+        existing = {}
+        for pk, *key in queryset.values_list(*columns).iterator():
+            existing[tuple(key)] = pk
+        return existing
+
+    def run(self, rows, on_error=None, on_progress=None, progress_every=10000, max_errors=None):
+        for line_num, row in rows:
+            self.stats.rows += 1
+            try:
+                self.add(self.build(row))
+            except (RowError, ValidationError, TypeError, ValueError) as e:
+                self.stats.invalid += 1
+                if on_error:
+                    on_error(line_num, row, _error_messages(e))
+                if max_errors is not None and self.stats.invalid > max_errors:
+                    raise RowError(f"Quá {max_errors} dòng lỗi, dừng import tại dòng {line_num}")
+            if on_progress and self.stats.rows % progress_every == 0:
+                on_progress(self.stats)
+        self.flush()
+        return self.stats
+
+
+def _error_messages(error):
+    if isinstance(error, ValidationError):
+        if hasattr(error, "error_dict"):
+            return {field: [str(m) for m in messages] for field, messages in error.message_dict.items()}
+        return {"__all__": error.messages}
+    return {"__all__": [str(error)]}
+
+
+# --- Export -------------------------------------------------------------------
+
+def export_columns(model):
+    columns = []
+    for field in data_fields(model):
+        if field.name == "destination":
+            columns += list(DESTINATION_COLUMNS)
+        else:
+            columns.append(field.name)
+    return columns
+
+
+def export_rows(model, chunk_size=2000):
+    """Yield từng dòng (tuple theo export_columns) bằng server-side iterator"""
+    lookups = []
+    for column in export_columns(model):
+        if column.startswith("destination_") and column != "destination_id":
+            lookups.append("destination__" + column[len("destination_"):])
+        else:
+            lookups.append(column)
+    yield from model.objects.order_by("pk").values_list(*lookups).iterator(chunk_size=chunk_size)
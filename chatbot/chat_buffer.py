@@ -0,0 +1,346 @@
+# Write-behind buffer cho ChatHistory: gom bản ghi và ghi bằng bulk_create theo lô
+import atexit
+import glob
+import json
+import os
+import threading
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import metrics
+from .config import CHAT_BUFFER_SETTINGS
+from .models import ChatHistory
+
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+# Lỗi của riêng một bản ghi (vd. user đã bị xóa khi lượt chat còn chờ): ghi lại từng bản ghi để
+# tách bản ghi hỏng ra; lỗi khác (mất kết nối, DB bị khóa...) thì giữ cả lô để thử lại
+ROW_ERRORS = (IntegrityError, DataError)
+
+SPOOL_FIELDS = (
+    "session_id", "user_id", "user_message", "bot_response",
+    "response_time", "time_to_first_token", "is_cached", "intent",
+)
+
+
+class ChatHistoryBuffer:
+    """Gom các lượt chat trong bộ nhớ và flush theo kích thước lô hoặc theo chu kỳ.
+
+    Khi có spool_dir (chế độ crash-safe), mỗi bản ghi được ghi thêm vào file spool
+    của process trước khi trả về; spool của process đã chết được replay khi khởi động.
+    Đảm bảo at-least-once: crash ngay sau khi commit có thể ghi trùng khi replay.
+    Bản ghi lỗi max_attempts lần liên tiếp bị bỏ khỏi buffer: chuyển vào spool dead-letter
+    (DEAD_LETTER_FILE trong spool_dir) nếu có, ngược lại chỉ in ra log.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_pending=10000,
+                 spool_dir="", spool_fsync=False, max_attempts=3):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spool_dir = spool_dir
+        self.spool_fsync = spool_fsync
+        self._pending = []
+        self._lock = threading.Lock()        # bảo vệ _pending và file spool
+        self._flush_lock = threading.Lock()  # chỉ một flush tại một thời điểm
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self._spool_file = None
+
+    # --- Ghi ---------------------------------------------------------------
+
+    def record(self, **fields):
+        """Thêm một lượt chat vào buffer, trả về instance (chưa lưu)"""
+        fields.setdefault("timestamp", timezone.now())
+        chat = ChatHistory(**fields)
+        with self._lock:
+            self._pending.append(chat)
+            if self.spool_dir:
+                self._spool_write({"record": self._serialize(chat)})
+            pending_count = len(self._pending)
+        self._ensure_thread()
+
+        if pending_count >= self.max_pending:
+            # Backpressure: DB không theo kịp thì flush ngay trong request
+            self.flush()
+        elif pending_count >= self.batch_size:
+            self._wakeup.set()
+        return chat
+
+    def discard_session(self, session_id):
+        """Bỏ các bản ghi chưa flush của một phiên (khi xóa lịch sử chat)"""
+        # Chờ flush đang chạy xong để bản ghi của phiên không bị ghi sau khi đã xóa
+        with self._flush_lock, self._lock:
+            self._pending = [c for c in self._pending if c.session_id != session_id]
+            if self.spool_dir:
+                self._spool_write({"discard_session": session_id})
+
+    def flush(self):
+        """Ghi toàn bộ bản ghi đang chờ xuống DB; trả về số bản ghi đã ghi"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)
+            if not batch:
+                return 0
+            written, rejected, db_error = self._write(batch)
+            if db_error is not None:
+                # Giữ lại để thử lại ở lần flush sau
+                print(f"Chat buffer flush error: {str(db_error)}")
+
+            dead = []
+            for chat, row_error in rejected:
+                chat._flush_attempts = getattr(chat, "_flush_attempts", 0) + 1
+                if chat._flush_attempts >= self.max_attempts:
+                    dead.append((chat, row_error))
+            if not written and not dead:
+                return 0
+            # Dead-letter trước khi rewrite spool: crash ở giữa thì bản ghi vẫn còn ở một trong hai nơi
+            self._dead_letter(dead)
+            done = set(map(id, written)) | {id(chat) for chat, _ in dead}
+            with self._lock:
+                self._pending = [c for c in self._pending if id(c) not in done]
+                if self.spool_dir:
+                    self._spool_rewrite()
+            return len(written)
+
+    def _write(self, chats):
+        """Ghi một lô; trả về (đã ghi, [(bản ghi, lỗi riêng)], lỗi DB chung hoặc None).
+
+        bulk_create cả lô trước; lô lỗi vì một bản ghi thì ghi lại từng bản ghi.
+        """
+        try:
+            with transaction.atomic():
+                ChatHistory.objects.bulk_create(chats, batch_size=self.batch_size)
+            return chats, [], None
+        except ROW_ERRORS:
+            pass
+        except Exception as db_error:
+            _reset_pks(chats)
+            return [], [], db_error
+        _reset_pks(chats)
+
+        written, rejected = [], []
+        for chat in chats:
+            try:
+                with transaction.atomic():
+                    ChatHistory.objects.bulk_create([chat])
+            except ROW_ERRORS as row_error:
+                _reset_pks([chat])
+                rejected.append((chat, row_error))
+            except Exception as db_error:
+                _reset_pks([chat])
+                return written, rejected, db_error
+            else:
+                written.append(chat)
+        return written, rejected, None
+
+    def _dead_letter(self, rejected):
+        """Bỏ các bản ghi không thể ghi khỏi buffer; giữ lại trong spool dead-letter nếu có"""
+        if not rejected:
+            return
+        for chat, row_error in rejected:
+            print(f"Chat buffer dropped record (session {chat.session_id}): {str(row_error)}")
+        if not self.spool_dir:
+            metrics.CHAT_BUFFER_REJECTED.labels("dropped").inc(len(rejected))
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(os.path.join(self.spool_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as dead_letter:
+            for chat, row_error in rejected:
+                entry = {"record": self._serialize(chat), "error": str(row_error)}
+                dead_letter.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            dead_letter.flush()
+            if self.spool_fsync:
+                os.fsync(dead_letter.fileno())
+        metrics.CHAT_BUFFER_REJECTED.labels("dead_letter").inc(len(rejected))
+
+    # --- Đọc ---------------------------------------------------------------
+
+    def pending(self, session_id=None, user_id=None):
+        """Các bản ghi chưa flush của process này (cũ -> mới), lọc theo phiên hoặc user.
+
+        Không đọc buffer/spool của worker khác: lượt chat vừa gửi qua worker khác chỉ hiện ra
+        sau khi worker đó flush (tối đa flush_interval giây).
+        """
+        with self._lock:
+            chats = list(self._pending)
+        if session_id is not None:
+            chats = [c for c in chats if c.session_id == session_id]
+        if user_id is not None:
+            chats = [c for c in chats if c.user_id == user_id]
+        return chats
+
+    # --- Thread nền --------------------------------------------------------
+
+    def start(self, **kwargs):
+        """Khởi động thread flush (và replay spool); gọi nhiều lần không sao"""
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if self._thread is not None or self._stopped:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-history-buffer", daemon=True)
+                self._thread.start()
+                atexit.register(self.shutdown)
+
+    def _run(self):
+        if self.spool_dir:
+            self.replay_spools()
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+    def shutdown(self):
+        """Flush lần cuối khi process tắt"""
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+        close_old_connections()
+
+    # --- Spool -------------------------------------------------------------
+
+    @staticmethod
+    def _serialize(chat):
+        data = {field: getattr(chat, field) for field in SPOOL_FIELDS}
+        data["timestamp"] = chat.timestamp.isoformat()
+        return data
+
+    def _spool_path(self, pid=None):
+        return os.path.join(self.spool_dir, f"chat-{pid or os.getpid()}.jsonl")
+
+    def _spool_write(self, entry):
+        if self._spool_file is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._spool_file = open(self._spool_path(), "a", encoding="utf-8")
+        self._spool_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._spool_file.flush()
+        if self.spool_fsync:
+            os.fsync(self._spool_file.fileno())
+
+    def _spool_rewrite(self):
+        # Sau khi flush, spool chỉ còn các bản ghi chưa ghi xuống DB
+        path = self._spool_path()
+        if self._spool_file is not None:
+            self._spool_file.close()
+        self._write_spool(path, self._pending)
+        self._spool_file = open(path, "a", encoding="utf-8")
+
+    def _write_spool(self, path, chats):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as tmp:
+            for chat in chats:
+                tmp.write(json.dumps({"record": self._serialize(chat)}, ensure_ascii=False) + "\n")
+            tmp.flush()
+            if self.spool_fsync:
+                os.fsync(tmp.fileno())
+        os.replace(tmp_path, path)
+
+    def replay_spools(self):
+        """Ghi lại các spool của process đã chết (vd. sau crash); trả về số bản ghi"""
+        replayed = 0
+        for path in glob.glob(os.path.join(self.spool_dir, "chat-*.jsonl")):
+            pid = os.path.basename(path)[len("chat-"):-len(".jsonl")]
+            if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+                continue
+            claimed = f"{path}.replay-{os.getpid()}"
+            try:
+                # rename là atomic: chỉ một process nhận được spool này
+                os.rename(path, claimed)
+            except OSError:
+                continue
+            chats = _read_spool(claimed)
+            written, rejected, db_error = self._write(chats)
+            # Bản ghi replay đã lỗi ít nhất một lần ở process cũ: lỗi riêng thì bỏ luôn
+            self._dead_letter(rejected)
+            replayed += len(written)
+            if db_error is not None:
+                print(f"Chat spool replay error: {str(db_error)}")
+                # Trả lại phần chưa ghi cho lần khởi động sau
+                done = set(map(id, written)) | {id(chat) for chat, _ in rejected}
+                self._write_spool(claimed, [c for c in chats if id(c) not in done])
+                os.rename(claimed, path)
+                continue
+            os.remove(claimed)
+        return replayed
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _reset_pks(chats):
+    # bulk_create trên SQLite gán pk trước khi commit; transaction rollback thì bỏ pk để ghi lại được
+    for chat in chats:
+        chat.pk = None
+
+
+def _read_spool(path):
+    records = []
+    with open(path, encoding="utf-8") as spool:
+        for line in spool:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # dòng cuối có thể bị ghi dở khi crash
+            if "discard_session" in entry:
+                records = [r for r in records if r["session_id"] != entry["discard_session"]]
+            elif "record" in entry:
+                records.append(entry["record"])
+    chats = []
+    for data in records:
+        data["timestamp"] = parse_datetime(data["timestamp"])
+        chats.append(ChatHistory(**data))
+    return chats
+
+
+chat_buffer = ChatHistoryBuffer(
+    batch_size=CHAT_BUFFER_SETTINGS['BATCH_SIZE'],
+    flush_interval=CHAT_BUFFER_SETTINGS['FLUSH_INTERVAL'],
+    max_pending=CHAT_BUFFER_SETTINGS['MAX_PENDING'],
+    spool_dir=CHAT_BUFFER_SETTINGS['SPOOL_DIR'],
+    spool_fsync=CHAT_BUFFER_SETTINGS['SPOOL_FSYNC'],
+    max_attempts=CHAT_BUFFER_SETTINGS['MAX_ATTEMPTS'],
+)
+metrics.REGISTRY.gauge_callback(
+    "chatbot_chat_buffer_pending", "Số lượt chat đang chờ ghi xuống DB", lambda: len(chat_buffer.pending())
+)
+
+
+def save_chat_record(**fields):
+    """Lưu một lượt chat: qua write-behind buffer nếu bật, ngược lại ghi thẳng DB"""
+    if CHAT_BUFFER_SETTINGS['ENABLED']:
+        return chat_buffer.record(**fields)
+    return ChatHistory.objects.create(**fields)
+
+
+def pending_chats(session_id=None, user_id=None):
+    """Lượt chat chưa ghi xuống DB của process hiện tại (xem ChatHistoryBuffer.pending)"""
+    if not CHAT_BUFFER_SETTINGS['ENABLED']:
+        return []
+    return chat_buffer.pending(session_id=session_id, user_id=user_id)
+
+
+def unwritten(pending, chats):
+    """Bỏ khỏi pending các bản ghi đã có trong chats đọc từ DB.
+
+    Lấy pending trước rồi mới đọc DB: bản ghi được flush giữa hai lần đọc có pk và nằm trong kết quả DB,
+    không bị mất khỏi cả hai.
+    """
+    ids = {chat.pk for chat in chats}
+    return [chat for chat in pending if chat.pk is None or chat.pk not in ids]
+
+
+def discard_pending_session(session_id):
+    if CHAT_BUFFER_SETTINGS['ENABLED']:
+        chat_buffer.discard_session(session_id)
@@ -0,0 +1,144 @@
+# Phiên chat không trạng thái: token ký trong cookie/header thay cho request.session["chat_session_id"]
+#
+# Token (django.core.signing, khóa SECRET_KEY) chứa session id, user id và thời điểm cấp. Token của
+# khách chỉ cần kiểm tra chữ ký, không đọc/ghi bảng django_session mỗi tin nhắn. Token có user id
+# chỉ hợp lệ khi request đăng nhập đúng user đó và khớp auth hash (theo mật khẩu) lúc cấp: đăng xuất
+# hoặc đổi mật khẩu làm token mất hiệu lực. Hash không dùng session key vì login() đổi/flush session
+# (session_key còn None lúc user_logged_in chạy) nên token cấp khi đăng nhập sẽ không bao giờ khớp.
+# User đã đăng nhập còn có session id trong cache theo user: mất token (thiết bị khác, hết hạn)
+# vẫn tiếp tục đúng phiên chat. Đăng nhập gắn user vào token hiện tại, đăng xuất xóa token.
+import hmac
+import time
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+from .config import CHAT_SESSION_SETTINGS
+
+_SALT = "chatbot.chat_session"
+LEGACY_SESSION_KEY = "chat_session_id"
+
+
+class ChatSession:
+    """Phiên chat đã xác thực chữ ký; token khác None nghĩa là cần gửi token mới cho client"""
+
+    def __init__(self, session_id, user_id=None, issued_at=None, auth_hash=None):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.issued_at = issued_at or int(time.time())
+        self.auth_hash = auth_hash
+        self.token = None
+
+    def issue(self):
+        self.issued_at = int(time.time())
+        self.token = signing.dumps(
+            {"sid": self.session_id, "uid": self.user_id, "iat": self.issued_at, "ah": self.auth_hash},
+            salt=_SALT, compress=True,
+        )
+        return self
+
+
+def _user_key(user_id):
+    return f"chat_session:user:{user_id}"
+
+
+def auth_hash(user):
+    """Hash gắn token với user đăng nhập: đổi khi đổi mật khẩu"""
+    return salted_hmac(_SALT, f"{user.pk}:{user.get_session_auth_hash()}").hexdigest()[:32]
+
+
+def _authenticated_user(request):
+    user = getattr(request, "user", None)
+    return user if user is not None and user.is_authenticated else None
+
+
+def verify(token):
+    """ChatSession từ token, None nếu token sai chữ ký/hết hạn (chưa đối chiếu user của request)"""
+    try:
+        data = signing.loads(token, salt=_SALT, max_age=CHAT_SESSION_SETTINGS['MAX_AGE'])
+        return ChatSession(str(data["sid"]), data.get("uid"), data["iat"], data.get("ah"))
+    except (signing.BadSignature, KeyError, TypeError):
+        return None
+
+
+def _belongs_to(session, request):
+    """Token có user id chỉ dùng được bởi đúng user đó, trong phiên đăng nhập đã cấp token"""
+    if session.user_id is None:
+        return True
+    user = _authenticated_user(request)
+    return (
+        user is not None and user.pk == session.user_id and session.auth_hash is not None
+        and hmac.compare_digest(session.auth_hash, auth_hash(user))
+    )
+
+
+def peek(request):
+    """Phiên chat trong token của request (không cấp mới).
+
+    Token của khách không chạm DB/cache; token có user id đọc session auth của request để đối chiếu.
+    """
+    if not hasattr(request, "_chat_session"):
+        token = request.headers.get(CHAT_SESSION_SETTINGS['HEADER']) or request.COOKIES.get(
+            CHAT_SESSION_SETTINGS['COOKIE_NAME'])
+        session = verify(token) if token else None
+        # Token của user khác, của phiên đã đăng xuất hoặc trước khi đổi mật khẩu: bỏ cả token
+        # (session id trong đó cũng không được dùng để đọc lịch sử chat)
+        request._chat_session = session if session is not None and _belongs_to(session, request) else None
+    return request._chat_session
+
+
+def get_session(request):
+    """Phiên chat của request, cấp token mới nếu chưa có hoặc hết hạn.
+
+    Chỉ khi không có token hợp lệ mới xét user đăng nhập (đọc session auth một lần) và
+    chat_session_id cũ trong request.session để không mất lịch sử của phiên đang dùng.
+    """
+    session = peek(request)
+    if session is not None:
+        if time.time() - session.issued_at > CHAT_SESSION_SETTINGS['REFRESH_AFTER']:
+            session.issue()
+        return session
+
+    user = _authenticated_user(request)
+    user_id = user.pk if user is not None else None
+    session_id = cache.get(_user_key(user_id)) if user_id is not None else None
+    if not session_id and settings.SESSION_COOKIE_NAME in request.COOKIES:
+        session_id = request.session.get(LEGACY_SESSION_KEY)
+    session = ChatSession(
+        session_id or str(uuid.uuid4()), user_id, auth_hash=auth_hash(user) if user is not None else None
+    ).issue()
+    if user_id is not None:
+        cache.set(_user_key(user_id), session.session_id, CHAT_SESSION_SETTINGS['USER_TTL'])
+    request._chat_session = session
+    return session
+
+
+def get_session_id(request):
+    """Session id để đọc lịch sử/xóa phiên (None nếu request chưa có phiên chat)"""
+    session = peek(request)
+    if session is not None:
+        return session.session_id
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return request.session.get(LEGACY_SESSION_KEY)
+    return None
+
+
+def bind_user(request, user):
+    """Sau đăng nhập: giữ phiên chat hiện tại (nếu có) và gắn user vào token"""
+    session = peek(request)
+    if session is not None and session.user_id in (None, user.pk):
+        session_id = session.session_id
+    else:
+        session_id = cache.get(_user_key(user.pk))
+    request._chat_session = ChatSession(
+        session_id or str(uuid.uuid4()), user.pk, auth_hash=auth_hash(user)
+    ).issue()
+    cache.set(_user_key(user.pk), request._chat_session.session_id, CHAT_SESSION_SETTINGS['USER_TTL'])
+
+
+def clear(request):
+    """Sau đăng xuất: bỏ token, lần chat sau bắt đầu phiên mới"""
+    request._chat_session = None
+    request._chat_session_cleared = True
+
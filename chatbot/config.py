@@ -42,23 +42,46 @@ def validate_environment():
     print("✅ All required environment variables are set.")
     return True
 
+def _parse_database(value):
+    """URL (postgres://..., sqlite:///...) qua dj_database_url, hoặc đường dẫn file SQLite"""
+    if "://" in value:
+        import dj_database_url
+        config = dj_database_url.parse(value)
+    else:
+        config = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': value}
+    # Giữ connection giữa các request thay vì mở lại mỗi request
+    config['CONN_MAX_AGE'] = DATABASE_SETTINGS['CONN_MAX_AGE']
+    config['CONN_HEALTH_CHECKS'] = True
+    return config
+
 def get_database_config():
     """Get database configuration"""
     database_url = os.getenv('DATABASE_URL')
     
     if database_url:
         # Parse database URL (for production)
-        import dj_database_url
-        return dj_database_url.parse(database_url)
+        return _parse_database(database_url)
     else:
         # Default SQLite configuration
-        return {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db.sqlite3'),
-        }
+        return _parse_database(
+            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'db.sqlite3')
+        )
+
+def get_databases():
+    """DATABASES: primary 'default' (mọi lệnh ghi) + các replica chỉ đọc 'replica_<n>'"""
+    databases = {'default': get_database_config()}
+    for i, value in enumerate(DATABASE_SETTINGS['REPLICA_URLS'], 1):
+        replica = _parse_database(value)
+        replica['TEST'] = {'MIRROR': 'default'}  # khi chạy test, replica chính là database test của default
+        databases[f'replica_{i}'] = replica
+    return databases
 
 def get_cache_config():
-    """Get cache configuration"""
+    """Get cache configuration.
+
+    Không có REDIS_URL: LocMemCache riêng từng process, chỉ phù hợp chạy một worker (version catalog,
+    rate limit... không dùng chung: sửa catalog chỉ làm mới cache của process đã xử lý request đó).
+    """
     redis_url = os.getenv('REDIS_URL')
     
     if redis_url:
@@ -88,17 +111,233 @@ PERFORMANCE_SETTINGS = {
     'MAX_CHAT_HISTORY': int(os.getenv('MAX_CHAT_HISTORY', '100')),
 }
 
+# Database: replica chỉ đọc cho các endpoint tra cứu (db_router.py)
+DATABASE_SETTINGS = {
+    # URL hoặc đường dẫn file SQLite, cách nhau bởi dấu phẩy
+    'REPLICA_URLS': [u.strip() for u in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if u.strip()],
+    'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),  # giây, 0 = đóng sau mỗi request
+    # Sau khi ghi, phiên/user đó đọc từ primary trong khoảng này (độ trễ replica + flush chat buffer)
+    'STICKY_SECONDS': int(os.getenv('DB_STICKY_SECONDS', '5')),
+}
+
 # AI settings
 AI_SETTINGS = {
     'OPENAI_MODEL': os.getenv('OPENAI_MODEL', 'gpt-4o'),
     'MAX_TOKENS': int(os.getenv('MAX_TOKENS', '800')),
     'TEMPERATURE': float(os.getenv('TEMPERATURE', '0.7')),
     'TIMEOUT': int(os.getenv('AI_TIMEOUT', '30')),
+    'BASE_URL': os.getenv('OPENAI_BASE_URL', ''),  # OpenAI-compatible endpoint (optional)
+    'MAX_CONCURRENT_REQUESTS': int(os.getenv('AI_MAX_CONCURRENT_REQUESTS', '200')),  # in-flight LLM calls per process
+    'QUEUE_TIMEOUT': float(os.getenv('AI_QUEUE_TIMEOUT', '10')),  # seconds to wait for a free slot
+    'MAX_CONNECTIONS': int(os.getenv('AI_MAX_CONNECTIONS', '100')),  # keep-alive pool size
+    'KEEPALIVE_EXPIRY': float(os.getenv('AI_KEEPALIVE_EXPIRY', '30')),
+    'ASYNC_CHAT': os.getenv('ASYNC_CHAT', 'False') == 'True',  # serve /chat/ with the async view (ASGI)
+    'FALLBACK_MODEL': os.getenv('OPENAI_FALLBACK_MODEL', 'gpt-4o-mini'),  # cheaper/faster model; '' = no fallback
+}
+
+# Circuit breaker, hedged request và thời gian tối đa cho lời gọi model
+RESILIENCE_SETTINGS = {
+    'DEADLINE': float(os.getenv('AI_DEADLINE', str(AI_SETTINGS['TIMEOUT']))),  # tổng thời gian kể cả model dự phòng
+    'ATTEMPT_TIMEOUT': float(os.getenv('AI_ATTEMPT_TIMEOUT', '12')),  # mỗi lần gọi một model
+    # Breaker: mở mạch khi trong WINDOW giây có >= MIN_CALLS lời gọi và tỉ lệ lỗi hoặc tỉ lệ chậm vượt ngưỡng
+    'WINDOW': 30,
+    'MIN_CALLS': int(os.getenv('AI_BREAKER_MIN_CALLS', '10')),
+    'FAILURE_RATIO': float(os.getenv('AI_BREAKER_FAILURE_RATIO', '0.5')),
+    'SLOW_CALL_SECONDS': float(os.getenv('AI_SLOW_CALL_SECONDS', '8')),
+    'SLOW_CALL_RATIO': float(os.getenv('AI_BREAKER_SLOW_RATIO', '0.8')),
+    'OPEN_SECONDS': float(os.getenv('AI_BREAKER_OPEN_SECONDS', '15')),
+    'HALF_OPEN_CALLS': 2,   # số lời gọi thử khi hết thời gian mở mạch
+    # Hedging: gửi bản sao khi lời gọi chậm hơn p95 gần đây, tối đa HEDGE_BUDGET bản sao mỗi lời gọi
+    'HEDGE_ENABLED': os.getenv('AI_HEDGE_ENABLED', 'True') == 'True',
+    'HEDGE_PERCENTILE': 0.95,
+    'HEDGE_MIN_DELAY': float(os.getenv('AI_HEDGE_MIN_DELAY', '1.0')),
+    'HEDGE_MIN_SAMPLES': 20,
+    'HEDGE_BUDGET': float(os.getenv('AI_HEDGE_BUDGET', '0.1')),
+    'LATENCY_SAMPLES': 200,
+}
+
+# Gộp các lời gọi model trùng prompt đang chạy cùng lúc (single-flight)
+COALESCE_SETTINGS = {
+    'ENABLED': os.getenv('LLM_COALESCE_ENABLED', 'True') == 'True',
+    # Gộp cả giữa các process qua cache backend (cần cache dùng chung như Redis)
+    'CROSS_PROCESS': os.getenv('LLM_COALESCE_CROSS_PROCESS', 'True' if os.getenv('REDIS_URL') else 'False') == 'True',
+    # Thời gian tối đa chờ leader; quá hạn thì tự gọi model
+    'WAIT_TIMEOUT': float(os.getenv('LLM_COALESCE_WAIT', str(AI_SETTINGS['TIMEOUT'] + AI_SETTINGS['QUEUE_TIMEOUT']))),
+    'RESULT_TTL': 30,       # giây giữ kết quả trong cache cho các process đang chờ
+    'POLL_INTERVAL': 0.05,
+}
+
+# Rate limiting (requests, window seconds) theo scope
+RATE_LIMIT_SETTINGS = {
+    'ALGORITHM': os.getenv('RATE_LIMIT_ALGORITHM', 'sliding_window'),  # sliding_window | token_bucket
+    'RATES': {
+        'chat': (PERFORMANCE_SETTINGS['CHAT_RATE_LIMIT'], 60),
+        'search': (int(os.getenv('SEARCH_RATE_LIMIT', '60')), 60),
+        'autocomplete': (int(os.getenv('AUTOCOMPLETE_RATE_LIMIT', '600')), 60),  # mỗi phím một request
+    },
+    # Proxy/load balancer được phép đặt X-Forwarded-For (IP hoặc CIDR, cách nhau bởi dấu phẩy)
+    'TRUSTED_PROXIES': [p.strip() for p in os.getenv('TRUSTED_PROXIES', '').split(',') if p.strip()],
+}
+
+# Phiên chat bằng token ký (cookie hoặc header), không dùng bảng django_session
+CHAT_SESSION_SETTINGS = {
+    'COOKIE_NAME': os.getenv('CHAT_SESSION_COOKIE', 'chat_session'),
+    'HEADER': 'X-Chat-Session',       # client không dùng cookie gửi/nhận token qua header này
+    'MAX_AGE': int(os.getenv('CHAT_SESSION_MAX_AGE', str(30 * 24 * 3600))),  # giây
+    'REFRESH_AFTER': 24 * 3600,       # token cũ hơn thì cấp lại (hết hạn trượt)
+    'USER_TTL': int(os.getenv('CHAT_SESSION_MAX_AGE', str(30 * 24 * 3600))),  # phiên của user trong cache
+}
+
+# Write-behind buffer cho ChatHistory
+# Buffer nằm trong từng process: lịch sử chat/bộ nhớ hội thoại chỉ thấy lượt chưa flush của chính
+# worker đó. Chạy nhiều worker thì lượt vừa gửi qua worker khác hiện ra sau tối đa FLUSH_INTERVAL giây;
+# cần read-your-writes tức thì thì chạy một worker hoặc tắt buffer (CHAT_BUFFER_ENABLED=False).
+CHAT_BUFFER_SETTINGS = {
+    'ENABLED': os.getenv('CHAT_BUFFER_ENABLED', 'True') == 'True',
+    'BATCH_SIZE': int(os.getenv('CHAT_BUFFER_BATCH_SIZE', '100')),
+    'FLUSH_INTERVAL': float(os.getenv('CHAT_BUFFER_FLUSH_INTERVAL', '1.0')),  # seconds
+    'MAX_PENDING': int(os.getenv('CHAT_BUFFER_MAX_PENDING', '10000')),
+    'SPOOL_DIR': os.getenv('CHAT_BUFFER_SPOOL_DIR', ''),  # crash-safe mode khi được đặt
+    'SPOOL_FSYNC': os.getenv('CHAT_BUFFER_SPOOL_FSYNC', 'False') == 'True',
+    'MAX_ATTEMPTS': int(os.getenv('CHAT_BUFFER_MAX_ATTEMPTS', '3')),  # số lần ghi lỗi trước khi bỏ bản ghi
+}
+
+# Giới hạn kích thước bảng ChatHistory: chuyển bản ghi cũ sang bảng archive theo từng lô nhỏ
+RETENTION_SETTINGS = {
+    'ENABLED': os.getenv('CHAT_RETENTION_ENABLED', 'True') == 'True',
+    'MAX_AGE_DAYS': int(os.getenv('CHAT_RETENTION_DAYS', '90')),  # 0 = không giới hạn theo tuổi
+    'MAX_PER_SESSION': PERFORMANCE_SETTINGS['MAX_CHAT_HISTORY'],
+    'MAX_PER_USER': int(os.getenv('MAX_CHAT_HISTORY_PER_USER', '1000')),
+    'ARCHIVE': os.getenv('CHAT_RETENTION_ARCHIVE', 'True') == 'True',  # False = xóa hẳn thay vì lưu trữ
+    'CHUNK_SIZE': int(os.getenv('CHAT_RETENTION_CHUNK_SIZE', '500')),  # mỗi transaction chỉ khóa ngần này dòng
+    'CHUNK_PAUSE': float(os.getenv('CHAT_RETENTION_CHUNK_PAUSE', '0.05')),  # nghỉ giữa các lô (giây)
+    'RUN_INTERVAL': int(os.getenv('CHAT_RETENTION_INTERVAL', '3600')),  # chạy nền trong web process; 0 = chỉ dùng lệnh
+    # Bảng archive cũng có hạn: bản ghi archive quá số ngày này được nén ra file .jsonl.gz rồi xóa
+    'ARCHIVE_MAX_AGE_DAYS': int(os.getenv('CHAT_ARCHIVE_DAYS', '0')),  # 0 = giữ mãi trong bảng archive
+    'ARCHIVE_DIR': os.getenv('CHAT_ARCHIVE_DIR', ''),
+}
+
+# Truy xuất context theo câu hỏi
+RETRIEVAL_SETTINGS = {
+    'ENABLED': os.getenv('RETRIEVAL_ENABLED', 'True') == 'True',
+    'TOP_K': int(os.getenv('RETRIEVAL_TOP_K', '8')),
+    'MAX_CONTEXT_CHARS': int(os.getenv('RETRIEVAL_MAX_CONTEXT_CHARS', '1500')),
+    'ENTITY_BOOST': 3.0,    # câu hỏi nhắc tới tên điểm đến/thành phố
+    'KIND_BOOST': 2.0,      # đúng loại thông tin (khách sạn, nhà hàng...)
+    'RATING_WEIGHT': 0.2,
+    'MAX_DF_RATIO': 0.2,    # bỏ qua từ xuất hiện trong >20% catalog
+    'MIN_RELATIVE_SCORE': 0.4,  # bỏ kết quả có điểm < 40% kết quả tốt nhất
+}
+
+# Định tuyến ý định: câu hỏi tra cứu/chào hỏi trả lời bằng mẫu câu + DB, không gọi model
+INTENT_SETTINGS = {
+    'ENABLED': os.getenv('INTENT_ROUTER_ENABLED', 'True') == 'True',
+    'MAX_WORDS': int(os.getenv('INTENT_MAX_WORDS', '15')),  # câu dài hơn coi là câu hỏi mở
+    'MAX_RESULTS': 5,
+}
+
+# Thẻ tri thức dựng sẵn theo điểm đến (cards.py)
+CARD_SETTINGS = {
+    'TOP_N': 5,             # số khách sạn/nhà hàng/điểm tham quan mỗi loại trong card
+    'TEXT_TOP_N': 3,        # số mục mỗi loại trong phần text đưa vào prompt
+    'MAX_IN_CONTEXT': 2,    # tối đa số card trong context khi câu hỏi nhắc tới điểm đến
+}
+
+# Gợi ý khi gõ (mảng tiền tố trong bộ nhớ, không truy vấn DB mỗi phím)
+AUTOCOMPLETE_SETTINGS = {
+    'ENABLED': os.getenv('AUTOCOMPLETE_ENABLED', 'True') == 'True',
+    'DEFAULT_LIMIT': 8,
+    'MAX_LIMIT': 20,
+    'SMALL_RANGE': 200,     # tiền tố khớp nhiều khóa hơn thì tính sẵn gợi ý
+    'MAX_CHANGES': 1000,    # quá nhiều thay đổi từ lần cập nhật trước thì dựng lại toàn bộ
+    'CHANGE_TTL': 3600,     # giây giữ thay đổi trong cache cho các process khác
+}
+
+# Tìm kiếm theo khoảng cách (grid index trong bộ nhớ)
+GEO_SETTINGS = {
+    'ENABLED': os.getenv('GEO_SEARCH_ENABLED', 'True') == 'True',
+    'CELL_DEGREES': float(os.getenv('GEO_CELL_DEGREES', '0.1')),  # ~11 km mỗi ô theo vĩ độ
+    'DEFAULT_RADIUS_KM': float(os.getenv('GEO_DEFAULT_RADIUS_KM', '50')),
+    'MAX_RADIUS_KM': float(os.getenv('GEO_MAX_RADIUS_KM', '2000')),
+    'MAX_RESULTS': 50,
+    'CONTEXT_RESULTS': 5,   # số địa điểm "gần X" đưa vào prompt
+}
+
+# Cache dữ liệu suy ra từ catalog (context, kết quả tìm kiếm), invalidation theo version
+CATALOG_CACHE_SETTINGS = {
+    'CONTEXT_TIMEOUT': int(os.getenv('CONTEXT_CACHE_TIMEOUT', '3600')),
+    'SEARCH_TIMEOUT': int(os.getenv('SEARCH_CACHE_TIMEOUT', '300')),
+    'REFRESH_AHEAD': os.getenv('CACHE_REFRESH_AHEAD', 'True') == 'True',  # làm mới nền trước khi hết hạn
+    'REFRESH_RATIO': 0.8,   # làm mới khi đã qua 80% timeout
+    'LOCK_TIMEOUT': 30,     # giây; lock dựng lại tự hết hạn nếu process chết giữa chừng
+    'LOCK_WAIT': 5,         # giây chờ tối đa khi chưa có bản stale nào
+}
+
+# Cache response HTTP của các API tìm kiếm (bytes đã serialize, ETag/304); thời hạn phía server: SEARCH_TIMEOUT
+HTTP_CACHE_SETTINGS = {
+    'ENABLED': os.getenv('HTTP_CACHE_ENABLED', 'True') == 'True',
+    'MAX_AGE': int(os.getenv('HTTP_CACHE_MAX_AGE', '60')),  # Cache-Control cho trình duyệt/CDN
+}
+
+# Bộ nhớ hội thoại: N lượt gần nhất + tóm tắt cuộn các lượt cũ hơn
+MEMORY_SETTINGS = {
+    'ENABLED': os.getenv('CHAT_MEMORY_ENABLED', 'True') == 'True',
+    'RECENT_TURNS': int(os.getenv('CHAT_MEMORY_TURNS', '4')),  # số lượt giữ nguyên văn trong prompt
+    'FOLD_BATCH': 2,            # gộp vào summary mỗi khi dư ra 2 lượt (ít lần gọi model hơn)
+    'SUMMARY_MAX_TOKENS': int(os.getenv('CHAT_SUMMARY_MAX_TOKENS', '300')),
+    'TURN_MAX_CHARS': 2000,     # cắt câu trả lời dài khi lưu vào bộ nhớ
+    'CACHE_TIMEOUT': 86400,
+}
+
+# Đo đạc: header Server-Timing và endpoint /metrics/ (Prometheus)
+METRICS_SETTINGS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'True') == 'True',
+    'SERVER_TIMING': os.getenv('SERVER_TIMING', 'True') == 'True',
+    'TOKEN': os.getenv('METRICS_TOKEN', ''),  # nếu đặt: yêu cầu header Authorization: Bearer <token>
+}
+
+# Ngân sách token cho prompt (system > câu hỏi > context > lịch sử hội thoại)
+PROMPT_SETTINGS = {
+    'CONTEXT_WINDOW': int(os.getenv('MODEL_CONTEXT_WINDOW', '128000')),
+    'MAX_PROMPT_TOKENS': int(os.getenv('MAX_PROMPT_TOKENS', '4000')),  # giới hạn chi phí mỗi request
+    'CONTEXT_MAX_TOKENS': int(os.getenv('CONTEXT_MAX_TOKENS', '1200')),
+    'HISTORY_MAX_TOKENS': int(os.getenv('HISTORY_MAX_TOKENS', '1500')),
+    'SUMMARY_MAX_TOKENS': int(os.getenv('SUMMARY_PROMPT_MAX_TOKENS', '400')),
+    'USER_MESSAGE_MAX_TOKENS': int(os.getenv('USER_MESSAGE_MAX_TOKENS', '600')),
+    'TOKENIZER_ENCODING': os.getenv('TOKENIZER_ENCODING', 'o200k_base'),  # khi dùng tiktoken
+    # Không tải được tiktoken thì đếm bằng ước lượng: chừa thêm tỉ lệ này của ngân sách cho sai số
+    'ESTIMATE_MARGIN': float(os.getenv('PROMPT_ESTIMATE_MARGIN', '0.15')),
+    'LOG_TOKEN_COUNTS': os.getenv('LOG_PROMPT_TOKENS', 'False') == 'True',
+}
+
+# Answer cache settings (near-duplicate questions)
+ANSWER_CACHE_SETTINGS = {
+    'ENABLED': os.getenv('ANSWER_CACHE_ENABLED', 'True') == 'True',
+    'TTL': int(os.getenv('ANSWER_CACHE_TTL', '3600')),
+    'MAX_ENTRIES': int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', '5000')),
+    'SIMILARITY_THRESHOLD': float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.85')),
 }
 
 if __name__ == '__main__':
     print("🔧 Travel Chatbot Configuration Check")
     print("=" * 40)
     validate_environment()
+    print(f"🗃️ Database Settings: {DATABASE_SETTINGS}")
     print(f"📊 Performance Settings: {PERFORMANCE_SETTINGS}")
-    print(f"🤖 AI Settings: {AI_SETTINGS}")
\ No newline at end of file
+    print(f"🤖 AI Settings: {AI_SETTINGS}")
+    print(f"🛡️ Resilience Settings: {RESILIENCE_SETTINGS}")
+    print(f"🔀 Coalesce Settings: {COALESCE_SETTINGS}")
+    print(f"🚦 Rate Limit Settings: {RATE_LIMIT_SETTINGS}")
+    print(f"💾 Answer Cache Settings: {ANSWER_CACHE_SETTINGS}")
+    print(f"🎫 Chat Session Settings: {CHAT_SESSION_SETTINGS}")
+    print(f"📝 Chat Buffer Settings: {CHAT_BUFFER_SETTINGS}")
+    print(f"🗄️ Retention Settings: {RETENTION_SETTINGS}")
+    print(f"🧮 Prompt Settings: {PROMPT_SETTINGS}")
+    print(f"🧠 Memory Settings: {MEMORY_SETTINGS}")
+    print(f"🧭 Intent Settings: {INTENT_SETTINGS}")
+    print(f"🪪 Card Settings: {CARD_SETTINGS}")
+    print(f"⌨️ Autocomplete Settings: {AUTOCOMPLETE_SETTINGS}")
+    print(f"🗺️ Geo Settings: {GEO_SETTINGS}")
+    print(f"🗂️ Catalog Cache Settings: {CATALOG_CACHE_SETTINGS}")
+    print(f"🌐 HTTP Cache Settings: {HTTP_CACHE_SETTINGS}")
+    print(f"📈 Metrics Settings: {dict(METRICS_SETTINGS, TOKEN='***' if METRICS_SETTINGS['TOKEN'] else '')}")
\ No newline at end of file
@@ -0,0 +1,70 @@
+# Định tuyến đọc/ghi: ghi luôn vào primary ('default'), endpoint chỉ đọc đọc từ replica
+#
+# Chỉ các đoạn code bọc trong read_replica() mới đọc từ replica, phần còn lại (chat, signal tính
+# chênh lệch facet, admin...) vẫn đọc primary nên không bị ảnh hưởng bởi độ trễ replication.
+# Read-your-writes: sau khi ghi, pin(key) ghi dấu vào cache; read_replica(key) thấy dấu thì đọc
+# primary trong STICKY_SECONDS (vd. lịch sử chat ngay sau khi gửi tin nhắn, search ngay sau khi sửa catalog).
+import contextvars
+import random
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from .config import DATABASE_SETTINGS
+
+PRIMARY = "default"
+
+_read_alias = contextvars.ContextVar("db_read_alias", default=None)
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY]
+
+
+def _pin_key(key):
+    return f"db_pin:{key}"
+
+
+def pin(*keys):
+    """Đánh dấu vừa ghi dữ liệu của các key: đọc theo key đó dùng primary trong STICKY_SECONDS"""
+    keys = [key for key in keys if key]
+    if keys and replicas():
+        cache.set_many({_pin_key(key): 1 for key in keys}, DATABASE_SETTINGS['STICKY_SECONDS'])
+
+
+def is_pinned(key):
+    return cache.get(_pin_key(key)) is not None
+
+
+@contextmanager
+def read_replica(sticky_key=None):
+    """Đọc từ một replica (chọn ngẫu nhiên) trong khối lệnh; dùng được làm decorator.
+
+    sticky_key vừa được pin() thì đọc primary.
+    """
+    aliases = replicas()
+    alias = None
+    if aliases and not (sticky_key and is_pinned(sticky_key)):
+        alias = random.choice(aliases)
+    token = _read_alias.set(alias)
+    try:
+        yield alias or PRIMARY
+    finally:
+        _read_alias.reset(token)
+
+
+class ReadReplicaRouter:
+    """Ghi vào primary; đọc từ replica khi đang trong read_replica(), ngược lại đọc primary"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replica là bản sao của primary: quan hệ giữa các bản ghi luôn hợp lệ
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Schema của replica đến từ replication, không migrate trực tiếp
+        return db == PRIMARY
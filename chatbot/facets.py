@@ -0,0 +1,241 @@
+# Tiện nghi chuẩn hóa (bitset trên Hotel) và số đếm facet tính sẵn cho tìm kiếm khách sạn
+import re
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+# (khóa, nhãn hiển thị, các cách viết thường gặp); vị trí trong danh sách = vị trí bit.
+# Chỉ thêm vào cuối để không đổi bit của tiện nghi đã có (thêm mới thì chạy rebuild_hotel_facets).
+AMENITIES = (
+    ("wifi", "Wi-Fi", ("wifi", "wi-fi", "wi fi", "internet")),
+    ("pool", "Hồ bơi", ("hồ bơi", "bể bơi", "pool", "swimming pool")),
+    ("spa", "Spa", ("spa", "massage")),
+    ("gym", "Phòng gym", ("gym", "phòng gym", "phòng tập", "fitness")),
+    ("restaurant", "Nhà hàng", ("nhà hàng", "restaurant")),
+    ("bar", "Bar", ("bar", "quầy bar", "lounge")),
+    ("airport_shuttle", "Đưa đón sân bay", ("đưa đón sân bay", "xe đưa đón", "airport shuttle")),
+    ("parking", "Bãi đỗ xe", ("bãi đỗ xe", "chỗ đỗ xe", "đỗ xe", "parking")),
+    ("sea_view", "View biển", ("view biển", "hướng biển", "sea view", "ocean view")),
+    ("beach", "Bãi biển riêng", ("bãi biển riêng", "private beach")),
+    ("breakfast", "Bữa sáng", ("bữa sáng", "ăn sáng", "breakfast")),
+    ("air_conditioning", "Điều hòa", ("điều hòa", "máy lạnh", "air conditioning")),
+    ("room_service", "Dịch vụ phòng", ("dịch vụ phòng", "room service")),
+    ("kids_club", "Khu vui chơi trẻ em", ("khu vui chơi trẻ em", "kids club")),
+    ("pet_friendly", "Cho phép thú cưng", ("thú cưng", "pet friendly")),
+)
+AMENITY_BITS = {key: 1 << bit for bit, (key, _, _) in enumerate(AMENITIES)}
+AMENITY_LABELS = {key: label for key, label, _ in AMENITIES}
+_AMENITY_PATTERNS = [
+    (1 << bit, re.compile(r"(?<!\w)(?:" + "|".join(re.escape(a) for a in aliases) + r")(?!\w)"))
+    for bit, (_, _, aliases) in enumerate(AMENITIES)
+]
+
+# Khoảng giá/đêm (USD) cho facet giá: [0, 50), [50, 100), ... [500, ∞)
+PRICE_BUCKETS = (50, 100, 200, 500)
+STAR_VALUES = (1, 2, 3, 4, 5)
+ALL_SCOPE = 0  # scope của số đếm trên toàn bộ khách sạn (scope khác = destination_id)
+
+
+class FilterError(ValueError):
+    pass
+
+
+def amenity_bits(text):
+    """Bitset các tiện nghi nhận ra trong chuỗi tự do ("Wi-Fi miễn phí, hồ bơi ngoài trời")"""
+    text = " ".join((text or "").casefold().split())
+    bits = 0
+    for bit, pattern in _AMENITY_PATTERNS:
+        if pattern.search(text):
+            bits |= bit
+    return bits
+
+
+def amenity_keys(bits):
+    return [key for key, bit in AMENITY_BITS.items() if bits & bit]
+
+
+def parse_amenity_filter(value):
+    """"wifi,hồ bơi" -> mask; mỗi mục là khóa chuẩn hoặc một cách viết đã biết"""
+    mask = 0
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        bit = AMENITY_BITS.get(item.casefold()) or amenity_bits(item)
+        if not bit:
+            raise FilterError(f"Không nhận ra tiện nghi: {item}")
+        mask |= bit
+    return mask
+
+
+def price_bucket(price):
+    price = Decimal(price)
+    lower = 0
+    for upper in PRICE_BUCKETS:
+        if price < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+def price_bucket_ranges():
+    """[(nhãn, từ, tới)] theo đúng thứ tự hiển thị; tới = None là không giới hạn"""
+    bounds = (0,) + PRICE_BUCKETS
+    ranges = [(f"{lo}-{hi}", lo, hi) for lo, hi in zip(bounds, PRICE_BUCKETS)]
+    return ranges + [(f"{PRICE_BUCKETS[-1]}+", PRICE_BUCKETS[-1], None)]
+
+
+def facet_values(star_rating, price_per_night, bits):
+    """Các (facet, value) mà một khách sạn đóng góp 1 vào số đếm"""
+    values = [("star_rating", str(star_rating)), ("price", price_bucket(price_per_night))]
+    values += [("amenity", key) for key in amenity_keys(bits)]
+    return values
+
+
+# --- Lọc -----------------------------------------------------------------------
+
+def parse_filters(params):
+    """Bộ lọc từ query string: amenities, min_stars, max_stars, min_price, max_price"""
+    filters = {}
+    try:
+        for name, cast in (("min_stars", int), ("max_stars", int), ("min_price", Decimal), ("max_price", Decimal)):
+            value = (params.get(name) or "").strip()
+            if value:
+                filters[name] = cast(value)
+    except (ValueError, ArithmeticError):
+        raise FilterError(f"Giá trị lọc không hợp lệ: {name}")
+    mask = parse_amenity_filter(params.get("amenities"))
+    if mask:
+        filters["amenities"] = mask
+    return filters
+
+
+def apply_filters(queryset, filters):
+    """Áp bộ lọc trong cùng một câu truy vấn (bitset: amenity_bits & mask = mask)"""
+    if "min_stars" in filters:
+        queryset = queryset.filter(star_rating__gte=filters["min_stars"])
+    if "max_stars" in filters:
+        queryset = queryset.filter(star_rating__lte=filters["max_stars"])
+    if "min_price" in filters:
+        queryset = queryset.filter(price_per_night__gte=filters["min_price"])
+    if "max_price" in filters:
+        queryset = queryset.filter(price_per_night__lte=filters["max_price"])
+    if "amenities" in filters:
+        mask = filters["amenities"]
+        queryset = queryset.annotate(amenity_match=F("amenity_bits").bitand(mask)).filter(amenity_match=mask)
+    return queryset
+
+
+# --- Số đếm facet ----------------------------------------------------------------
+
+def _empty_facets():
+    return {
+        "star_rating": {str(s): 0 for s in STAR_VALUES},
+        "price": {label: 0 for label, _, _ in price_bucket_ranges()},
+        "amenities": {key: 0 for key in AMENITY_BITS},
+    }
+
+
+_FACET_GROUPS = {"star_rating": "star_rating", "price": "price", "amenity": "amenities"}
+
+
+def precomputed_facets(destination_id=None):
+    """Số đếm tính sẵn cho một điểm đến (hoặc toàn bộ): một truy vấn theo unique index (scope, ...)"""
+    from .models import HotelFacet
+    facets = _empty_facets()
+    scope = int(destination_id) if destination_id else ALL_SCOPE
+    for facet, value, count in HotelFacet.objects.filter(scope=scope).values_list("facet", "value", "count"):
+        group = facets[_FACET_GROUPS[facet]]
+        if value in group:
+            group[value] = count
+    return facets
+
+
+def filtered_facets(queryset):
+    """Số đếm trên tập đã lọc: một lượt aggregate có điều kiện thay vì một truy vấn cho mỗi giá trị"""
+    aggregates = {f"star_{s}": Count("pk", filter=Q(star_rating=s)) for s in STAR_VALUES}
+    for i, (_, low, high) in enumerate(price_bucket_ranges()):
+        condition = Q(price_per_night__gte=low)
+        if high is not None:
+            condition &= Q(price_per_night__lt=high)
+        aggregates[f"price_{i}"] = Count("pk", filter=condition)
+    queryset = queryset.annotate(**{
+        f"amenity_{key}": F("amenity_bits").bitand(bit) for key, bit in AMENITY_BITS.items()
+    })
+    for key in AMENITY_BITS:
+        aggregates[f"has_{key}"] = Count("pk", filter=Q(**{f"amenity_{key}__gt": 0}))
+    row = queryset.order_by().aggregate(**aggregates)
+
+    facets = _empty_facets()
+    for s in STAR_VALUES:
+        facets["star_rating"][str(s)] = row[f"star_{s}"]
+    for i, (label, _, _) in enumerate(price_bucket_ranges()):
+        facets["price"][label] = row[f"price_{i}"]
+    for key in AMENITY_BITS:
+        facets["amenities"][key] = row[f"has_{key}"]
+    return facets
+
+
+def apply_delta(deltas):
+    """Cộng dồn thay đổi {(scope, facet, value): +-n} vào bảng đếm (chỉ các ô thực sự đổi)"""
+    from .models import HotelFacet
+    for (scope, facet, value), delta in deltas.items():
+        if not delta:
+            continue
+        rows = HotelFacet.objects.filter(scope=scope, facet=facet, value=value)
+        if rows.update(count=F("count") + delta):
+            continue
+        try:
+            with transaction.atomic():
+                HotelFacet.objects.create(scope=scope, facet=facet, value=value, count=max(delta, 0))
+        except IntegrityError:
+            # Request khác vừa tạo cùng ô
+            rows.update(count=F("count") + delta)
+
+
+def hotel_deltas(old, new):
+    """old/new: (destination_id, star_rating, price_per_night, amenity_bits) hoặc None"""
+    deltas = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        destination_id, star_rating, price, bits = state
+        for facet, value in facet_values(star_rating, price, bits):
+            for scope in (destination_id, ALL_SCOPE):
+                deltas[(scope, facet, value)] = deltas.get((scope, facet, value), 0) + sign
+    return deltas
+
+
+def rebuild_facets(hotel_model=None, facet_model=None, using="default"):
+    """Tính lại toàn bộ bảng đếm bằng GROUP BY (sau import/seed hàng loạt hoặc khi đổi AMENITIES)"""
+    from .models import Hotel, HotelFacet
+    hotel_model = hotel_model or Hotel
+    facet_model = facet_model or HotelFacet
+    hotels = hotel_model.objects.using(using).order_by()
+    counts = {}
+
+    def add(scope, facet, value, n):
+        for key in ((scope, facet, value), (ALL_SCOPE, facet, value)):
+            counts[key] = counts.get(key, 0) + n
+
+    for destination_id, star_rating, n in hotels.values_list("destination_id", "star_rating").annotate(n=Count("pk")):
+        add(destination_id, "star_rating", str(star_rating), n)
+    for i, (label, low, high) in enumerate(price_bucket_ranges()):
+        bucket = hotels.filter(price_per_night__gte=low)
+        if high is not None:
+            bucket = bucket.filter(price_per_night__lt=high)
+        for destination_id, n in bucket.values_list("destination_id").annotate(n=Count("pk")):
+            add(destination_id, "price", label, n)
+    sums = {f"amenity_{key}": Sum(F("amenity_bits").bitand(bit) / bit) for key, bit in AMENITY_BITS.items()}
+    for row in hotels.values("destination_id").annotate(**sums):
+        for key in AMENITY_BITS:
+            if row[f"amenity_{key}"]:
+                add(row["destination_id"], "amenity", key, row[f"amenity_{key}"])
+
+    with transaction.atomic(using=using):
+        facet_model.objects.using(using).all().delete()
+        facet_model.objects.using(using).bulk_create(
+            [facet_model(scope=scope, facet=facet, value=value, count=n) for (scope, facet, value), n in counts.items()],
+            batch_size=1000,
+        )
+    return len(counts)
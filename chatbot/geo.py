@@ -0,0 +1,294 @@
+# Tìm kiếm theo khoảng cách: grid index trong bộ nhớ trên tọa độ điểm đến/điểm tham quan
+import heapq
+import itertools
+import math
+import re
+import threading
+from array import array
+from django.db import connections
+from .catalog_cache import get_catalog_version
+from .config import GEO_SETTINGS
+from .models import Destination, Attraction
+from .text import fold_text
+
+DESTINATION, ATTRACTION = "destination", "attraction"
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Tọa độ trung tâm (gần đúng) của các thành phố phổ biến, dùng khi backfill và khi hỏi "gần <thành phố>"
+CITY_COORDINATES = {
+    "Hà Nội": (21.0285, 105.8542), "Hồ Chí Minh": (10.7769, 106.7009), "Đà Nẵng": (16.0544, 108.2022),
+    "Hội An": (15.8801, 108.3380), "Huế": (16.4637, 107.5909), "Nha Trang": (12.2388, 109.1967),
+    "Đà Lạt": (11.9404, 108.4583), "Phú Quốc": (10.2899, 103.9840), "Sa Pa": (22.3364, 103.8438),
+    "Hạ Long": (20.9101, 107.1839), "Cần Thơ": (10.0452, 105.7469), "Quy Nhơn": (13.7820, 109.2190),
+    "Ninh Bình": (20.2506, 105.9745), "Vũng Tàu": (10.3460, 107.0843), "Hải Phòng": (20.8449, 106.6881),
+    "Phan Thiết": (10.9280, 108.1021), "Côn Đảo": (8.6833, 106.6000), "Hà Giang": (22.8233, 104.9836),
+    "Phong Nha": (17.5920, 106.2830), "Mộc Châu": (20.8478, 104.6386),
+    "Bangkok": (13.7563, 100.5018), "Chiang Mai": (18.7883, 98.9853), "Phuket": (7.8804, 98.3923),
+    "Singapore": (1.3521, 103.8198), "Kuala Lumpur": (3.1390, 101.6869), "Bali": (-8.4095, 115.1889),
+    "Siem Reap": (13.3671, 103.8448), "Luang Prabang": (19.8856, 102.1347),
+    "Tokyo": (35.6762, 139.6503), "Kyoto": (35.0116, 135.7681), "Osaka": (34.6937, 135.5023),
+    "Seoul": (37.5665, 126.9780), "Busan": (35.1796, 129.0756), "Paris": (48.8566, 2.3522),
+}
+
+# Câu hỏi về vị trí/khoảng cách: "gần", "quanh", "cách ... km", "near"
+PROXIMITY_KEYWORDS = ("gan", "quanh", "xung quanh", "lan can", "cach", "ban kinh", "near", "nearby", "around")
+_RADIUS_PATTERN = re.compile(r"(\d+(?:[.,]\d+)?)\s*km")
+MAX_PLACE_WORDS = 5
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """Lưới ô CELL_DEGREES độ; mỗi ô giữ các tọa độ khác nhau (site), mỗi site giữ các điểm trùng tọa độ.
+
+    Truy vấn duyệt các vòng ô quanh điểm hỏi, gần trước: haversine chỉ tính cho site trong các ô
+    đã duyệt và dừng ngay khi vòng kế tiếp chắc chắn xa hơn bán kính hoặc kết quả thứ k.
+    """
+
+    def __init__(self, cell_degrees=0.1):
+        self.cell_degrees = cell_degrees
+        self.rows = int(math.ceil(180 / cell_degrees))
+        self.columns = int(math.ceil(360 / cell_degrees))
+        self.lats = array("d")
+        self.lons = array("d")
+        self.kinds = []
+        self.ids = array("q")
+        self.destination_ids = array("q")
+        self.names = []
+        self.cities = []
+        self.site_lats = array("d")
+        self.site_lons = array("d")
+        self.site_points = []   # site -> array điểm
+        self.sites = {}         # (lat, lon) -> site
+        self.cells = {}         # (hàng, cột) -> array site
+        self.places = {}        # tên đã bỏ dấu -> (lat, lon, kind, id, tên hiển thị)
+
+    def add(self, kind, pk, name, city, lat, lon, destination_id):
+        point = len(self.ids)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.kinds.append(kind)
+        self.ids.append(pk)
+        self.destination_ids.append(destination_id)
+        self.names.append(name)
+        self.cities.append(city)
+        site = self.sites.get((lat, lon))
+        if site is None:
+            # Nhiều bản ghi dùng chung tọa độ (vd. điểm tham quan lấy tọa độ điểm đến): tính khoảng cách một lần
+            site = self.sites[(lat, lon)] = len(self.site_points)
+            self.site_lats.append(lat)
+            self.site_lons.append(lon)
+            self.site_points.append(array("I"))
+            self.cells.setdefault(self._cell(lat, lon), array("I")).append(site)
+        self.site_points[site].append(point)
+        self.places.setdefault(fold_text(name), (lat, lon, kind, pk, name))
+
+    def add_place(self, name, lat, lon):
+        """Tên thành phố (không phải một điểm trong index) để hỏi "gần <thành phố>" """
+        self.places.setdefault(fold_text(name), (lat, lon, None, None, name))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell(self, lat, lon):
+        return (min(self.rows - 1, int(math.floor((lat + 90) / self.cell_degrees))),
+                int(math.floor((lon + 180) / self.cell_degrees)) % self.columns)
+
+    def _ring(self, row, col, r):
+        """Các ô cách ô (row, col) đúng r ô (khoảng cách Chebyshev), kinh độ quay vòng"""
+        if r == 0:
+            return [(row, col)]
+        cells = []
+        for dr in range(-r, r + 1):
+            ring_row = row + dr
+            if not 0 <= ring_row < self.rows:
+                continue
+            steps = range(-r, r + 1) if abs(dr) == r else (-r, r)
+            cells.extend((ring_row, (col + dc) % self.columns) for dc in steps)
+        if 2 * r + 1 > self.columns:
+            cells = list(dict.fromkeys(cells))
+        return cells
+
+    def _ring_distance(self, row, col, cell):
+        """Khoảng cách Chebyshev (số vòng) từ ô (row, col) tới cell, kinh độ quay vòng"""
+        dc = abs(cell[1] - col)
+        return max(abs(cell[0] - row), min(dc, self.columns - dc))
+
+    def _rings(self, row, col):
+        """(r, các ô của vòng r) theo r tăng dần, chỉ tới ô có dữ liệu xa nhất.
+
+        Tới vòng r đã duyệt ~4r² ô: khi số đó vượt số ô có dữ liệu thì sắp thẳng các ô có dữ liệu còn
+        lại theo vòng và bỏ qua các vòng trống (dữ liệu thưa hoặc mọi điểm gần đều bị lọc theo kinds).
+        """
+        max_rings = max(self.rows, self.columns // 2 + 1)
+        for r in range(max_rings + 1):
+            if 4 * r * r > len(self.cells):
+                rest = sorted(
+                    (distance, cell) for cell in self.cells
+                    if (distance := self._ring_distance(row, col, cell)) >= r
+                )
+                for distance, group in itertools.groupby(rest, key=lambda item: item[0]):
+                    yield distance, [cell for _, cell in group]
+                return
+            yield r, self._ring(row, col, r)
+
+    def _search(self, lat, lon, radius_km, k, kinds=None, exclude=None):
+        heap = []  # (-khoảng cách, điểm): k kết quả gần nhất hiện có
+        row, col = self._cell(lat, lon)
+        cell_km = self.cell_degrees * KM_PER_DEGREE
+        for r, cells in self._rings(row, col):
+            # Mọi điểm thuộc vòng r cách điểm hỏi ít nhất r - 1 ô trọn vẹn
+            ring_lat = min(89.9, abs(lat) + (r + 1) * self.cell_degrees)
+            lower_bound = max(0, r - 1) * cell_km * math.cos(math.radians(ring_lat))
+            if lower_bound > radius_km or (len(heap) >= k and lower_bound > -heap[0][0]):
+                break
+            for cell in cells:
+                for site in self.cells.get(cell, ()):
+                    # Chênh vĩ độ là cận dưới của khoảng cách: loại site mà không cần haversine
+                    limit_km = -heap[0][0] if len(heap) >= k and -heap[0][0] < radius_km else radius_km
+                    if abs(self.site_lats[site] - lat) * KM_PER_DEGREE > limit_km:
+                        continue
+                    distance = haversine_km(lat, lon, self.site_lats[site], self.site_lons[site])
+                    if distance > radius_km or (len(heap) >= k and distance >= -heap[0][0]):
+                        continue
+                    for point in self.site_points[site]:
+                        if kinds and self.kinds[point] not in kinds:
+                            continue
+                        if exclude and (self.kinds[point], self.ids[point]) == exclude:
+                            continue
+                        if len(heap) < k:
+                            heapq.heappush(heap, (-distance, point))
+                        elif distance < -heap[0][0]:
+                            heapq.heapreplace(heap, (-distance, point))
+                        else:
+                            break
+        return sorted((-negative, point) for negative, point in heap)
+
+    def within(self, lat, lon, radius_km, kinds=None, limit=None, exclude=None):
+        """[(khoảng cách km, điểm)] trong bán kính, gần nhất trước (tối đa limit kết quả)"""
+        return self._search(lat, lon, radius_km, limit or len(self.ids) or 1, kinds, exclude)
+
+    def nearest(self, lat, lon, k, kinds=None, max_radius_km=None, exclude=None):
+        """k điểm gần nhất (trong max_radius_km nếu có)"""
+        return self._search(lat, lon, max_radius_km or math.pi * EARTH_RADIUS_KM, k, kinds, exclude)
+
+    def resolve_place(self, text):
+        """(lat, lon, kind, id, tên) của địa danh dài nhất nhắc tới trong câu, hoặc None"""
+        words = fold_text(text).split()
+        best = None
+        for i in range(len(words)):
+            for n in range(min(MAX_PLACE_WORDS, len(words) - i), 0, -1):
+                phrase = " ".join(words[i:i + n])
+                if phrase in self.places:
+                    if best is None or n > best[0]:
+                        best = (n, phrase)
+                    break
+        return self.places[best[1]] if best else None
+
+    def describe(self, distance, point):
+        return {
+            "type": self.kinds[point],
+            "id": self.ids[point],
+            "name": self.names[point],
+            "city": self.cities[point],
+            "destination_id": self.destination_ids[point],
+            "latitude": self.lats[point],
+            "longitude": self.lons[point],
+            "distance_km": round(distance, 2),
+        }
+
+
+def build_index():
+    """Dựng index từ các bản ghi đã có tọa độ (mỗi model một query, chỉ lấy các cột cần)"""
+    index = GeoIndex(GEO_SETTINGS['CELL_DEGREES'])
+    cities = {}
+    destinations = Destination.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for pk, name, city, lat, lon in destinations.values_list("pk", "name", "city", "latitude", "longitude").iterator():
+        index.add(DESTINATION, pk, name, city, lat, lon, pk)
+        cities.setdefault(city, []).append((lat, lon))
+    attractions = Attraction.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for pk, name, city, lat, lon, destination_id in attractions.values_list(
+        "pk", "name", "destination__city", "latitude", "longitude", "destination_id"
+    ).iterator():
+        index.add(ATTRACTION, pk, name, city, lat, lon, destination_id)
+    # Tâm thành phố: trung bình các điểm đến trong catalog, không có thì lấy từ bảng tọa độ
+    for city, points in cities.items():
+        index.add_place(city, sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points))
+    for city, (lat, lon) in CITY_COORDINATES.items():
+        index.add_place(city, lat, lon)
+    return index
+
+
+_index = None
+_index_version = None
+_build_lock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild(version):
+    global _index, _index_version, _rebuilding
+    try:
+        index = build_index()
+        _index, _index_version = index, version
+    except Exception as e:
+        print(f"Geo index build error: {str(e)}")
+    finally:
+        _rebuilding = False
+
+
+def _rebuild_in_background(version):
+    try:
+        _rebuild(version)
+    finally:
+        connections.close_all()
+
+
+def get_index():
+    """Index hiện tại; dựng lại khi catalog version đổi (chạy nền nếu đã có index cũ)"""
+    global _rebuilding
+    version = get_catalog_version()
+    if _index is not None and _index_version == version:
+        return _index
+    with _build_lock:
+        if _index is None:
+            _rebuild(version)
+        elif _index_version != version and not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild_in_background, args=(version,), daemon=True).start()
+    return _index
+
+
+def nearby_facts(message, limit=None):
+    """Fact "gần X" cho prompt khi câu hỏi nói về khoảng cách và nhắc tới một địa danh đã biết"""
+    if not GEO_SETTINGS['ENABLED']:
+        return []
+    folded = f" {fold_text(message)} "
+    if not any(f" {k} " in folded for k in PROXIMITY_KEYWORDS):
+        return []
+    index = get_index()
+    if index is None or not len(index):
+        return []
+    place = index.resolve_place(message)
+    if place is None:
+        return []
+    lat, lon, kind, pk, origin = place
+    match = _RADIUS_PATTERN.search(message.lower())
+    radius = float(match.group(1).replace(",", ".")) if match else GEO_SETTINGS['DEFAULT_RADIUS_KM']
+    radius = min(radius, GEO_SETTINGS['MAX_RADIUS_KM'])
+    limit = limit or GEO_SETTINGS['CONTEXT_RESULTS']
+    exclude = (kind, pk) if kind else None
+    results = index.within(lat, lon, radius, limit=limit, exclude=exclude)
+    if not results:
+        return [f"Trong bán kính {radius:g} km quanh {origin}: chưa có địa điểm nào trong dữ liệu"]
+    items = ", ".join(
+        f"{index.names[point]} ({'điểm đến' if index.kinds[point] == DESTINATION else 'tham quan'}, "
+        f"{index.cities[point]}, ~{distance:.0f} km)"
+        for distance, point in results
+    )
+    return [f"Gần {origin} (bán kính {radius:g} km): {items}"]
+
@@ -0,0 +1,85 @@
+# Cache response của các API chỉ đọc theo catalog: bytes JSON đã serialize + ETag/304
+import functools
+import hashlib
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from . import metrics
+from .catalog_cache import get_or_build, hashed_key
+from .config import CATALOG_CACHE_SETTINGS, HTTP_CACHE_SETTINGS
+
+
+class ApiError(Exception):
+    """Lỗi tham số từ hàm dựng dữ liệu (vd. 400 sai bộ lọc): trả JSON với status này, không lưu cache"""
+
+    def __init__(self, data, status=400):
+        super().__init__(data)
+        self.data = data
+        self.status = status
+
+
+def normalize_params(query_dict, params):
+    """{tên: giá trị} đã chuẩn hóa theo thứ tự cố định; tham số lạ (vd. ?_=timestamp) bị bỏ qua"""
+    normalized = {}
+    for name in params:
+        value = " ".join(query_dict.get(name, "").split())
+        if name == "q":
+            value = value.casefold()
+        normalized[name] = value
+    return normalized
+
+
+def _etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def _matches(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = parse_etags(header)
+    # So sánh yếu (RFC 9110): bỏ tiền tố W/ mà GZipMiddleware có thể thêm vào
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def _with_headers(response, etag):
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=HTTP_CACHE_SETTINGS['MAX_AGE'])
+    return response
+
+
+def cached_api(name, params, timeout=None):
+    """Decorator biến hàm dựng dữ liệu JSON phụ thuộc (tham số, catalog version) thành view GET.
+
+    Hàm được bọc là hàm thuần: nhận đúng các tham số đã chuẩn hóa trong params (keyword), không nhận
+    HttpRequest, trả về dict; sai tham số thì raise ApiError. Nhờ vậy thread refresh-ahead của
+    get_or_build dựng lại được mà không giữ request cũ. Lưu (etag, bytes) qua get_or_build: khóa có
+    version nên sửa catalog là hết hạn ngay, và chỉ một request dựng lại. If-None-Match khớp -> 304,
+    chỉ đọc cache, không chạm DB.
+    """
+    def decorator(builder):
+        @functools.wraps(builder)
+        def view(request):
+            values = normalize_params(request.GET, params)
+            if not HTTP_CACHE_SETTINGS['ENABLED'] or request.method not in ("GET", "HEAD"):
+                try:
+                    return JsonResponse(builder(**values))
+                except ApiError as e:
+                    return JsonResponse(e.data, status=e.status)
+
+            def build():
+                body = JsonResponse(builder(**values)).content
+                return _etag(body), body
+
+            key = hashed_key(f"http_{name}", *(f"{k}={v}" for k, v in values.items()))
+            try:
+                etag, body = get_or_build(key, build, timeout or CATALOG_CACHE_SETTINGS['SEARCH_TIMEOUT'])
+            except ApiError as e:
+                return JsonResponse(e.data, status=e.status)
+
+            if _matches(request, etag):
+                metrics.CACHE_REQUESTS.labels(f"http_{name}", "not_modified").inc()
+                return _with_headers(HttpResponseNotModified(), etag)
+            return _with_headers(HttpResponse(body, content_type="application/json"), etag)
+        return view
+    return decorator
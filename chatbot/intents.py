@@ -0,0 +1,308 @@
+# Bộ định tuyến ý định theo luật: trả lời câu hỏi tra cứu catalog/chào hỏi bằng mẫu câu + truy vấn DB,
+# chỉ câu hỏi mở (lịch trình, tư vấn, so sánh...) mới cần gọi model
+import re
+import threading
+from django.db import connections
+from . import geo, metrics
+from .catalog_cache import get_catalog_version
+from .config import INTENT_SETTINGS
+from .models import Destination, Hotel, Restaurant, Attraction
+from .text import fold_text
+
+GREETING, THANKS, GOODBYE = "greeting", "thanks", "goodbye"
+HOTELS, RESTAURANTS, ATTRACTIONS, ATTRACTION_PRICE, DESTINATION_INFO = (
+    "hotels", "restaurants", "attractions", "attraction_price", "destination_info",
+)
+
+# Câu chào/cảm ơn ngắn chỉ gồm các từ này (đã bỏ dấu)
+SMALL_TALK_WORDS = frozenset("""
+xin chao chao hello hi hey alo ban ad admin shop bot em anh chi oi a nhe nha nhieu cam on thank thanks
+you tam biet bye goodbye hen gap lai nhe ok
+""".split())
+GREETING_PHRASES = ("xin chao", "chao", "hello", "hi", "hey", "alo")
+THANKS_PHRASES = ("cam on", "thank", "thanks")
+GOODBYE_PHRASES = ("tam biet", "bye", "goodbye", "hen gap lai")
+
+# Câu hỏi mở: để model trả lời
+OPEN_ENDED_PHRASES = (
+    "lich trinh", "ke hoach", "tu van", "so sanh", "tai sao", "vi sao", "kinh nghiem", "review",
+    "nhu the nao", "the nao", "giup toi", "len plan", "plan", "nen chon", "co nen", "khac nhau",
+)
+
+INTENT_PHRASES = {
+    ATTRACTION_PRICE: ("gia ve", "ve vao", "bao nhieu tien", "mat phi", "mo cua", "gio mo", "may gio"),
+    HOTELS: ("khach san", "hotel", "resort", "nha nghi", "homestay", "cho o", "luu tru"),
+    RESTAURANTS: ("nha hang", "quan an", "an gi", "mon ngon", "dac san", "am thuc", "an uong"),
+    ATTRACTIONS: ("tham quan", "vui choi", "choi gi", "gi choi", "cho choi", "dia diem", "di dau"),
+    DESTINATION_INFO: ("thoi diem", "mua nao", "thang nao", "luc nao", "chi phi", "ton bao nhieu"),
+}
+
+_STARS_PATTERN = re.compile(r"(?:(tu|tren|it nhat) )?([1-5]) sao")
+_PRICE_PATTERN = re.compile(r"(?:duoi|khong qua|toi da|re hon) (\d+)(?: (\w+))?")
+VND_UNITS = frozenset(("k", "nghin", "ngan", "trieu", "dong", "vnd", "d"))  # giá trong DB tính theo USD
+MAX_NAME_WORDS = 8
+
+REPLIES = {
+    GREETING: "Xin chào! Tôi là trợ lý du lịch. Bạn muốn tìm khách sạn, nhà hàng hay điểm tham quan ở đâu?",
+    THANKS: "Rất vui được giúp bạn! Nếu cần thêm thông tin về chuyến đi, cứ hỏi tôi nhé.",
+    GOODBYE: "Tạm biệt và chúc bạn có chuyến đi thật vui!",
+}
+
+
+def _has_phrase(padded, phrases):
+    return any(f" {p} " in padded for p in phrases)
+
+
+class EntityIndex:
+    """Tên điểm đến/thành phố/điểm tham quan (đã bỏ dấu) -> id, để nhận ra thực thể trong câu hỏi"""
+
+    def __init__(self):
+        self.destinations = {}  # cụm từ -> set(destination_id)
+        self.attractions = {}   # cụm từ -> set(attraction_id)
+        self.names = {}         # destination_id -> tên thành phố để hiển thị
+
+    def add_destination(self, pk, name, city):
+        self.names[pk] = city
+        for phrase in {fold_text(name), fold_text(city)}:
+            if phrase:
+                self.destinations.setdefault(phrase, set()).add(pk)
+
+    def add_attraction(self, pk, name):
+        phrase = fold_text(name)
+        if phrase:
+            self.attractions.setdefault(phrase, set()).add(pk)
+
+    def match(self, words):
+        """(destination_ids, attraction_ids) nhắc tới trong câu; ưu tiên cụm dài nhất ở mỗi vị trí"""
+        destinations, attractions = set(), set()
+        i = 0
+        while i < len(words):
+            for n in range(min(MAX_NAME_WORDS, len(words) - i), 0, -1):
+                phrase = " ".join(words[i:i + n])
+                if phrase in self.attractions:
+                    attractions |= self.attractions[phrase]
+                elif phrase in self.destinations:
+                    destinations |= self.destinations[phrase]
+                else:
+                    continue
+                i += n - 1
+                break
+            i += 1
+        return destinations, attractions
+
+
+def build_index():
+    index = EntityIndex()
+    for pk, name, city in Destination.objects.values_list("pk", "name", "city").iterator():
+        index.add_destination(pk, name, city)
+    for pk, name in Attraction.objects.values_list("pk", "name").iterator():
+        index.add_attraction(pk, name)
+    return index
+
+
+_index = None
+_index_version = None
+_build_lock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild(version):
+    global _index, _index_version, _rebuilding
+    try:
+        index = build_index()
+        _index, _index_version = index, version
+    except Exception as e:
+        print(f"Intent index build error: {str(e)}")
+    finally:
+        _rebuilding = False
+
+
+def _rebuild_in_background(version):
+    try:
+        _rebuild(version)
+    finally:
+        connections.close_all()
+
+
+def get_index():
+    """Index hiện tại; dựng lại khi catalog version đổi (chạy nền nếu đã có index cũ)"""
+    global _rebuilding
+    version = get_catalog_version()
+    if _index is not None and _index_version == version:
+        return _index
+    with _build_lock:
+        if _index is None:
+            _rebuild(version)
+        elif _index_version != version and not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild_in_background, args=(version,), daemon=True).start()
+    return _index
+
+
+# --- Phân loại ----------------------------------------------------------------
+
+def classify(message):
+    """(intent, tham số) nếu câu hỏi trả lời được bằng mẫu câu, None nếu cần model"""
+    folded = fold_text(message)
+    words = folded.split()
+    if not words or len(words) > INTENT_SETTINGS['MAX_WORDS']:
+        return None
+    padded = f" {folded} "
+
+    if all(word in SMALL_TALK_WORDS for word in words):
+        for intent, phrases in ((THANKS, THANKS_PHRASES), (GOODBYE, GOODBYE_PHRASES), (GREETING, GREETING_PHRASES)):
+            if _has_phrase(padded, phrases):
+                return intent, {}
+        return None
+
+    # "khách sạn gần Phố cổ": khoảng cách do geo index + model xử lý
+    if _has_phrase(padded, OPEN_ENDED_PHRASES) or _has_phrase(padded, geo.PROXIMITY_KEYWORDS):
+        return None
+    intents = [intent for intent, phrases in INTENT_PHRASES.items() if _has_phrase(padded, phrases)]
+    if not intents:
+        return None
+
+    index = get_index()
+    if index is None:
+        return None
+    destination_ids, attraction_ids = index.match(words)
+
+    # "giá vé Bà Nà Hills" / "Bà Nà Hills mấy giờ mở cửa": hỏi về một điểm tham quan cụ thể
+    if ATTRACTION_PRICE in intents and attraction_ids and not (set(intents) & {HOTELS, RESTAURANTS}):
+        return ATTRACTION_PRICE, {"attraction_ids": attraction_ids}
+    intents = [intent for intent in intents if intent != ATTRACTION_PRICE]
+    # Hỏi nhiều loại cùng lúc hoặc không rõ điểm đến: để model tổng hợp
+    if len(intents) != 1 or not destination_ids:
+        return None
+
+    intent = intents[0]
+    params = {"destination_ids": destination_ids}
+    if intent == HOTELS:
+        match = _STARS_PATTERN.search(folded)
+        if match:
+            params["stars"] = int(match.group(2))
+            params["min_stars"] = bool(match.group(1))
+        match = _PRICE_PATTERN.search(folded)
+        if match:
+            if match.group(2) in VND_UNITS:
+                return None  # cần quy đổi tiền tệ: để model xử lý
+            params["max_price"] = int(match.group(1))
+        params["cheap"] = " gia re " in padded or " re nhat " in padded
+    return intent, params
+
+
+# --- Câu trả lời --------------------------------------------------------------
+
+def _city(index, destination_ids):
+    return ", ".join(sorted({index.names[pk] for pk in destination_ids if pk in index.names}))
+
+
+def _answer_hotels(index, destination_ids, stars=None, min_stars=False, max_price=None, cheap=False):
+    hotels = Hotel.objects.filter(destination_id__in=destination_ids)
+    if stars:
+        hotels = hotels.filter(star_rating__gte=stars) if min_stars else hotels.filter(star_rating=stars)
+    if max_price:
+        hotels = hotels.filter(price_per_night__lte=max_price)
+    hotels = hotels.order_by("price_per_night", "-rating") if cheap else hotels.order_by("-rating", "price_per_night")
+    hotels = list(hotels.only("name", "star_rating", "price_per_night", "rating")[:INTENT_SETTINGS['MAX_RESULTS']])
+    criteria = "".join([
+        f" {'từ ' if min_stars else ''}{stars} sao" if stars else "",
+        f" dưới {max_price} USD/đêm" if max_price else "",
+    ])
+    if not hotels:
+        return f"Hiện chưa có khách sạn{criteria} nào ở {_city(index, destination_ids)} trong dữ liệu của chúng tôi."
+    lines = [
+        f"- {h.name}: {h.star_rating} sao, {float(h.price_per_night):.0f} USD/đêm, đánh giá {h.rating:.1f}/5"
+        for h in hotels
+    ]
+    return f"Một số khách sạn{criteria} ở {_city(index, destination_ids)}:\n" + "\n".join(lines)
+
+
+def _answer_restaurants(index, destination_ids):
+    restaurants = list(
+        Restaurant.objects.filter(destination_id__in=destination_ids).order_by("-rating")
+        .only("name", "cuisine_type", "price_range", "specialty", "rating")[:INTENT_SETTINGS['MAX_RESULTS']]
+    )
+    if not restaurants:
+        return f"Hiện chưa có nhà hàng nào ở {_city(index, destination_ids)} trong dữ liệu của chúng tôi."
+    lines = [
+        f"- {r.name}: {r.cuisine_type}, mức giá {r.get_price_range_display()}, "
+        f"món nên thử: {r.specialty[:80]}, đánh giá {r.rating:.1f}/5"
+        for r in restaurants
+    ]
+    return f"Một số nhà hàng được đánh giá cao ở {_city(index, destination_ids)}:\n" + "\n".join(lines)
+
+
+def _answer_attractions(index, destination_ids):
+    attractions = list(
+        Attraction.objects.filter(destination_id__in=destination_ids).order_by("-rating")
+        .only("name", "category", "entry_fee", "opening_hours", "rating")[:INTENT_SETTINGS['MAX_RESULTS']]
+    )
+    if not attractions:
+        return f"Hiện chưa có điểm tham quan nào ở {_city(index, destination_ids)} trong dữ liệu của chúng tôi."
+    lines = [
+        f"- {a.name} ({a.get_category_display()}): vé {float(a.entry_fee):.0f} USD, "
+        f"mở cửa {a.opening_hours}, đánh giá {a.rating:.1f}/5"
+        for a in attractions
+    ]
+    return f"Các điểm tham quan nổi bật ở {_city(index, destination_ids)}:\n" + "\n".join(lines)
+
+
+def _answer_attraction_price(index, attraction_ids):
+    attractions = list(
+        Attraction.objects.filter(pk__in=attraction_ids).select_related("destination")
+        .order_by("-rating")[:INTENT_SETTINGS['MAX_RESULTS']]
+    )
+    if not attractions:
+        return None
+    lines = [
+        f"- {a.name} ({a.destination.city}): vé vào cửa "
+        f"{'miễn phí' if not a.entry_fee else f'{float(a.entry_fee):.0f} USD'}, mở cửa {a.opening_hours}"
+        for a in attractions
+    ]
+    return "Thông tin vé và giờ mở cửa:\n" + "\n".join(lines)
+
+
+def _answer_destination_info(index, destination_ids):
+    destinations = list(
+        Destination.objects.filter(pk__in=destination_ids).order_by("-rating")
+        .only("name", "city", "best_time_to_visit", "average_cost", "rating")[:INTENT_SETTINGS['MAX_RESULTS']]
+    )
+    if not destinations:
+        return None
+    lines = [
+        f"- {d.name} ({d.city}): thời điểm đẹp nhất {d.best_time_to_visit}, "
+        f"chi phí trung bình ~{float(d.average_cost):.0f} USD/ngày, đánh giá {d.rating:.1f}/5"
+        for d in destinations
+    ]
+    return "Thông tin điểm đến:\n" + "\n".join(lines)
+
+
+ANSWERS = {
+    HOTELS: _answer_hotels,
+    RESTAURANTS: _answer_restaurants,
+    ATTRACTIONS: _answer_attractions,
+    ATTRACTION_PRICE: _answer_attraction_price,
+    DESTINATION_INFO: _answer_destination_info,
+}
+
+
+def route(message):
+    """(intent, câu trả lời) cho câu hỏi tra cứu/chào hỏi; None nếu cần gọi model"""
+    if not INTENT_SETTINGS['ENABLED']:
+        return None
+    with metrics.span("intent"):
+        try:
+            result = classify(message)
+            reply = None
+            if result is not None:
+                intent, params = result
+                reply = REPLIES.get(intent) or ANSWERS[intent](get_index(), **params)
+        except Exception as e:
+            print(f"Intent router error: {str(e)}")
+            reply = None
+    if reply is None:
+        metrics.INTENT_ROUTED.labels("llm").inc()
+        return None
+    metrics.INTENT_ROUTED.labels(intent).inc()
+    return intent, reply
@@ -0,0 +1,417 @@
+# LLM provider client for Travel Chatbot
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from . import metrics, resilience, singleflight
+from .config import AI_SETTINGS, RESILIENCE_SETTINGS
+
+# Câu trả lời tạm khi chưa cấu hình OPENAI_API_KEY
+PLACEHOLDER_REPLY = (
+    "Xin chào! Tôi đã nhận được câu hỏi: '{user_message}'. Hiện tại hệ thống AI đang được thiết lập. "
+    "Vui lòng thử lại sau khi OpenAI API được cấu hình đầy đủ."
+)
+
+
+class LLMBusyError(Exception):
+    """Quá nhiều request đang chờ model, hết thời gian chờ slot"""
+
+
+_client = None
+_client_lock = threading.Lock()
+
+# Client async gắn với một event loop (pool keep-alive của httpx không dùng được từ loop khác)
+_async_loop = None
+_async_client = None
+_async_client_lock = threading.Lock()
+
+
+class _Slots:
+    """Giới hạn số lời gọi model đồng thời trong process, dùng chung cho thread sync và mọi event loop.
+
+    Slot trả lại được chuyển thẳng cho người chờ lâu nhất (FIFO), kể cả người chờ ở loop khác.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._active = 0
+        self._waiters = deque()  # (loop hoặc None, Future hoặc threading.Event)
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, waiter):
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def _cancel(self, waiter):
+        """Bỏ chờ; False nghĩa là slot vừa được chuyển cho waiter này (người gọi đang giữ slot)"""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return True
+        return False
+
+    def acquire(self, timeout):
+        waiter = (None, threading.Event())
+        if self._try_acquire(waiter) or waiter[1].wait(timeout):
+            return True
+        return not self._cancel(waiter)
+
+    async def aacquire(self, timeout):
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        if self._try_acquire(waiter):
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return not self._cancel(waiter)
+        except BaseException:
+            # Request bị hủy trong lúc chờ: slot đã được chuyển cho mình thì trả lại
+            if not self._cancel(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._active -= 1
+                return
+            loop, signal = self._waiters.popleft()
+        if loop is None:
+            signal.set()
+            return
+        try:
+            loop.call_soon_threadsafe(_wake, signal)
+        except RuntimeError:
+            self.release()  # loop của người chờ đã đóng: chuyển slot cho người tiếp theo
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(True)
+
+
+_slots = _Slots(AI_SETTINGS['MAX_CONCURRENT_REQUESTS'])
+
+
+def _http_limits():
+    """Giới hạn connection pool dùng chung cho client sync và async"""
+    import httpx
+    return httpx.Limits(
+        max_connections=AI_SETTINGS['MAX_CONNECTIONS'],
+        max_keepalive_connections=AI_SETTINGS['MAX_CONNECTIONS'],
+        keepalive_expiry=AI_SETTINGS['KEEPALIVE_EXPIRY'],
+    )
+
+
+def is_configured():
+    """Đã cấu hình API key cho model chưa"""
+    return bool(os.getenv("OPENAI_API_KEY"))
+
+
+def get_client():
+    """Khởi tạo OpenAI client dùng chung (None nếu chưa có API key)"""
+    global _client
+    if _client is None and os.getenv("OPENAI_API_KEY"):
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=AI_SETTINGS['BASE_URL'] or None,
+                    timeout=AI_SETTINGS['TIMEOUT'],
+                    max_retries=0,  # thử lại/chuyển model do resilience.py đảm nhận, trong DEADLINE
+                    http_client=httpx.Client(limits=_http_limits(), timeout=AI_SETTINGS['TIMEOUT']),
+                )
+    return _client
+
+
+def _new_async_client():
+    import httpx
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=AI_SETTINGS['BASE_URL'] or None,
+        timeout=AI_SETTINGS['TIMEOUT'],
+        max_retries=0,
+        http_client=httpx.AsyncClient(limits=_http_limits(), timeout=AI_SETTINGS['TIMEOUT']),
+    )
+
+
+async def _close_client(client):
+    try:
+        await client.close()
+    except RuntimeError:
+        pass  # loop của client đã đóng: connection đã chết theo loop, socket được thu hồi khi GC
+    except Exception as e:
+        print(f"LLM client close error: {str(e)}")
+
+
+@asynccontextmanager
+async def async_client():
+    """AsyncOpenAI client cho event loop hiện tại (None nếu chưa có API key).
+
+    Client dùng chung gắn với một loop (ASGI: loop của process). Loop đó đã đóng (async view
+    chạy dưới WSGI, mỗi request một loop) thì loop hiện tại nhận client mới và client cũ được
+    đóng; loop khác chạy song song với loop đang giữ client thì dùng client riêng, đóng khi xong.
+    """
+    global _async_loop, _async_client
+    if not os.getenv("OPENAI_API_KEY"):
+        yield None
+        return
+    loop = asyncio.get_running_loop()
+    replaced = scoped = None
+    with _async_client_lock:
+        if _async_loop is loop and _async_client is not None:
+            client = _async_client
+        elif _async_loop is None or _async_loop.is_closed():
+            replaced = _async_client
+            client = _async_client = _new_async_client()
+            _async_loop = loop
+        else:
+            client = scoped = _new_async_client()
+    if replaced is not None:
+        await _close_client(replaced)
+    try:
+        yield client
+    finally:
+        if scoped is not None:
+            await _close_client(scoped)
+
+
+@contextmanager
+def _slot():
+    """Giữ một slot gọi model (sync), chờ tối đa QUEUE_TIMEOUT giây"""
+    with metrics.span("llm_queue"):
+        acquired = _slots.acquire(AI_SETTINGS['QUEUE_TIMEOUT'])
+    if not acquired:
+        raise LLMBusyError("Too many in-flight LLM requests")
+    try:
+        yield
+    finally:
+        _slots.release()
+
+
+@asynccontextmanager
+async def _async_slot():
+    """Giữ một slot gọi model (async), chờ tối đa QUEUE_TIMEOUT giây"""
+    with metrics.span("llm_queue"):
+        acquired = await _slots.aacquire(AI_SETTINGS['QUEUE_TIMEOUT'])
+    if not acquired:
+        raise LLMBusyError("Too many in-flight LLM requests")
+    try:
+        yield
+    finally:
+        _slots.release()
+
+
+def placeholder_reply(user_message):
+    """Câu trả lời khi AI chưa được cấu hình"""
+    return PLACEHOLDER_REPLY.format(user_message=user_message)
+
+
+def _placeholder_chunks(user_message):
+    """Chia câu trả lời tạm thành từng từ để giả lập stream"""
+    words = placeholder_reply(user_message).split(" ")
+    return [word if i == len(words) - 1 else word + " " for i, word in enumerate(words)]
+
+
+def _completion_kwargs(messages, **extra):
+    kwargs = dict(
+        model=AI_SETTINGS['OPENAI_MODEL'],
+        messages=messages,
+        max_tokens=AI_SETTINGS['MAX_TOKENS'],
+        temperature=AI_SETTINGS['TEMPERATURE'],
+    )
+    kwargs.update(extra)  # cho phép ghi đè (vd. max_tokens nhỏ hơn khi tóm tắt)
+    return kwargs
+
+
+class _CallMetrics:
+    """Đo một lần gọi model: latency, token đầu tiên (stream), số token, lỗi"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.chunks = 0
+
+    def chunk(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+            metrics.LLM_FIRST_TOKEN_SECONDS.observe(self.first_token)
+        self.chunks += 1
+
+    def finish(self, usage=None, error=None):
+        elapsed = time.perf_counter() - self.start
+        metrics.record("llm", elapsed)
+        metrics.LLM_SECONDS.labels(self.mode).observe(elapsed)
+        metrics.LLM_REQUESTS.labels(self.mode, "error" if error else "ok").inc()
+        if usage is not None:
+            metrics.LLM_TOKENS.labels("prompt").inc(usage.prompt_tokens)
+            metrics.LLM_TOKENS.labels("completion").inc(usage.completion_tokens)
+        elif self.chunks:
+            # Stream không trả usage: mỗi chunk xấp xỉ một token
+            metrics.LLM_TOKENS.labels("completion").inc(self.chunks)
+
+
+def _models(client_kwargs):
+    """Các model theo thứ tự thử; gọi với model chỉ định thì chỉ dùng model đó"""
+    if "model" in client_kwargs:
+        return [client_kwargs["model"]]
+    return resilience.models()
+
+
+def complete(messages, user_message="", **options):
+    """Gọi model và trả về toàn bộ câu trả lời; options ghi đè tham số gọi model.
+
+    Đi qua circuit breaker/hedging/model dự phòng (resilience.py); hết cách thì raise
+    resilience.CircuitOpenError để view trả câu trả lời dự phòng.
+    """
+    client = get_client()
+    if client is None:
+        return placeholder_reply(user_message)
+
+    kwargs = _completion_kwargs(messages, **options)
+
+    def attempt(model, timeout):
+        call = _CallMetrics("complete")
+        try:
+            response = client.with_options(timeout=timeout).chat.completions.create(**dict(kwargs, model=model))
+        except Exception as e:
+            call.finish(error=e)
+            raise
+        call.finish(usage=getattr(response, "usage", None))
+        return response.choices[0].message.content
+
+    def call_model():
+        with _slot():
+            return resilience.call(attempt, _models(options))
+
+    # Prompt giống hệt đang được gọi (request khác cùng lúc) thì chờ và dùng chung kết quả
+    return singleflight.do(singleflight.prompt_key(kwargs), call_model)
+
+
+def stream(messages, user_message=""):
+    """Gọi model ở chế độ stream, yield từng đoạn text ngay khi model sinh ra.
+
+    Model chính lỗi trước token đầu tiên thì chuyển sang model dự phòng; đã có token thì raise.
+    """
+    client = get_client()
+    if client is None:
+        yield from _placeholder_chunks(user_message)
+        return
+
+    kwargs = _completion_kwargs(messages, stream=True)
+    candidates = resilience.models()
+    error = None
+    with _slot():
+        for model in candidates:
+            if not resilience.allow(model, candidates[0]):
+                continue
+            call = _CallMetrics("stream")
+            failure = None
+            try:
+                response = client.with_options(timeout=RESILIENCE_SETTINGS['ATTEMPT_TIMEOUT']).chat.completions.create(
+                    **dict(kwargs, model=model)
+                )
+                for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if call.first_token is None:
+                            resilience.record(model, time.perf_counter() - call.start, True)
+                        call.chunk()
+                        yield delta
+                if call.first_token is None:
+                    resilience.record(model, time.perf_counter() - call.start, True)
+                return
+            except Exception as e:
+                failure = e
+                if call.first_token is not None:
+                    raise
+                resilience.record(model, time.perf_counter() - call.start, False)
+                print(f"LLM stream error ({model}): {str(e)}")
+                error = e
+            finally:
+                call.finish(error=failure)
+    raise resilience.CircuitOpenError("No LLM model available") from error
+
+
+async def acomplete(messages, user_message=""):
+    """Phiên bản async của complete(), không chặn worker trong lúc chờ model"""
+    if not is_configured():
+        return placeholder_reply(user_message)
+
+    kwargs = _completion_kwargs(messages)
+
+    async def call_model():
+        async with async_client() as client, _async_slot():
+            async def attempt(model, timeout):
+                call = _CallMetrics("complete")
+                try:
+                    response = await client.with_options(timeout=timeout).chat.completions.create(
+                        **dict(kwargs, model=model)
+                    )
+                except Exception as e:
+                    call.finish(error=e)
+                    raise
+                call.finish(usage=getattr(response, "usage", None))
+                return response.choices[0].message.content
+
+            return await resilience.acall(attempt, resilience.models())
+
+    return await singleflight.ado(singleflight.prompt_key(kwargs), call_model)
+
+
+async def astream(messages, user_message=""):
+    """Phiên bản async của stream()"""
+    if not is_configured():
+        for chunk in _placeholder_chunks(user_message):
+            yield chunk
+        return
+
+    kwargs = _completion_kwargs(messages, stream=True)
+    candidates = resilience.models()
+    error = None
+    async with async_client() as client, _async_slot():
+        for model in candidates:
+            if not resilience.allow(model, candidates[0]):
+                continue
+            call = _CallMetrics("stream")
+            failure = None
+            try:
+                response = await client.with_options(
+                    timeout=RESILIENCE_SETTINGS['ATTEMPT_TIMEOUT']
+                ).chat.completions.create(**dict(kwargs, model=model))
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if call.first_token is None:
+                            resilience.record(model, time.perf_counter() - call.start, True)
+                        call.chunk()
+                        yield delta
+                if call.first_token is None:
+                    resilience.record(model, time.perf_counter() - call.start, True)
+                return
+            except Exception as e:
+                failure = e
+                if call.first_token is not None:
+                    raise
+                resilience.record(model, time.perf_counter() - call.start, False)
+                print(f"LLM stream error ({model}): {str(e)}")
+                error = e
+            finally:
+                call.finish(error=failure)
+    raise resilience.CircuitOpenError("No LLM model available") from error
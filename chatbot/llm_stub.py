@@ -0,0 +1,121 @@
+# Server giả lập API OpenAI (chat completions) để benchmark không tốn tiền và không phụ thuộc mạng
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_WORDS = (
+    "Bạn có thể ghé thăm phố cổ vào buổi tối để ngắm đèn lồng, thưởng thức đặc sản địa phương "
+    "và nghỉ tại một khách sạn gần trung tâm để tiện di chuyển tới các điểm tham quan."
+).split()
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Trả lời POST /v1/chat/completions (stream hoặc không) sau độ trễ cấu hình được"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.5            # giây trước token đầu tiên
+    tokens_per_second = 50.0
+    reply_tokens = 60
+    # Giả lập upstream trục trặc (thử circuit breaker/hedging/model dự phòng)
+    error_rate = 0.0         # tỉ lệ request trả 503
+    slow_rate = 0.0          # tỉ lệ request bị chậm thêm slow_latency giây
+    slow_latency = 10.0
+    faulty_models = ()       # chỉ các model này trục trặc; rỗng = mọi model
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError:
+            self.send_error(400)
+            return
+
+        model = body.get("model", "stub")
+        faulty = not self.faulty_models or model in self.faulty_models
+        if faulty and random.random() < self.error_rate:
+            self._send_json({"error": {"message": "Stub upstream error", "type": "server_error"}}, status=503)
+            return
+        if faulty and random.random() < self.slow_rate:
+            time.sleep(self.slow_latency)
+        n_tokens = min(self.reply_tokens, body.get("max_tokens") or self.reply_tokens)
+        tokens = [STUB_WORDS[i % len(STUB_WORDS)] + " " for i in range(n_tokens)]
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        time.sleep(self.latency)
+
+        if body.get("stream"):
+            self._stream(model, tokens)
+        else:
+            time.sleep(n_tokens / self.tokens_per_second)
+            self._send_json({
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": n_tokens,
+                    "total_tokens": prompt_tokens + n_tokens,
+                },
+            })
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _stream(self, model, tokens):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        delay = 1.0 / self.tokens_per_second
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def make_server(host="127.0.0.1", port=8799, latency=0.5, tokens_per_second=50.0, reply_tokens=60,
+                error_rate=0.0, slow_rate=0.0, slow_latency=10.0, faulty_models=()):
+    """Tạo ThreadingHTTPServer với cấu hình riêng (mỗi server một subclass handler)"""
+    handler = type("ConfiguredStubLLMHandler", (StubLLMHandler,), {
+        "latency": latency,
+        "tokens_per_second": tokens_per_second,
+        "reply_tokens": reply_tokens,
+        "error_rate": error_rate,
+        "slow_rate": slow_rate,
+        "slow_latency": slow_latency,
+        "faulty_models": tuple(faulty_models),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
@@ -0,0 +1,169 @@
+# Load driver: gửi request đồng thời tới các endpoint và đo throughput, p50/p95/p99
+import http.cookiejar
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+CITIES = ("Hà Nội", "Đà Nẵng", "Hội An", "Huế", "Nha Trang", "Đà Lạt", "Phú Quốc", "Sa Pa", "Bangkok", "Tokyo")
+CHAT_TEMPLATES = (
+    "Gợi ý khách sạn 4 sao ở {city}",
+    "Đi {city} mùa nào đẹp nhất?",
+    "Ăn gì ngon ở {city}?",
+    "Lịch trình 3 ngày ở {city} với chi phí khoảng {budget} USD",
+    "Có điểm tham quan nào miễn phí ở {city} không?",
+)
+
+
+def percentile(sorted_values, p):
+    """Percentile theo nearest-rank trên danh sách đã sắp xếp"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class LoadClient:
+    """Một "người dùng": cookie session và CSRF token riêng"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+        self.csrf_token = ""
+
+    def start_session(self):
+        self.opener.open(self.base_url + "/", timeout=self.timeout).read()
+        self.csrf_token = next((c.value for c in self.cookies if c.name == "csrftoken"), "")
+
+    def request(self, method, path, body=None):
+        """Gửi request, trả về (status, giây tới byte đầu tiên của body)"""
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers = {
+                "Content-Type": "application/json",
+                "X-CSRFToken": self.csrf_token,
+                "Referer": self.base_url + "/",
+            }
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        first_byte = None
+        try:
+            with self.opener.open(req, timeout=self.timeout) as response:
+                status = response.status
+                if response.read(1):
+                    first_byte = time.perf_counter() - start
+                response.read()
+        except urllib.error.HTTPError as e:
+            status = e.code
+            e.read()
+        return status, first_byte
+
+
+def _chat_message(rng):
+    return rng.choice(CHAT_TEMPLATES).format(city=rng.choice(CITIES), budget=rng.randrange(100, 1000, 50))
+
+
+ENDPOINTS = {
+    # tên -> hàm (client, rng) -> (method, path, body)
+    "chat": lambda c, rng: ("POST", "/chat/", {"message": _chat_message(rng)}),
+    "chat_stream": lambda c, rng: ("POST", "/chat/?stream=1", {"message": _chat_message(rng)}),
+    "chat_history": lambda c, rng: ("GET", "/chat/history/", None),
+    "search_destinations": lambda c, rng: (
+        "GET", "/api/search/destinations/?" + urllib.parse.urlencode({"q": rng.choice(CITIES)}), None
+    ),
+    "search_hotels": lambda c, rng: (
+        "GET", "/api/search/hotels/?" + urllib.parse.urlencode({"q": rng.choice(CITIES)}), None
+    ),
+}
+
+
+def run_endpoint(base_url, endpoint, requests, concurrency, timeout=60, seed=0):
+    """Chạy `requests` request tới một endpoint với `concurrency` client song song"""
+    build_request = ENDPOINTS[endpoint]
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, first_bytes, statuses, errors = [], [], {}, []
+
+    def worker(worker_id):
+        rng = random.Random(seed * 1000 + worker_id)
+        client = LoadClient(base_url, timeout)
+        try:
+            client.start_session()
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        while next(counter) < requests:
+            method, path, body = build_request(client, rng)
+            start = time.perf_counter()
+            try:
+                status, first_byte = client.request(method, path, body)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status < 400:
+                    latencies.append(elapsed)
+                    if first_byte is not None:
+                        first_bytes.append(first_byte)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall_time = time.perf_counter() - start
+
+    latencies.sort()
+    first_bytes.sort()
+    ok = len(latencies)
+    return {
+        "requests": requests,
+        "ok": ok,
+        "errors": requests - ok,
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+        "error_samples": errors[:5],
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(ok / wall_time, 2) if wall_time else None,
+        "latency_ms": _summary(latencies),
+        "first_byte_ms": _summary(first_bytes),
+    }
+
+
+def _summary(values):
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50) * 1000, 2),
+        "p95": round(percentile(values, 95) * 1000, 2),
+        "p99": round(percentile(values, 99) * 1000, 2),
+        "mean": round(sum(values) / len(values) * 1000, 2),
+        "max": round(values[-1] * 1000, 2),
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Danh sách endpoint có p95 (hoặc throughput) kém hơn baseline quá max_regression (tỉ lệ)"""
+    regressions = []
+    for endpoint, result in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before or not before.get("latency_ms") or not result.get("latency_ms"):
+            continue
+        old_p95, new_p95 = before["latency_ms"]["p95"], result["latency_ms"]["p95"]
+        if old_p95 and new_p95 > old_p95 * (1 + max_regression):
+            regressions.append(f"{endpoint}: p95 {old_p95}ms -> {new_p95}ms")
+        old_rps, new_rps = before.get("throughput_rps"), result.get("throughput_rps")
+        if old_rps and new_rps is not None and new_rps < old_rps * (1 - max_regression):
+            regressions.append(f"{endpoint}: throughput {old_rps} -> {new_rps} req/s")
+    return regressions
@@ -0,0 +1,110 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from chatbot import geo
+from chatbot.catalog_cache import bump_catalog_version
+from chatbot.models import Destination, Attraction
+from chatbot.text import fold_text
+
+
+class Command(BaseCommand):
+    help = ("Bổ sung tọa độ cho điểm đến/điểm tham quan: từ file CSV (type,id|name,city,latitude,longitude), "
+            "từ tâm thành phố có sẵn, và cho điểm tham quan từ điểm đến của nó")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help="CSV: type (destination|attraction), id hoặc name + city, latitude, longitude")
+        parser.add_argument('--no-city-centroids', action='store_true',
+                            help="Không dùng tọa độ tâm thành phố cho điểm đến chưa có tọa độ")
+        parser.add_argument('--no-attractions-from-destination', action='store_true',
+                            help="Không gán tọa độ điểm đến cho điểm tham quan chưa có tọa độ")
+        parser.add_argument('--overwrite', action='store_true', help="Tọa độ trong --file ghi đè tọa độ đã có")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.time()
+        self.batch_size = options['batch_size']
+        overwrite = options['overwrite']
+        counts = {}
+        with transaction.atomic():
+            if options['file']:
+                counts["file"] = self._from_file(options['file'], overwrite)
+            if not options['no_city_centroids']:
+                counts["city_centroids"] = self._from_city_centroids()
+            if not options['no_attractions_from_destination']:
+                counts["attractions_from_destination"] = self._attractions_from_destination()
+        # bulk_update không gửi signal: làm mới geo index và các cache theo catalog
+        bump_catalog_version()
+
+        missing = {
+            "destination": Destination.objects.filter(latitude__isnull=True).count(),
+            "attraction": Attraction.objects.filter(latitude__isnull=True).count(),
+        }
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã cập nhật {counts} trong {time.time() - start:.2f}s; còn thiếu tọa độ: {missing}"
+        ))
+
+    def _save(self, model, objects):
+        model.objects.bulk_update(objects, ['latitude', 'longitude'], batch_size=self.batch_size)
+        return len(objects)
+
+    def _from_file(self, path, overwrite):
+        models = {"destination": Destination, "attraction": Attraction}
+        updates = {Destination: {}, Attraction: {}}
+        try:
+            with open(path, encoding="utf-8", newline="") as f:
+                for line_num, row in enumerate(csv.DictReader(f), 2):
+                    model = models.get((row.get("type") or "destination").strip())
+                    try:
+                        lat, lon = float(row["latitude"]), float(row["longitude"])
+                    except (KeyError, TypeError, ValueError):
+                        raise CommandError(f"Dòng {line_num}: thiếu hoặc sai latitude/longitude")
+                    if model is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                        raise CommandError(f"Dòng {line_num}: type hoặc tọa độ không hợp lệ")
+                    key = (row.get("id") or "").strip() or (
+                        fold_text(row.get("name")), fold_text(row.get("city"))
+                    )
+                    updates[model][key] = (lat, lon)
+        except OSError as e:
+            raise CommandError(f"Không đọc được {path}: {e}")
+
+        total = 0
+        for model, city_field in ((Destination, "city"), (Attraction, "destination__city")):
+            if not updates[model]:
+                continue
+            changed = []
+            queryset = model.objects.all() if overwrite else model.objects.filter(latitude__isnull=True)
+            for obj in queryset.select_related(*(["destination"] if model is Attraction else [])).iterator():
+                city = obj.city if model is Destination else obj.destination.city
+                coordinates = updates[model].get(str(obj.pk)) or updates[model].get(
+                    (fold_text(obj.name), fold_text(city))
+                )
+                if coordinates:
+                    obj.latitude, obj.longitude = coordinates
+                    changed.append(obj)
+            total += self._save(model, changed)
+        return total
+
+    def _from_city_centroids(self):
+        centroids = {fold_text(city): coordinates for city, coordinates in geo.CITY_COORDINATES.items()}
+        queryset = Destination.objects.filter(latitude__isnull=True)
+        changed = []
+        for destination in queryset.only("pk", "city", "latitude", "longitude").iterator():
+            coordinates = centroids.get(fold_text(destination.city))
+            if coordinates:
+                destination.latitude, destination.longitude = coordinates
+                changed.append(destination)
+        return self._save(Destination, changed)
+
+    def _attractions_from_destination(self):
+        # Gần đúng: điểm tham quan chưa có tọa độ riêng lấy tọa độ điểm đến
+        coordinates = dict(
+            (pk, (lat, lon)) for pk, lat, lon in Destination.objects.filter(latitude__isnull=False)
+            .values_list("pk", "latitude", "longitude")
+        )
+        changed = []
+        for attraction in Attraction.objects.filter(latitude__isnull=True).only("pk", "destination_id", "latitude", "longitude").iterator():
+            if attraction.destination_id in coordinates:
+                attraction.latitude, attraction.longitude = coordinates[attraction.destination_id]
+                changed.append(attraction)
+        return self._save(Attraction, changed)
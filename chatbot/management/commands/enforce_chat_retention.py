@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from chatbot import retention
+from chatbot.config import RETENTION_SETTINGS
+
+
+class Command(BaseCommand):
+    help = ("Giới hạn kích thước bảng ChatHistory: chuyển bản ghi quá tuổi/vượt giới hạn theo phiên, user "
+            "sang bảng archive theo lô nhỏ (dùng cho cron khi tắt chạy nền)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-days', type=int, default=RETENTION_SETTINGS['MAX_AGE_DAYS'])
+        parser.add_argument('--max-per-session', type=int, default=RETENTION_SETTINGS['MAX_PER_SESSION'])
+        parser.add_argument('--max-per-user', type=int, default=RETENTION_SETTINGS['MAX_PER_USER'])
+        parser.add_argument('--delete', action='store_true', help="Xóa hẳn thay vì chuyển sang bảng archive")
+        parser.add_argument('--chunk-size', type=int, default=RETENTION_SETTINGS['CHUNK_SIZE'])
+        parser.add_argument('--chunk-pause', type=float, default=RETENTION_SETTINGS['CHUNK_PAUSE'])
+        parser.add_argument('--archive-max-age-days', type=int, default=RETENTION_SETTINGS['ARCHIVE_MAX_AGE_DAYS'])
+        parser.add_argument('--archive-dir', default=RETENTION_SETTINGS['ARCHIVE_DIR'])
+        parser.add_argument('--full', action='store_true',
+                            help="Xét giới hạn trên toàn bảng thay vì chỉ các phiên/user có tin nhắn mới")
+
+    def handle(self, *args, **options):
+        settings = {
+            'MAX_AGE_DAYS': options['max_age_days'],
+            'MAX_PER_SESSION': options['max_per_session'],
+            'MAX_PER_USER': options['max_per_user'],
+            'ARCHIVE': RETENTION_SETTINGS['ARCHIVE'] and not options['delete'],
+            'CHUNK_SIZE': options['chunk_size'],
+            'CHUNK_PAUSE': options['chunk_pause'],
+            'ARCHIVE_MAX_AGE_DAYS': options['archive_max_age_days'],
+            'ARCHIVE_DIR': options['archive_dir'],
+        }
+        start = time.time()
+
+        def on_step(step, count, path=None):
+            suffix = f" -> {path}" if path else ""
+            self.stdout.write(f"{step}: {count} bản ghi{suffix}")
+
+        stats = retention.run_retention(settings, full=options['full'], on_step=on_step)
+        action = "xóa" if not settings['ARCHIVE'] else "chuyển sang archive"
+        moved = stats["age"] + stats["session_cap"] + stats["user_cap"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã {action} {moved} bản ghi, nén {stats['compacted']} bản ghi archive trong {time.time() - start:.1f}s"
+        ))
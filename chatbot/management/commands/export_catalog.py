@@ -0,0 +1,35 @@
+import sys
+import time
+from django.core.management.base import BaseCommand
+from chatbot import catalog_io
+
+
+class Command(BaseCommand):
+    help = "Export catalog ra CSV/JSONL (kể cả .gz, '-' = stdout) theo luồng, định dạng import_catalog đọc được"
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(catalog_io.MODELS))
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--progress-every', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        model = catalog_io.MODELS[options['model']]
+        fmt = catalog_io.detect_format(options['path'], options['format'])
+        columns = catalog_io.export_columns(model)
+        start = time.time()
+        count = 0
+        with catalog_io.open_text(options['path'], "w") as stream:
+            writer = catalog_io.RowWriter(stream, fmt, columns)
+            for values in catalog_io.export_rows(model, chunk_size=options['chunk_size']):
+                writer.write(values)
+                count += 1
+                if count % options['progress_every'] == 0:
+                    self.stderr.write(f"... {count} dòng - {count / (time.time() - start):.0f} dòng/s")
+            stream.flush()
+
+        elapsed = time.time() - start
+        # Thông báo ra stderr để không lẫn vào dữ liệu khi export ra stdout
+        sys.stderr.write(f"Export {options['model']}: {count} dòng trong {elapsed:.1f}s "
+                         f"({count / elapsed if elapsed else 0:.0f} dòng/s)\n")
@@ -0,0 +1,80 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from chatbot import cards, catalog_io, facets, search_index
+from chatbot.catalog_cache import bump_catalog_version
+from chatbot.models import Destination, Hotel
+
+
+class Command(BaseCommand):
+    help = ("Import catalog từ CSV/JSONL (kể cả .gz, '-' = stdin) theo luồng, "
+            "upsert theo khóa tự nhiên và ghi theo lô")
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(catalog_io.MODELS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'])
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--insert-only', action='store_true',
+                            help="Không tra bản ghi đã có (nhanh hơn khi nạp vào bảng trống)")
+        parser.add_argument('--dry-run', action='store_true', help="Chỉ validate, không ghi DB")
+        parser.add_argument('--errors-file', help="Ghi các dòng lỗi (JSONL) ra file này")
+        parser.add_argument('--max-errors', type=int, help="Dừng khi số dòng lỗi vượt ngưỡng")
+        parser.add_argument('--progress-every', type=int, default=50000)
+        parser.add_argument('--no-reindex', action='store_true',
+                            help="Không dựng lại full-text index sau khi import")
+
+    def handle(self, *args, **options):
+        model = catalog_io.MODELS[options['model']]
+        fmt = catalog_io.detect_format(options['path'], options['format'])
+        importer = catalog_io.CatalogImporter(
+            model, upsert=not options['insert_only'], batch_size=options['batch_size'], dry_run=options['dry_run'],
+        )
+
+        errors_file = open(options['errors_file'], "w", encoding="utf-8") if options['errors_file'] else None
+        shown_errors = [0]
+
+        def on_error(line_num, row, messages):
+            if errors_file:
+                errors_file.write(json.dumps(
+                    {"line": line_num, "errors": messages, "row": row if isinstance(row, dict) else None},
+                    ensure_ascii=False,
+                ) + "\n")
+            elif shown_errors[0] < 20:
+                shown_errors[0] += 1
+                self.stderr.write(f"Dòng {line_num}: {messages}")
+
+        def on_progress(stats):
+            self.stderr.write(f"... {stats}")
+
+        try:
+            with catalog_io.open_text(options['path']) as stream:
+                stats = importer.run(
+                    catalog_io.read_rows(stream, fmt), on_error=on_error, on_progress=on_progress,
+                    progress_every=options['progress_every'], max_errors=options['max_errors'],
+                )
+        except catalog_io.RowError as e:
+            raise CommandError(f"{e} ({importer.stats})")
+        except OSError as e:
+            raise CommandError(f"Không đọc được {options['path']}: {e}")
+        finally:
+            if errors_file:
+                errors_file.close()
+
+        if not options['dry_run'] and (stats.created or stats.updated):
+            # bulk_create/bulk_update không gửi signal: tự làm mới cache và index
+            bump_catalog_version()
+            if model is Hotel:
+                facets.rebuild_facets()
+            cards.rebuild_cards()
+            if (not options['no_reindex'] and model in (Destination, Hotel)
+                    and connection.vendor == 'sqlite' and search_index.is_available()):
+                start = time.time()
+                with transaction.atomic():
+                    search_index.rebuild(Destination.objects.all(), Hotel.objects.all(),
+                                         batch_size=options['batch_size'])
+                self.stderr.write(f"Đã dựng lại full-text index trong {time.time() - start:.1f}s")
+
+        prefix = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}Import {options['model']}: {stats}"))
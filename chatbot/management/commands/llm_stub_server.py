@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from chatbot.llm_stub import make_server
+
+
+class Command(BaseCommand):
+    help = "Chạy server giả lập OpenAI API cho benchmark (đặt OPENAI_BASE_URL=http://host:port/v1)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8799)
+        parser.add_argument('--latency', type=float, default=0.5, help="Giây trước token đầu tiên")
+        parser.add_argument('--tokens-per-second', type=float, default=50.0)
+        parser.add_argument('--reply-tokens', type=int, default=60)
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Tỉ lệ request trả lỗi 503")
+        parser.add_argument('--slow-rate', type=float, default=0.0, help="Tỉ lệ request bị chậm thêm --slow-latency giây")
+        parser.add_argument('--slow-latency', type=float, default=10.0)
+        parser.add_argument('--faulty-model', action='append', default=[],
+                            help="Chỉ model này trục trặc (lặp lại được); mặc định mọi model")
+
+    def handle(self, *args, **options):
+        server = make_server(
+            options['host'], options['port'], latency=options['latency'],
+            tokens_per_second=options['tokens_per_second'], reply_tokens=options['reply_tokens'],
+            error_rate=options['error_rate'], slow_rate=options['slow_rate'],
+            slow_latency=options['slow_latency'], faulty_models=options['faulty_model'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Stub LLM đang chạy tại http://{options['host']}:{options['port']}/v1 "
+            f"(latency {options['latency']}s, {options['tokens_per_second']} token/s, "
+            f"lỗi {options['error_rate']:.0%}, chậm {options['slow_rate']:.0%})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,79 @@
+import json
+import subprocess
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from chatbot import loadtest
+
+
+class Command(BaseCommand):
+    help = ("Load test các endpoint (chat, lịch sử, tìm kiếm) và in kết quả JSON: "
+            "throughput, latency p50/p95/p99 theo endpoint")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--endpoints', default=",".join(loadtest.ENDPOINTS),
+                            help=f"Danh sách, cách nhau bởi dấu phẩy: {', '.join(loadtest.ENDPOINTS)}")
+        parser.add_argument('--requests', type=int, default=200, help="Số request cho mỗi endpoint")
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=10, help="Số request khởi động (không tính)")
+        parser.add_argument('--timeout', type=float, default=60)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Ghi kết quả JSON ra file")
+        parser.add_argument('--baseline', help="File JSON của lần chạy trước để so sánh")
+        parser.add_argument('--max-regression', type=float, default=0.2,
+                            help="Tỉ lệ chậm đi tối đa so với baseline trước khi báo lỗi")
+
+    def handle(self, *args, **options):
+        endpoints = [e.strip() for e in options['endpoints'].split(",") if e.strip()]
+        unknown = [e for e in endpoints if e not in loadtest.ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Endpoint không hợp lệ: {', '.join(unknown)}")
+
+        report = {
+            "meta": {
+                "base_url": options['base_url'],
+                "commit": self._git_commit(),
+                "started_at": timezone.now().isoformat(),
+                "requests": options['requests'],
+                "concurrency": options['concurrency'],
+            },
+            "endpoints": {},
+        }
+        for endpoint in endpoints:
+            if options['warmup']:
+                loadtest.run_endpoint(
+                    options['base_url'], endpoint, options['warmup'], min(options['concurrency'], options['warmup']),
+                    timeout=options['timeout'], seed=options['seed'] + 1,
+                )
+            result = loadtest.run_endpoint(
+                options['base_url'], endpoint, options['requests'], options['concurrency'],
+                timeout=options['timeout'], seed=options['seed'],
+            )
+            report["endpoints"][endpoint] = result
+            self.stderr.write(
+                f"{endpoint}: {result['throughput_rps']} req/s, latency {result['latency_ms']}, "
+                f"errors {result['errors']}"
+            )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], "w", encoding="utf-8") as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline'], encoding="utf-8") as f:
+                baseline = json.load(f)
+            regressions = loadtest.compare(report, baseline, options['max_regression'])
+            if regressions:
+                raise CommandError("Hiệu năng giảm so với baseline:\n" + "\n".join(regressions))
+            self.stderr.write(self.style.SUCCESS("Không có regression so với baseline"))
+
+    @staticmethod
+    def _git_commit():
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
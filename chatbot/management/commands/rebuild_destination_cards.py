@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from chatbot import cards
+
+
+class Command(BaseCommand):
+    help = "Dựng lại thẻ tri thức (card) của các điểm đến từ catalog hiện tại"
+
+    def add_arguments(self, parser):
+        parser.add_argument('destination_ids', nargs='*', type=int, help="Chỉ dựng lại các điểm đến này")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        built = cards.rebuild_cards(options['destination_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã dựng {len(built)} card điểm đến trong {time.time() - start:.2f}s"
+        ))
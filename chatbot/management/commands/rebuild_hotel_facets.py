@@ -0,0 +1,37 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from chatbot import facets
+from chatbot.catalog_cache import bump_catalog_version
+from chatbot.models import Hotel
+
+
+class Command(BaseCommand):
+    help = "Tính lại bitset tiện nghi của khách sạn và bảng số đếm facet (sau khi sửa facets.AMENITIES)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.time()
+        batch_size = options['batch_size']
+        changed = 0
+        batch = []
+        with transaction.atomic():
+            for hotel in Hotel.objects.only('pk', 'amenities', 'amenity_bits').iterator(chunk_size=batch_size):
+                bits = facets.amenity_bits(hotel.amenities)
+                if bits != hotel.amenity_bits:
+                    hotel.amenity_bits = bits
+                    batch.append(hotel)
+                if len(batch) >= batch_size:
+                    Hotel.objects.bulk_update(batch, ['amenity_bits'])
+                    changed += len(batch)
+                    batch = []
+            Hotel.objects.bulk_update(batch, ['amenity_bits'])
+            changed += len(batch)
+            cells = facets.rebuild_facets()
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã cập nhật {changed} khách sạn, {cells} ô facet trong {time.time() - start:.2f}s"
+        ))
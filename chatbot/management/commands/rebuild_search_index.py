@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from chatbot import search_index
+from chatbot.models import Destination, Hotel
+
+
+class Command(BaseCommand):
+    help = "Xây lại full-text index (SQLite FTS5) cho Destination và Hotel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("Full-text index chỉ hỗ trợ SQLite (FTS5).")
+
+        start = time.time()
+        with transaction.atomic():
+            dest_count, hotel_count = search_index.rebuild(
+                Destination.objects.all(), Hotel.objects.all(), batch_size=options['batch_size']
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã index {dest_count} điểm đến và {hotel_count} khách sạn trong {time.time() - start:.2f}s"
+        ))
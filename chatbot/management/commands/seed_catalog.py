@@ -0,0 +1,127 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from chatbot import cards, facets, search_index
+from chatbot.catalog_cache import bump_catalog_version
+from chatbot.models import Destination, Hotel, Restaurant, Attraction
+
+CITIES = (
+    ("Hà Nội", "Việt Nam"), ("Hồ Chí Minh", "Việt Nam"), ("Đà Nẵng", "Việt Nam"), ("Hội An", "Việt Nam"),
+    ("Huế", "Việt Nam"), ("Nha Trang", "Việt Nam"), ("Đà Lạt", "Việt Nam"), ("Phú Quốc", "Việt Nam"),
+    ("Sa Pa", "Việt Nam"), ("Hạ Long", "Việt Nam"), ("Cần Thơ", "Việt Nam"), ("Quy Nhơn", "Việt Nam"),
+    ("Bangkok", "Thái Lan"), ("Chiang Mai", "Thái Lan"), ("Singapore", "Singapore"), ("Bali", "Indonesia"),
+    ("Tokyo", "Nhật Bản"), ("Kyoto", "Nhật Bản"), ("Seoul", "Hàn Quốc"), ("Paris", "Pháp"),
+)
+PLACES = ("Phố cổ", "Chợ đêm", "Bãi biển", "Núi", "Hồ", "Công viên", "Làng nghề", "Chùa", "Bảo tàng", "Đảo")
+HOTEL_WORDS = ("Grand", "Riverside", "Sunrise", "Lotus", "Heritage", "Ocean", "Boutique", "Palace", "Garden")
+AMENITIES = ("wifi", "hồ bơi", "spa", "gym", "nhà hàng", "bar", "đưa đón sân bay", "bãi đỗ xe", "view biển")
+CUISINES = ("Việt Nam", "Hải sản", "Chay", "Nhật Bản", "Hàn Quốc", "Ý", "Thái", "Đường phố")
+DISHES = ("phở bò", "bún chả", "cao lầu", "bánh xèo", "gỏi cuốn", "cơm gà", "mì Quảng", "lẩu hải sản")
+MONTHS = ("Tháng 1-3", "Tháng 2-4", "Tháng 3-8", "Tháng 9-11", "Tháng 10-12", "Quanh năm")
+
+
+class Command(BaseCommand):
+    help = "Tạo catalog giả lập (Destination/Hotel/Restaurant/Attraction) để benchmark"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--destinations', type=int, default=1000)
+        parser.add_argument('--hotels-per-destination', type=int, default=10)
+        parser.add_argument('--restaurants-per-destination', type=int, default=5)
+        parser.add_argument('--attractions-per-destination', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42, help="Seed ngẫu nhiên (cùng seed -> cùng dữ liệu)")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear', action='store_true', help="Xóa catalog hiện có trước khi tạo")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        start = time.time()
+
+        with transaction.atomic():
+            if options['clear']:
+                Destination.objects.all().delete()
+
+            destinations = Destination.objects.bulk_create(
+                [self._destination(rng, i) for i in range(options['destinations'])], batch_size=batch_size
+            )
+            counts = {"destinations": len(destinations)}
+            for model, per_destination, factory in (
+                (Hotel, options['hotels_per_destination'], self._hotel),
+                (Restaurant, options['restaurants_per_destination'], self._restaurant),
+                (Attraction, options['attractions_per_destination'], self._attraction),
+            ):
+                counts[model._meta.model_name] = 0
+                batch = []
+                for destination in destinations:
+                    for i in range(per_destination):
+                        batch.append(factory(rng, destination, i))
+                        if len(batch) >= batch_size:
+                            model.objects.bulk_create(batch)
+                            counts[model._meta.model_name] += len(batch)
+                            batch = []
+                model.objects.bulk_create(batch)
+                counts[model._meta.model_name] += len(batch)
+
+            # bulk_create không gửi signal: tự cập nhật index/facet/cache
+            facets.rebuild_facets()
+            cards.rebuild_cards([destination.pk for destination in destinations])
+            if connection.vendor == 'sqlite' and search_index.is_available():
+                search_index.rebuild(Destination.objects.all(), Hotel.objects.all(), batch_size=batch_size)
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Đã tạo {counts} trong {time.time() - start:.2f}s"
+        ))
+
+    @staticmethod
+    def _destination(rng, i):
+        city, country = rng.choice(CITIES)
+        place = rng.choice(PLACES)
+        return Destination(
+            name=f"{place} {city} {i}",
+            city=city,
+            country=country,
+            description=f"{place} nổi tiếng tại {city}, phù hợp cho du khách yêu thích khám phá và ẩm thực địa phương.",
+            best_time_to_visit=rng.choice(MONTHS),
+            average_cost=round(rng.uniform(15, 200), 2),
+            rating=round(rng.uniform(3.0, 5.0), 1),
+        )
+
+    @staticmethod
+    def _hotel(rng, destination, i):
+        hotel = Hotel(
+            name=f"{rng.choice(HOTEL_WORDS)} {destination.city} Hotel {destination.pk}-{i}",
+            destination=destination,
+            address=f"{rng.randint(1, 300)} đường số {rng.randint(1, 50)}, {destination.city}",
+            star_rating=rng.randint(1, 5),
+            price_per_night=round(rng.uniform(10, 500), 2),
+            amenities=",".join(rng.sample(AMENITIES, rng.randint(2, 5))),
+            rating=round(rng.uniform(2.5, 5.0), 1),
+        )
+        hotel.amenity_bits = facets.amenity_bits(hotel.amenities)
+        return hotel
+
+    @staticmethod
+    def _restaurant(rng, destination, i):
+        return Restaurant(
+            name=f"Nhà hàng {rng.choice(DISHES).title()} {destination.pk}-{i}",
+            destination=destination,
+            cuisine_type=rng.choice(CUISINES),
+            price_range=rng.choice(("$", "$$", "$$$", "$$$$")),
+            specialty=", ".join(rng.sample(DISHES, 2)),
+            rating=round(rng.uniform(2.5, 5.0), 1),
+        )
+
+    @staticmethod
+    def _attraction(rng, destination, i):
+        place = rng.choice(PLACES)
+        return Attraction(
+            name=f"{place} {destination.city} {destination.pk}-{i}",
+            destination=destination,
+            category=rng.choice(("historical", "natural", "cultural", "adventure", "entertainment")),
+            description=f"{place} đẹp ở {destination.city}, nên đến vào buổi sáng sớm để tránh đông.",
+            entry_fee=round(rng.uniform(0, 50), 2),
+            opening_hours=rng.choice(("7:00-17:00", "8:00-22:00", "Cả ngày")),
+            rating=round(rng.uniform(2.5, 5.0), 1),
+        )
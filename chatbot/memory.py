@@ -0,0 +1,229 @@
+# Bộ nhớ hội thoại: N lượt gần nhất nguyên văn + tóm tắt cuộn của các lượt cũ hơn
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.db import connections
+from django.utils.dateparse import parse_datetime
+from . import llm
+from .chat_buffer import pending_chats
+from .config import MEMORY_SETTINGS
+from .models import ChatHistory, ConversationMemory
+from .prompt import count_tokens, truncate_to_tokens
+
+SUMMARY_PROMPT = (
+    "Bạn cập nhật bản tóm tắt cuộc trò chuyện giữa người dùng và trợ lý du lịch. "
+    "Giữ lại các thông tin cần cho câu hỏi tiếp theo: điểm đến, ngày đi, số người, ngân sách, "
+    "sở thích, các gợi ý đã đưa ra và quyết định của người dùng. Viết ngắn gọn, gạch đầu dòng, "
+    "không quá {max_tokens} token."
+)
+ERROR_PREFIX = "ERROR: "
+
+# Dấu hiệu câu hỏi nối tiếp, chỉ hiểu được khi có hội thoại trước ("còn khách sạn ở đó thì sao?")
+FOLLOW_UP_WORDS = frozenset((
+    "đó", "đấy", "này", "kia", "ấy", "nó", "họ", "vậy", "thế", "nữa", "khác", "hơn", "trên",
+    "it", "that", "this", "these", "those", "there", "them", "they", "else",
+))
+FOLLOW_UP_PHRASES = ("thì sao", "what about", "how about")
+FOLLOW_UP_MIN_WORDS = 4  # câu quá ngắn ("bao nhiêu?", "rẻ không?") cũng coi là nối tiếp
+_WORD = re.compile(r"\w+")
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-memory")
+
+
+class Memory:
+    """Trạng thái bộ nhớ của một phiên: summary + các lượt (user, bot, timestamp iso) cũ -> mới"""
+
+    def __init__(self, summary="", until=None, turns=None):
+        self.summary = summary
+        self.until = until
+        self.turns = turns or []
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+    def history_messages(self):
+        messages = []
+        for user_message, bot_response, _ in self.turns:
+            messages.append({"role": "user", "content": user_message})
+            messages.append({"role": "assistant", "content": bot_response})
+        return messages
+
+    @property
+    def last_user_message(self):
+        return self.turns[-1][0] if self.turns else ""
+
+
+def is_follow_up(message):
+    """Câu hỏi có phụ thuộc ngữ cảnh hội thoại trước không (đại từ, từ chỉ định, câu cụt)"""
+    text = message.lower()
+    words = _WORD.findall(text)
+    if len(words) < FOLLOW_UP_MIN_WORDS or words[0] == "còn":
+        return True
+    return any(word in FOLLOW_UP_WORDS for word in words) or any(p in text for p in FOLLOW_UP_PHRASES)
+
+
+def _cache_key(session_id):
+    return f"chat_memory:{session_id}"
+
+
+@contextmanager
+def _session_lock(session_id, wait=1.0):
+    """Khóa ngắn theo phiên (cache.add) cho thao tác đọc-sửa-ghi trạng thái trong cache"""
+    lock_key = f"chat_memory_lock:{session_id}"
+    deadline = time.time() + wait
+    acquired = cache.add(lock_key, 1, 10)
+    while not acquired and time.time() < deadline:
+        time.sleep(0.01)
+        acquired = cache.add(lock_key, 1, 10)
+    try:
+        yield  # hết thời gian chờ vẫn tiếp tục (best effort), không chặn câu trả lời
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+def _turn(user_message, bot_response, timestamp):
+    return [user_message, bot_response[:MEMORY_SETTINGS['TURN_MAX_CHARS']], timestamp.isoformat()]
+
+
+def _load_from_db(session_id):
+    """Trạng thái từ DB khi cache không có: summary (theo unique index) + các lượt sau mốc đã tóm tắt"""
+    state = {"summary": "", "until": None, "turns": []}
+    row = ConversationMemory.objects.filter(session_id=session_id).values_list(
+        "summary", "summarized_until"
+    ).first()
+    # Chỉ các lượt model trả lời: lượt lỗi, lượt trả lời từ cache/mẫu câu không vào bộ nhớ
+    history = ChatHistory.objects.filter(session_id=session_id, is_cached=False, intent="").exclude(
+        bot_response__startswith=ERROR_PREFIX
+    )
+    if row:
+        state["summary"] = row[0]
+        if row[1] is not None:
+            state["until"] = row[1].isoformat()
+            history = history.filter(timestamp__gt=row[1])
+
+    max_turns = MEMORY_SETTINGS['RECENT_TURNS'] + MEMORY_SETTINGS['FOLD_BATCH']
+    # Lượt vừa chat có thể còn trong write-behind buffer; lấy trước khi đọc DB để lượt được
+    # flush giữa hai lần đọc không bị mất
+    pending = pending_chats(session_id=session_id)
+    rows = list(history.order_by("-timestamp").values_list("user_message", "bot_response", "timestamp")[:max_turns])
+    turns = [_turn(*r) for r in reversed(rows)]
+    seen = {t[2] for t in turns}
+    for chat in pending:
+        turn = _turn(chat.user_message, chat.bot_response, chat.timestamp)
+        if turn[2] in seen or chat.is_cached or chat.intent or chat.bot_response.startswith(ERROR_PREFIX):
+            continue
+        if _after(turn[2], state["until"]):
+            turns.append(turn)
+    state["turns"] = turns[-max_turns:]
+    return state
+
+
+def _after(timestamp, until):
+    return until is None or parse_datetime(timestamp) > parse_datetime(until)
+
+
+def _get_state(session_id):
+    state = cache.get(_cache_key(session_id))
+    if state is None:
+        state = _load_from_db(session_id)
+        cache.set(_cache_key(session_id), state, MEMORY_SETTINGS['CACHE_TIMEOUT'])
+    return state
+
+
+def load_memory(session_id):
+    """Bộ nhớ của phiên: một lần đọc cache (hoặc truy vấn theo index khi cache trống)"""
+    if not MEMORY_SETTINGS['ENABLED'] or not session_id:
+        return Memory()
+    state = _get_state(session_id)
+    return Memory(state["summary"], state["until"], state["turns"][-MEMORY_SETTINGS['RECENT_TURNS']:])
+
+
+def record_turn(session_id, user_message, bot_response, timestamp):
+    """Thêm một lượt vào bộ nhớ; đủ lô thì gộp các lượt cũ vào summary ở thread nền"""
+    if not MEMORY_SETTINGS['ENABLED'] or not session_id:
+        return
+    with _session_lock(session_id):
+        state = _get_state(session_id)
+        turn = _turn(user_message, bot_response, timestamp)
+        if all(t[2] != turn[2] for t in state["turns"]):
+            state["turns"].append(turn)
+        cache.set(_cache_key(session_id), state, MEMORY_SETTINGS['CACHE_TIMEOUT'])
+        needs_fold = len(state["turns"]) >= MEMORY_SETTINGS['RECENT_TURNS'] + MEMORY_SETTINGS['FOLD_BATCH']
+    if needs_fold:
+        _executor.submit(_fold_in_background, session_id)
+
+
+def clear_memory(session_id):
+    cache.delete(_cache_key(session_id))
+    ConversationMemory.objects.filter(session_id=session_id).delete()
+
+
+def _fold_in_background(session_id):
+    try:
+        fold(session_id)
+    except Exception as e:
+        print(f"Conversation memory fold error: {str(e)}")
+    finally:
+        connections.close_all()
+
+
+def fold(session_id):
+    """Gộp các lượt cũ hơn RECENT_TURNS vào summary (cập nhật dần, không tóm tắt lại từ đầu)"""
+    fold_lock = f"chat_memory_fold:{session_id}"
+    if not cache.add(fold_lock, 1, 120):
+        return False  # phiên này đang được gộp ở thread/process khác
+    try:
+        state = cache.get(_cache_key(session_id))
+        if not state:
+            return False
+        to_fold = state["turns"][:-MEMORY_SETTINGS['RECENT_TURNS']]
+        if not to_fold:
+            return False
+        # Gọi model ngoài khóa phiên để không chặn các lượt chat mới
+        summary = summarize(state["summary"], to_fold)
+        until = to_fold[-1][2]
+
+        with _session_lock(session_id):
+            state = cache.get(_cache_key(session_id)) or state
+            state["summary"] = summary
+            state["until"] = until
+            state["turns"] = [t for t in state["turns"] if _after(t[2], until)]
+            cache.set(_cache_key(session_id), state, MEMORY_SETTINGS['CACHE_TIMEOUT'])
+        ConversationMemory.objects.update_or_create(
+            session_id=session_id,
+            defaults={"summary": summary, "summarized_until": parse_datetime(until)},
+        )
+        return True
+    finally:
+        cache.delete(fold_lock)
+
+
+def summarize(previous_summary, turns):
+    """Summary mới = summary cũ + các lượt mới, tối đa SUMMARY_MAX_TOKENS"""
+    max_tokens = MEMORY_SETTINGS['SUMMARY_MAX_TOKENS']
+    if llm.is_configured():
+        conversation = "\n".join(f"Người dùng: {u}\nTrợ lý: {b}" for u, b, _ in turns)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=max_tokens)},
+            {"role": "user", "content": (
+                f"Tóm tắt hiện tại:\n{previous_summary or '(chưa có)'}\n\n"
+                f"Các lượt mới:\n{conversation}\n\nTóm tắt đã cập nhật:"
+            )},
+        ]
+        try:
+            summary = llm.complete(messages, max_tokens=max_tokens, temperature=0.2)
+            if summary:
+                return truncate_to_tokens(summary.strip(), max_tokens)
+        except Exception as e:
+            print(f"Conversation summary error: {str(e)}")
+
+    # Không có model: tóm tắt trích xuất, giữ các câu hỏi mới nhất vừa ngân sách
+    lines = [line for line in previous_summary.splitlines() if line.strip()]
+    lines += [f"- Người dùng hỏi: {u[:200]}" for u, _, _ in turns]
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        # Giữ câu hỏi đầu tiên (thường nêu điểm đến/mục đích chuyến đi)
+        lines.pop(1 if len(lines) > 2 else 0)
+    return truncate_to_tokens("\n".join(lines), max_tokens)
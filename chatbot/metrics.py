@@ -0,0 +1,235 @@
+# Đo thời gian theo từng phase của request (Server-Timing) và metrics trong process (Prometheus)
+import bisect
+import contextvars
+import threading
+import time
+
+# Bucket (giây) cho latency: từ 1ms tới 60s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+
+class _Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class MetricFamily:
+    """Một metric có thể có nhãn; mỗi bộ giá trị nhãn là một series riêng"""
+
+    def __init__(self, kind, name, documentation, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = _Histogram(self.buckets) if self.kind == "histogram" else _Counter()
+                    self._children[values] = child
+        return child
+
+    # Metric không nhãn
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _label_text(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            if self.kind == "histogram":
+                with child._lock:
+                    counts, total, count = list(child.counts), child.sum, child.count
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{self._label_text(values, ('le', le))} {cumulative}")
+                lines.append(f"{self.name}_sum{self._label_text(values)} {total}")
+                lines.append(f"{self.name}_count{self._label_text(values)} {count}")
+            else:
+                lines.append(f"{self.name}{self._label_text(values)} {child.value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._gauges = []  # (name, documentation, callback)
+
+    def _register(self, family):
+        self._families.setdefault(family.name, family)
+        return self._families[family.name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(MetricFamily("counter", name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(MetricFamily("histogram", name, documentation, labelnames, tuple(buckets)))
+
+    def gauge_callback(self, name, documentation, callback):
+        """Gauge đọc giá trị lúc scrape (vd. số bản ghi đang chờ trong buffer)"""
+        self._gauges.append((name, documentation, callback))
+
+    def render(self):
+        """Prometheus text exposition format 0.0.4"""
+        lines = []
+        for family in self._families.values():
+            lines.extend(family.render())
+        for name, documentation, callback in self._gauges:
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Metrics gauge error ({name}): {str(e)}")
+                continue
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "chatbot_request_duration_seconds", "Thời gian xử lý request theo view", ("view", "method", "status"))
+PHASE_SECONDS = REGISTRY.histogram(
+    "chatbot_phase_duration_seconds", "Thời gian theo phase của request", ("phase",))
+DB_QUERIES = REGISTRY.counter("chatbot_db_queries_total", "Số câu truy vấn DB")
+CACHE_REQUESTS = REGISTRY.counter(
+    "chatbot_cache_requests_total", "Lượt tra cache theo loại và kết quả", ("cache", "result"))
+LLM_SECONDS = REGISTRY.histogram(
+    "chatbot_llm_duration_seconds", "Thời gian gọi model (không gồm chờ slot)", ("mode",))
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "chatbot_llm_first_token_seconds", "Thời gian tới token đầu tiên khi stream")
+LLM_REQUESTS = REGISTRY.counter("chatbot_llm_requests_total", "Lượt gọi model theo kết quả", ("mode", "result"))
+LLM_COALESCED = REGISTRY.counter(
+    "chatbot_llm_coalesced_total", "Lượt gọi model tiết kiệm được nhờ dùng chung lời gọi đang chạy", ("scope",))
+LLM_CIRCUIT_EVENTS = REGISTRY.counter(
+    "chatbot_llm_circuit_events_total", "Chuyển trạng thái breaker và lượt gọi bị từ chối theo model", ("model", "event"))
+LLM_HEDGES = REGISTRY.counter("chatbot_llm_hedges_total", "Số bản sao hedge đã gửi theo model", ("model",))
+LLM_FALLBACKS = REGISTRY.counter("chatbot_llm_fallbacks_total", "Số lần phải gọi model dự phòng", ("model",))
+LLM_DEGRADED = REGISTRY.counter(
+    "chatbot_llm_degraded_replies_total", "Câu trả lời dự phòng khi không gọi được model, theo nguồn", ("source",))
+LLM_TOKENS = REGISTRY.counter("chatbot_llm_tokens_total", "Số token gửi/nhận từ model", ("kind",))
+PROMPT_TOKENS = REGISTRY.histogram(
+    "chatbot_prompt_tokens", "Số token prompt theo phần", ("section",), buckets=TOKEN_BUCKETS)
+INTENT_ROUTED = REGISTRY.counter(
+    "chatbot_intent_routed_total", "Câu hỏi trả lời bằng mẫu câu theo ý định (llm = phải gọi model)", ("intent",))
+CHAT_BUFFER_REJECTED = REGISTRY.counter(
+    "chatbot_chat_buffer_rejected_total", "Lượt chat không ghi được xuống DB, bỏ khỏi buffer", ("action",))
+RETENTION_ROWS = REGISTRY.counter(
+    "chatbot_chat_retention_rows_total", "Số bản ghi lịch sử chat đã chuyển/xóa theo lý do", ("reason", "action"))
+
+
+# --- Đo theo request ----------------------------------------------------------
+
+# dict phase -> tổng giây của request hiện tại (None ngoài request)
+_request_timings = contextvars.ContextVar("chatbot_request_timings", default=None)
+
+
+def start_request():
+    """Bắt đầu ghi timing cho request hiện tại; trả về token để reset"""
+    return _request_timings.set({})
+
+
+def end_request(token):
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    return timings or {}
+
+
+def record(phase, seconds):
+    """Ghi một phase: vào histogram và (nếu đang trong request) vào Server-Timing"""
+    PHASE_SECONDS.labels(phase).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+class span:
+    """Đo một đoạn code: `with metrics.span("context"): ...` (chỉ vài µs mỗi lần)"""
+
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+def record_db_time(execute, sql, params, many, context):
+    """execute_wrapper cho mọi connection: cộng thời gian truy vấn vào phase "db" """
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        DB_QUERIES.inc()
+        timings = _request_timings.get()
+        if timings is not None:
+            timings["db"] = timings.get("db", 0.0) + time.perf_counter() - start
+
+
+def install_db_timer(sender, connection, **kwargs):
+    """Receiver connection_created: gắn record_db_time một lần cho mỗi connection"""
+    if record_db_time not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_db_time)
+
+
+def server_timing_header(timings, total):
+    parts = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+def cache_result(cache_name, hit):
+    CACHE_REQUESTS.labels(cache_name, "hit" if hit else "miss").inc()
@@ -0,0 +1,83 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from . import metrics
+from .config import CHAT_SESSION_SETTINGS, METRICS_SETTINGS
+
+
+class ServerTimingMiddleware:
+    """Đo thời gian từng request: header Server-Timing theo phase và histogram theo view"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = metrics.end_request(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        if "db" in timings:
+            metrics.PHASE_SECONDS.labels("db").observe(timings["db"])
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unmatched"
+        metrics.REQUEST_SECONDS.labels(view, request.method, str(response.status_code)).observe(total)
+        if METRICS_SETTINGS['SERVER_TIMING']:
+            # Response stream: chỉ gồm các phase trước khi gửi header (LLM đo riêng trong histogram)
+            response["Server-Timing"] = metrics.server_timing_header(timings, total)
+        return response
+
+
+class ChatSessionMiddleware:
+    """Gửi token mới (cookie + header) hoặc xóa cookie sau khi view xử lý xong"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._finish(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._finish(request, await self.get_response(request))
+
+    def _finish(self, request, response):
+        session = getattr(request, "_chat_session", None)
+        if session is not None and session.token:
+            response.set_cookie(
+                CHAT_SESSION_SETTINGS['COOKIE_NAME'], session.token,
+                max_age=CHAT_SESSION_SETTINGS['MAX_AGE'],
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+            response[CHAT_SESSION_SETTINGS['HEADER']] = session.token
+        elif getattr(request, "_chat_session_cleared", False):
+            response.delete_cookie(CHAT_SESSION_SETTINGS['COOKIE_NAME'], samesite=settings.SESSION_COOKIE_SAMESITE)
+        return response
@@ -0,0 +1,224 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:58
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_auto_20251001_2227'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preferred_language', models.CharField(choices=[('vi', 'Tiếng Việt'), ('en', 'English')], default='vi', max_length=10)),
+                ('travel_preferences', models.TextField(blank=True, verbose_name='Sở thích du lịch')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Hồ sơ người dùng',
+                'verbose_name_plural': 'Hồ sơ người dùng',
+            },
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='attraction',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='chathistory',
+            name='response_time',
+            field=models.FloatField(blank=True, null=True, verbose_name='Thời gian phản hồi (giây)'),
+        ),
+        migrations.AddField(
+            model_name='destination',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='attraction',
+            name='description',
+            field=models.TextField(validators=[django.core.validators.MinLengthValidator(10)], verbose_name='Mô tả'),
+        ),
+        migrations.AlterField(
+            model_name='attraction',
+            name='entry_fee',
+            field=models.DecimalField(decimal_places=2, max_digits=8, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Giá vé (USD)'),
+        ),
+        migrations.AlterField(
+            model_name='attraction',
+            name='name',
+            field=models.CharField(max_length=200, validators=[django.core.validators.MinLengthValidator(2)], verbose_name='Tên điểm tham quan'),
+        ),
+        migrations.AlterField(
+            model_name='attraction',
+            name='rating',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(5.0)], verbose_name='Đánh giá'),
+        ),
+        migrations.AlterField(
+            model_name='chathistory',
+            name='session_id',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='ID phiên'),
+        ),
+        migrations.AlterField(
+            model_name='chathistory',
+            name='user_message',
+            field=models.TextField(validators=[django.core.validators.MinLengthValidator(1)], verbose_name='Tin nhắn người dùng'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='average_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0.01)], verbose_name='Chi phí trung bình/ngày (USD)'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='city',
+            field=models.CharField(max_length=100, validators=[django.core.validators.MinLengthValidator(2)], verbose_name='Thành phố'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='country',
+            field=models.CharField(max_length=100, validators=[django.core.validators.MinLengthValidator(2)], verbose_name='Quốc gia'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='description',
+            field=models.TextField(validators=[django.core.validators.MinLengthValidator(10)], verbose_name='Mô tả'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='name',
+            field=models.CharField(max_length=200, validators=[django.core.validators.MinLengthValidator(2)], verbose_name='Tên điểm đến'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='rating',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(5.0)], verbose_name='Đánh giá'),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='address',
+            field=models.TextField(validators=[django.core.validators.MinLengthValidator(5)], verbose_name='Địa chỉ'),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='name',
+            field=models.CharField(max_length=200, validators=[django.core.validators.MinLengthValidator(2)], verbose_name='Tên khách sạn'),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='price_per_night',
+            field=models.DecimalField(decimal_places=2, max_digits=8, validators=[django.core.validators.MinValueValidator(0.01)], verbose_name='Giá/đêm (USD)'),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='rating',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(5.0)], verbose_name='Đánh giá'),
+        ),
+        migrations.AlterField(
+            model_name='hotel',
+            name='star_rating',
+            field=models.IntegerField(choices=[(1, '1 sao'), (2, '2 sao'), (3, '3 sao'), (4, '4 sao'), (5, '5 sao')], validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)], verbose_name='Hạng sao'),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='cuisine_type',
+            field=models.CharField(max_length=100, validators=[django.core.validators.MinLengthValidator(2)], verbose_name='Loại ẩm thực'),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='name',
+            field=models.CharField(max_length=200, validators=[django.core.validators.MinLengthValidator(2)], verbose_name='Tên nhà hàng'),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='rating',
+            field=models.FloatField(default=0, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(5.0)], verbose_name='Đánh giá'),
+        ),
+        migrations.AlterField(
+            model_name='restaurant',
+            name='specialty',
+            field=models.TextField(validators=[django.core.validators.MinLengthValidator(5)], verbose_name='Món đặc trưng'),
+        ),
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['destination', 'category'], name='chatbot_att_destina_26f874_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attraction',
+            index=models.Index(fields=['rating'], name='chatbot_att_rating_ad2b9f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['session_id', 'timestamp'], name='chatbot_cha_session_6e6b9b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chathistory',
+            index=models.Index(fields=['user', 'timestamp'], name='chatbot_cha_user_id_d766cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='destination',
+            index=models.Index(fields=['rating'], name='chatbot_des_rating_7bcbf6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='destination',
+            index=models.Index(fields=['country', 'city'], name='chatbot_des_country_617ad1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['destination', 'star_rating'], name='chatbot_hot_destina_1ee07a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['rating'], name='chatbot_hot_rating_835670_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['destination', 'cuisine_type'], name='chatbot_res_destina_6e6b00_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['rating'], name='chatbot_res_rating_81625e_idx'),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
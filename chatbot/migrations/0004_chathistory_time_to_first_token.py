@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_sync_model_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chathistory',
+            name='time_to_first_token',
+            field=models.FloatField(blank=True, null=True, verbose_name='Thời gian tới token đầu tiên (giây)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_chathistory_time_to_first_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chathistory',
+            name='is_cached',
+            field=models.BooleanField(default=False, verbose_name='Trả lời từ cache'),
+        ),
+    ]
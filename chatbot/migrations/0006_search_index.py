@@ -0,0 +1,88 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Bản sao cố định của schema/cách bỏ dấu trong chatbot.search_index và chatbot.text tại thời điểm
+# tạo migration: migration không import code của app để không đổi theo các lần sửa sau này
+DESTINATION_FTS = "chatbot_destination_fts"
+HOTEL_FTS = "chatbot_hotel_fts"
+BATCH_SIZE = 1000
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_D_TABLE = str.maketrans({"đ": "d", "Đ": "D"})
+
+
+def fold_text(text):
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", text.translate(_D_TABLE))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _NON_WORD.sub(" ", text.lower())
+    return " ".join(text.split())
+
+
+def _insert_many(cursor, table, columns, rows):
+    if rows:
+        placeholders = ", ".join(["%s"] * len(rows[0]))
+        cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Destination = apps.get_model('chatbot', 'Destination')
+    Hotel = apps.get_model('chatbot', 'Hotel')
+    using = schema_editor.connection.alias
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {DESTINATION_FTS} "
+            f"USING fts5(name, city, country, description, tokenize='unicode61')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {HOTEL_FTS} "
+            f"USING fts5(name, place, tokenize='unicode61')"
+        )
+        cursor.execute(f"DELETE FROM {DESTINATION_FTS}")
+        cursor.execute(f"DELETE FROM {HOTEL_FTS}")
+
+        batch = []
+        destinations = Destination.objects.using(using).values_list('pk', 'name', 'city', 'country', 'description')
+        for pk, *fields in destinations.iterator(chunk_size=BATCH_SIZE):
+            batch.append((pk, *map(fold_text, fields)))
+            if len(batch) >= BATCH_SIZE:
+                _insert_many(cursor, DESTINATION_FTS, "rowid, name, city, country, description", batch)
+                batch = []
+        _insert_many(cursor, DESTINATION_FTS, "rowid, name, city, country, description", batch)
+
+        batch = []
+        hotels = Hotel.objects.using(using).values_list(
+            'pk', 'name', 'destination__name', 'destination__city', 'destination__country')
+        for pk, name, *place in hotels.iterator(chunk_size=BATCH_SIZE):
+            batch.append((pk, fold_text(name), fold_text(" ".join(place))))
+            if len(batch) >= BATCH_SIZE:
+                _insert_many(cursor, HOTEL_FTS, "rowid, name, place", batch)
+                batch = []
+        _insert_many(cursor, HOTEL_FTS, "rowid, name, place", batch)
+
+        cursor.execute(f"INSERT INTO {DESTINATION_FTS} ({DESTINATION_FTS}) VALUES ('optimize')")
+        cursor.execute(f"INSERT INTO {HOTEL_FTS} ({HOTEL_FTS}) VALUES ('optimize')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {DESTINATION_FTS}")
+        cursor.execute(f"DROP TABLE IF EXISTS {HOTEL_FTS}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_chathistory_is_cached'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_chathistory_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMemory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(max_length=100, unique=True, verbose_name='ID phiên')),
+                ('summary', models.TextField(blank=True, verbose_name='Tóm tắt')),
+                ('summarized_until', models.DateTimeField(blank=True, null=True, verbose_name='Đã tóm tắt tới')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Bộ nhớ hội thoại',
+                'verbose_name_plural': 'Bộ nhớ hội thoại',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0008_conversationmemory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedChatHistory',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('session_id', models.CharField(max_length=100, verbose_name='ID phiên')),
+                ('user_message', models.TextField(verbose_name='Tin nhắn người dùng')),
+                ('bot_response', models.TextField(verbose_name='Phản hồi bot')),
+                ('timestamp', models.DateTimeField(verbose_name='Thời gian')),
+                ('response_time', models.FloatField(blank=True, null=True, verbose_name='Thời gian phản hồi (giây)')),
+                ('time_to_first_token', models.FloatField(blank=True, null=True, verbose_name='Thời gian tới token đầu tiên (giây)')),
+                ('is_cached', models.BooleanField(default=False, verbose_name='Trả lời từ cache')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Thời điểm lưu trữ')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lịch sử chat (lưu trữ)',
+                'verbose_name_plural': 'Lịch sử chat (lưu trữ)',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['session_id', 'timestamp'], name='chatbot_arc_session_348fca_idx'), models.Index(fields=['user', 'timestamp'], name='chatbot_arc_user_id_eeb4e8_idx'), models.Index(fields=['archived_at'], name='chatbot_arc_archive_b2b72c_idx')],
+            },
+        ),
+    ]
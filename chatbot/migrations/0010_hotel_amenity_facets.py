@@ -0,0 +1,112 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:33
+
+import re
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Bản sao cố định của bảng tiện nghi/khoảng giá trong chatbot.facets tại thời điểm tạo migration:
+# migration không import code của app (thêm tiện nghi mới thì chạy rebuild_hotel_facets)
+AMENITIES = (
+    ("wifi", ("wifi", "wi-fi", "wi fi", "internet")),
+    ("pool", ("hồ bơi", "bể bơi", "pool", "swimming pool")),
+    ("spa", ("spa", "massage")),
+    ("gym", ("gym", "phòng gym", "phòng tập", "fitness")),
+    ("restaurant", ("nhà hàng", "restaurant")),
+    ("bar", ("bar", "quầy bar", "lounge")),
+    ("airport_shuttle", ("đưa đón sân bay", "xe đưa đón", "airport shuttle")),
+    ("parking", ("bãi đỗ xe", "chỗ đỗ xe", "đỗ xe", "parking")),
+    ("sea_view", ("view biển", "hướng biển", "sea view", "ocean view")),
+    ("beach", ("bãi biển riêng", "private beach")),
+    ("breakfast", ("bữa sáng", "ăn sáng", "breakfast")),
+    ("air_conditioning", ("điều hòa", "máy lạnh", "air conditioning")),
+    ("room_service", ("dịch vụ phòng", "room service")),
+    ("kids_club", ("khu vui chơi trẻ em", "kids club")),
+    ("pet_friendly", ("thú cưng", "pet friendly")),
+)
+_AMENITY_PATTERNS = [
+    (key, 1 << bit, re.compile(r"(?<!\w)(?:" + "|".join(re.escape(a) for a in aliases) + r")(?!\w)"))
+    for bit, (key, aliases) in enumerate(AMENITIES)
+]
+PRICE_BUCKETS = (50, 100, 200, 500)
+ALL_SCOPE = 0
+BATCH_SIZE = 1000
+
+
+def amenity_bits(text):
+    text = " ".join((text or "").casefold().split())
+    return sum(bit for _, bit, pattern in _AMENITY_PATTERNS if pattern.search(text))
+
+
+def price_bucket(price):
+    price = Decimal(price)
+    lower = 0
+    for upper in PRICE_BUCKETS:
+        if price < upper:
+            return f"{lower}-{upper}"
+        lower = upper
+    return f"{lower}+"
+
+
+def backfill_amenities(apps, schema_editor):
+    Hotel = apps.get_model('chatbot', 'Hotel')
+    HotelFacet = apps.get_model('chatbot', 'HotelFacet')
+    using = schema_editor.connection.alias
+    counts = {}
+    batch = []
+    hotels = Hotel.objects.using(using).only('pk', 'destination_id', 'star_rating', 'price_per_night', 'amenities')
+    for hotel in hotels.iterator(chunk_size=BATCH_SIZE):
+        hotel.amenity_bits = amenity_bits(hotel.amenities)
+        values = [("star_rating", str(hotel.star_rating)), ("price", price_bucket(hotel.price_per_night))]
+        values += [("amenity", key) for key, bit, _ in _AMENITY_PATTERNS if hotel.amenity_bits & bit]
+        for facet, value in values:
+            for key in ((hotel.destination_id, facet, value), (ALL_SCOPE, facet, value)):
+                counts[key] = counts.get(key, 0) + 1
+        batch.append(hotel)
+        if len(batch) >= BATCH_SIZE:
+            Hotel.objects.using(using).bulk_update(batch, ['amenity_bits'])
+            batch = []
+    Hotel.objects.using(using).bulk_update(batch, ['amenity_bits'])
+    HotelFacet.objects.using(using).all().delete()
+    HotelFacet.objects.using(using).bulk_create(
+        [HotelFacet(scope=scope, facet=facet, value=value, count=n) for (scope, facet, value), n in counts.items()],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0009_archivedchathistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotelFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.IntegerField(verbose_name='Phạm vi')),
+                ('facet', models.CharField(max_length=20, verbose_name='Facet')),
+                ('value', models.CharField(max_length=50, verbose_name='Giá trị')),
+                ('count', models.IntegerField(default=0, verbose_name='Số khách sạn')),
+            ],
+            options={
+                'verbose_name': 'Facet khách sạn',
+                'verbose_name_plural': 'Facet khách sạn',
+            },
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='amenity_bits',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Tiện nghi (bitset)'),
+        ),
+        migrations.AddIndex(
+            model_name='hotel',
+            index=models.Index(fields=['star_rating', 'price_per_night'], name='chatbot_hot_star_ra_df7c7b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='hotelfacet',
+            constraint=models.UniqueConstraint(fields=('scope', 'facet', 'value'), name='unique_hotel_facet'),
+        ),
+        migrations.RunPython(backfill_amenities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,126 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+
+# Bản sao cố định của cách dựng card trong chatbot.cards tại thời điểm tạo migration: migration không
+# import code của app (đổi định dạng card sau này thì chạy rebuild_destination_cards)
+TOP_N = 5
+TEXT_TOP_N = 3
+CHUNK_SIZE = 500
+
+
+def _top_rows(model, columns, destination_ids, using):
+    rows = model.objects.using(using).filter(destination_id__in=destination_ids).order_by('destination_id', '-rating', 'pk')
+    top = {}
+    for row in rows.values_list('pk', 'destination_id', *columns):
+        items = top.setdefault(row[1], [])
+        if len(items) < TOP_N:
+            items.append(dict(zip(('id', *columns), (row[0], *row[2:]))))
+    return top
+
+
+def _stats(model, price_field, destination_ids, using):
+    aggregates = {'n': Count('pk')}
+    if price_field:
+        aggregates.update(low=Min(price_field), high=Max(price_field))
+    rows = model.objects.using(using).filter(destination_id__in=destination_ids).order_by()
+    stats = {}
+    for row in rows.values('destination_id').annotate(**aggregates):
+        price = [float(row['low']), float(row['high'])] if price_field and row['n'] else None
+        stats[row['destination_id']] = (row['n'], price)
+    return stats
+
+
+def _card_text(data, categories):
+    lines = [
+        f"Điểm đến: {data['name']} ({data['city']}, {data['country']}) - đánh giá {data['rating']:.1f}/5, "
+        f"chi phí ~{data['average_cost']:.0f} USD/ngày, thời điểm đẹp: {data['best_time']}"
+    ]
+    if data['hotels']:
+        low, high = data['hotel_price']
+        lines.append(f"Khách sạn ({data['hotel_count']}, {low:.0f}-{high:.0f} USD/đêm): " + "; ".join(
+            f"{h['name']} {h['star_rating']} sao {h['price_per_night']:.0f} USD {h['rating']:.1f}/5"
+            for h in data['hotels'][:TEXT_TOP_N]
+        ))
+    if data['restaurants']:
+        lines.append(f"Nhà hàng ({data['restaurant_count']}): " + "; ".join(
+            f"{r['name']} ({r['cuisine_type']}, {r['price_range']}) {r['rating']:.1f}/5"
+            for r in data['restaurants'][:TEXT_TOP_N]
+        ))
+    if data['attractions']:
+        low, high = data['entry_fee']
+        lines.append(f"Tham quan ({data['attraction_count']}, vé {low:.0f}-{high:.0f} USD): " + "; ".join(
+            f"{a['name']} ({categories.get(a['category'], a['category'])}) {a['rating']:.1f}/5"
+            for a in data['attractions'][:TEXT_TOP_N]
+        ))
+    return "\n  ".join(lines)
+
+
+def build_cards(apps, schema_editor):
+    Destination = apps.get_model('chatbot', 'Destination')
+    Hotel = apps.get_model('chatbot', 'Hotel')
+    Restaurant = apps.get_model('chatbot', 'Restaurant')
+    Attraction = apps.get_model('chatbot', 'Attraction')
+    DestinationCard = apps.get_model('chatbot', 'DestinationCard')
+    using = schema_editor.connection.alias
+    categories = dict(Attraction._meta.get_field('category').choices)
+    destination_ids = list(Destination.objects.using(using).order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(destination_ids), CHUNK_SIZE):
+        chunk = destination_ids[i:i + CHUNK_SIZE]
+        hotels = _top_rows(Hotel, ('name', 'star_rating', 'price_per_night', 'rating'), chunk, using)
+        restaurants = _top_rows(Restaurant, ('name', 'cuisine_type', 'price_range', 'rating'), chunk, using)
+        attractions = _top_rows(Attraction, ('name', 'category', 'entry_fee', 'rating'), chunk, using)
+        hotel_stats = _stats(Hotel, 'price_per_night', chunk, using)
+        restaurant_stats = _stats(Restaurant, None, chunk, using)
+        attraction_stats = _stats(Attraction, 'entry_fee', chunk, using)
+        cards = []
+        for destination in Destination.objects.using(using).filter(pk__in=chunk).order_by():
+            pk, description = destination.pk, destination.description
+            hotel_count, hotel_price = hotel_stats.get(pk, (0, None))
+            attraction_count, entry_fee = attraction_stats.get(pk, (0, None))
+            data = {
+                'id': pk,
+                'name': destination.name,
+                'city': destination.city,
+                'country': destination.country,
+                'description': description[:200] + "..." if len(description) > 200 else description,
+                'rating': destination.rating,
+                'average_cost': float(destination.average_cost),
+                'best_time': destination.best_time_to_visit,
+                'hotel_count': hotel_count,
+                'hotel_price': hotel_price,
+                'hotels': [dict(h, price_per_night=float(h['price_per_night'])) for h in hotels.get(pk, ())],
+                'restaurant_count': restaurant_stats.get(pk, (0, None))[0],
+                'restaurants': restaurants.get(pk, []),
+                'attraction_count': attraction_count,
+                'entry_fee': entry_fee,
+                'attractions': [dict(a, entry_fee=float(a['entry_fee'])) for a in attractions.get(pk, ())],
+            }
+            cards.append(DestinationCard(destination_id=pk, data=data, text=_card_text(data, categories)))
+        DestinationCard.objects.using(using).bulk_create(cards)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0011_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DestinationCard',
+            fields=[
+                ('destination', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='chatbot.destination')),
+                ('data', models.JSONField(default=dict, verbose_name='Dữ liệu')),
+                ('text', models.TextField(blank=True, verbose_name='Tóm tắt')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Thẻ điểm đến',
+                'verbose_name_plural': 'Thẻ điểm đến',
+            },
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
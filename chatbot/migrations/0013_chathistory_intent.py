@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0012_destination_cards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedchathistory',
+            name='intent',
+            field=models.CharField(blank=True, default='', max_length=30, verbose_name='Ý định (trả lời bằng mẫu câu)'),
+        ),
+        migrations.AddField(
+            model_name='chathistory',
+            name='intent',
+            field=models.CharField(blank=True, default='', max_length=30, verbose_name='Ý định (trả lời bằng mẫu câu)'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator, MinLengthValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 # Create your models here.
 
@@ -41,6 +42,19 @@ class Destination(models.Model):
         verbose_name="Đánh giá",
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
     )
+    # Tọa độ WGS84 (độ thập phân); để trống nếu chưa có, xem lệnh backfill_coordinates
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Vĩ độ",
+        validators=[MinValueValidator(-90.0), MaxValueValidator(90.0)]
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Kinh độ",
+        validators=[MinValueValidator(-180.0), MaxValueValidator(180.0)]
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -58,6 +72,8 @@ class Destination(models.Model):
             raise ValidationError("Rating phải từ 0 đến 5")
         if self.average_cost <= 0:
             raise ValidationError("Chi phí phải lớn hơn 0")
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValidationError("Cần nhập đủ cả vĩ độ và kinh độ")
     
     def __str__(self):
         return f"{self.name}, {self.city}, {self.country}"
@@ -93,6 +109,8 @@ class Hotel(models.Model):
         verbose_name="Tiện nghi", 
         help_text="Các tiện nghi cách nhau bởi dấu phẩy"
     )
+    # Bitset tiện nghi đã chuẩn hóa (xem facets.AMENITIES), tính lại mỗi khi lưu
+    amenity_bits = models.BigIntegerField(default=0, editable=False, verbose_name="Tiện nghi (bitset)")
     rating = models.FloatField(
         default=0, 
         verbose_name="Đánh giá",
@@ -107,6 +125,7 @@ class Hotel(models.Model):
         indexes = [
             models.Index(fields=['destination', 'star_rating']),
             models.Index(fields=['rating']),
+            models.Index(fields=['star_rating', 'price_per_night']),
         ]
     
     def clean(self):
@@ -208,6 +227,19 @@ class Attraction(models.Model):
         verbose_name="Đánh giá",
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
     )
+    # Tọa độ WGS84 (độ thập phân); để trống nếu chưa có, xem lệnh backfill_coordinates
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Vĩ độ",
+        validators=[MinValueValidator(-90.0), MaxValueValidator(90.0)]
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Kinh độ",
+        validators=[MinValueValidator(-180.0), MaxValueValidator(180.0)]
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -225,6 +257,8 @@ class Attraction(models.Model):
             raise ValidationError("Rating phải từ 0 đến 5")
         if self.entry_fee < 0:
             raise ValidationError("Giá vé không thể âm")
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValidationError("Cần nhập đủ cả vĩ độ và kinh độ")
     
     def __str__(self):
         return f"{self.name} - {self.destination.city}"
@@ -250,6 +284,44 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"Profile của {self.user.username}"
 
+class HotelFacet(models.Model):
+    """Số khách sạn theo từng giá trị facet (hạng sao, khoảng giá, tiện nghi), cập nhật dần theo signal"""
+    scope = models.IntegerField(verbose_name="Phạm vi")  # destination_id, 0 = toàn bộ
+    facet = models.CharField(max_length=20, verbose_name="Facet")
+    value = models.CharField(max_length=50, verbose_name="Giá trị")
+    count = models.IntegerField(default=0, verbose_name="Số khách sạn")
+
+    class Meta:
+        verbose_name = "Facet khách sạn"
+        verbose_name_plural = "Facet khách sạn"
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'facet', 'value'], name='unique_hotel_facet'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}/{self.facet}={self.value}: {self.count}"
+
+
+class DestinationCard(models.Model):
+    """Thẻ tri thức dựng sẵn của một điểm đến (top khách sạn/nhà hàng/tham quan, khoảng giá), xem cards.py"""
+    destination = models.OneToOneField(
+        Destination,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='card'
+    )
+    data = models.JSONField(default=dict, verbose_name="Dữ liệu")  # JSON cho API search
+    text = models.TextField(blank=True, verbose_name="Tóm tắt")  # đưa thẳng vào prompt
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Thẻ điểm đến"
+        verbose_name_plural = "Thẻ điểm đến"
+
+    def __str__(self):
+        return f"Card {self.destination_id}"
+
+
 class ChatHistory(models.Model):
     """Model lưu lịch sử chat"""
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -263,12 +335,29 @@ class ChatHistory(models.Model):
         validators=[MinLengthValidator(1)]
     )
     bot_response = models.TextField(verbose_name="Phản hồi bot")
-    timestamp = models.DateTimeField(auto_now_add=True, verbose_name="Thời gian")
+    # default thay cho auto_now_add để giữ đúng thời điểm khi ghi theo lô (write-behind)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False, verbose_name="Thời gian")
     response_time = models.FloatField(
         null=True, 
         blank=True, 
         verbose_name="Thời gian phản hồi (giây)"
     )
+    time_to_first_token = models.FloatField(
+        null=True,
+        blank=True,
+        verbose_name="Thời gian tới token đầu tiên (giây)"
+    )
+    is_cached = models.BooleanField(
+        default=False,
+        verbose_name="Trả lời từ cache"
+    )
+    # Câu hỏi tra cứu/chào hỏi trả lời bằng mẫu câu (intents.py): tên ý định, rỗng nếu gọi model
+    intent = models.CharField(
+        max_length=30,
+        blank=True,
+        default="",
+        verbose_name="Ý định (trả lời bằng mẫu câu)"
+    )
     
     class Meta:
         verbose_name = "Lịch sử chat"
@@ -281,3 +370,52 @@ class ChatHistory(models.Model):
     
     def __str__(self):
         return f"Chat {self.session_id} - {self.timestamp.strftime('%d/%m/%Y %H:%M')}"
+
+
+class ArchivedChatHistory(models.Model):
+    """Lịch sử chat đã chuyển khỏi bảng chính (giữ nguyên id gốc để phân trang liền mạch)"""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    session_id = models.CharField(max_length=100, verbose_name="ID phiên")
+    user_message = models.TextField(verbose_name="Tin nhắn người dùng")
+    bot_response = models.TextField(verbose_name="Phản hồi bot")
+    timestamp = models.DateTimeField(verbose_name="Thời gian")
+    response_time = models.FloatField(null=True, blank=True, verbose_name="Thời gian phản hồi (giây)")
+    time_to_first_token = models.FloatField(
+        null=True, blank=True, verbose_name="Thời gian tới token đầu tiên (giây)"
+    )
+    is_cached = models.BooleanField(default=False, verbose_name="Trả lời từ cache")
+    intent = models.CharField(max_length=30, blank=True, default="", verbose_name="Ý định (trả lời bằng mẫu câu)")
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name="Thời điểm lưu trữ")
+
+    class Meta:
+        verbose_name = "Lịch sử chat (lưu trữ)"
+        verbose_name_plural = "Lịch sử chat (lưu trữ)"
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['session_id', 'timestamp']),
+            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['archived_at']),
+        ]
+
+    def __str__(self):
+        return f"Chat {self.session_id} - {self.timestamp.strftime('%d/%m/%Y %H:%M')} (lưu trữ)"
+
+
+class ConversationMemory(models.Model):
+    """Tóm tắt cuộn (rolling summary) của các lượt chat cũ trong một phiên"""
+    session_id = models.CharField(max_length=100, unique=True, verbose_name="ID phiên")
+    summary = models.TextField(blank=True, verbose_name="Tóm tắt")
+    summarized_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Đã tóm tắt tới"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Bộ nhớ hội thoại"
+        verbose_name_plural = "Bộ nhớ hội thoại"
+
+    def __str__(self):
+        return f"Memory {self.session_id}"
@@ -0,0 +1,102 @@
+# Keyset (cursor) pagination trên (timestamp, id): mọi trang có chi phí như nhau
+import base64
+import json
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+MAX_PER_PAGE = 100
+COUNT_ESTIMATE_TTL = 60
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj, direction):
+    """Cursor mờ (opaque) trỏ tới một bản ghi; direction là "next" hoặc "prev" """
+    payload = {"t": obj.timestamp.isoformat(), "i": obj.pk, "d": direction}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        timestamp = parse_datetime(payload["t"])
+        if timestamp is None or payload["d"] not in ("next", "prev"):
+            raise ValueError
+        return timestamp, int(payload["i"]), payload["d"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor("Cursor không hợp lệ") from e
+
+
+def parse_per_page(value, default=20):
+    try:
+        per_page = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+class KeysetPage:
+    def __init__(self, items, has_next, has_previous):
+        self.items = items
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = encode_cursor(items[-1], "next") if has_next and items else None
+        self.prev_cursor = encode_cursor(items[0], "prev") if has_previous and items else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _after_cursor(queryset, timestamp, pk, forward):
+    if forward:
+        return queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+    return queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+
+
+def keyset_paginate(queryset, cursor=None, per_page=20, descending=False, also=()):
+    """Một trang của queryset theo thứ tự (timestamp, id).
+
+    Chỉ dùng WHERE (timestamp, id) > / < cursor + LIMIT nên đi thẳng vào index
+    (session_id, timestamp) / (user, timestamp), không COUNT(*) hay OFFSET.
+    `also`: các queryset cùng cấu trúc (vd. bảng archive) được trộn vào theo cùng thứ tự;
+    mỗi queryset chỉ đọc tối đa per_page + 1 dòng.
+    """
+    direction = "next"
+    querysets = [queryset, *also]
+    if cursor:
+        timestamp, pk, direction = decode_cursor(cursor)
+        # "next" đi theo thứ tự hiển thị, "prev" đi ngược lại
+        forward = (direction == "next") != descending
+        querysets = [_after_cursor(qs, timestamp, pk, forward) for qs in querysets]
+
+    ascending = (direction == "next") != descending
+    ordering = ("timestamp", "pk") if ascending else ("-timestamp", "-pk")
+    rows = []
+    for qs in querysets:
+        rows += qs.order_by(*ordering)[:per_page + 1]
+    if also:
+        rows.sort(key=lambda row: (row.timestamp, row.pk), reverse=not ascending)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if direction == "prev":
+        rows.reverse()
+        return KeysetPage(rows, has_next=True, has_previous=has_more)
+    return KeysetPage(rows, has_next=has_more, has_previous=cursor is not None)
+
+
+def count_total(queryset, mode, cache_key, also=()):
+    """Tổng số bản ghi chỉ khi được yêu cầu: "exact" đếm thật, "estimate" dùng số đếm đã cache"""
+    def count():
+        return queryset.count() + sum(qs.count() for qs in also)
+
+    if mode == "exact":
+        return count()
+    if mode == "estimate":
+        return cache.get_or_set(cache_key, count, COUNT_ESTIMATE_TTL)
+    return None
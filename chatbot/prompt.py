@@ -0,0 +1,207 @@
+# Ghép prompt theo ngân sách token: system > câu hỏi > context > tóm tắt > lịch sử hội thoại
+#
+# Đếm token bằng tiktoken (requirements.txt). Chưa cài hoặc không tải được file BPE (lần đầu cần mạng)
+# thì dùng ước lượng theo ký tự: số đếm chỉ gần đúng nên ngân sách bị trừ thêm ESTIMATE_MARGIN.
+import functools
+import math
+import re
+from .config import AI_SETTINGS, PROMPT_SETTINGS
+
+SYSTEM_PROMPT = """Bạn là AI assistant chuyên về du lịch Việt Nam và quốc tế với kiến thức sâu rộng.
+
+NHIỆM VỤ:
+- Cung cấp thông tin chính xác, hữu ích về du lịch
+- Gợi ý điểm đến, khách sạn, nhà hàng, hoạt động
+- Tư vấn lịch trình, phương tiện, chi phí
+- Chia sẻ kinh nghiệm thực tế
+
+PHONG CÁCH:
+- Thân thiện, nhiệt tình
+- Trả lời chi tiết nhưng dễ hiểu
+- Đưa ra gợi ý cụ thể, thực tế
+- Xuống dòng đúng cách, đúng chỗ"""
+
+CONTEXT_TEMPLATE = "\n\nTHÔNG TIN BỔ SUNG: {travel_context}"
+SUMMARY_TEMPLATE = "\n\nTÓM TẮT CUỘC TRÒ CHUYỆN TRƯỚC:\n{summary}"
+NO_CONTEXT = "Chưa có dữ liệu cụ thể"
+QUESTION_TEMPLATE = "Câu hỏi: {user_message}\n\nHãy trả lời một cách chi tiết, hữu ích và thân thiện:"
+
+# Chi phí cố định theo định dạng chat của OpenAI
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@functools.lru_cache(maxsize=1)
+def _get_encoding():
+    """Tokenizer tiktoken, None nếu chưa cài hoặc không tải được"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(AI_SETTINGS['OPENAI_MODEL'])
+    except KeyError:
+        return tiktoken.get_encoding(PROMPT_SETTINGS['TOKENIZER_ENCODING'])
+    except Exception as e:
+        # tiktoken cần tải file BPE lần đầu; không có mạng thì dùng ước lượng
+        print(f"Tokenizer load error: {str(e)}")
+        return None
+
+
+def _estimate_word(word):
+    # Ước lượng BPE: từ ASCII ~4 ký tự/token, từ có dấu tiếng Việt ~3 byte UTF-8/token
+    if word.isascii():
+        return max(1, math.ceil(len(word) / 4))
+    return max(1, math.ceil(len(word.encode("utf-8")) / 3))
+
+
+def count_tokens(text):
+    """Số token của text (tiktoken nếu có, ngược lại ước lượng hơi dư)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum(_estimate_word(word) for word in _WORD_RE.findall(text))
+
+
+@functools.lru_cache(maxsize=1024)
+def count_tokens_cached(text):
+    """count_tokens có cache: dùng cho system prompt và context (lặp lại giữa các request)"""
+    return count_tokens(text)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cắt text để không vượt quá max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    used = 0
+    for match in _WORD_RE.finditer(text):
+        used += _estimate_word(match.group())
+        if used > max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def trim_lines(text, max_tokens):
+    """Giữ các dòng đầu (fact xếp hạng cao nhất) vừa trong max_tokens"""
+    kept, used = [], 0
+    for line in text.splitlines():
+        line_tokens = count_tokens_cached(line) + 1
+        if used + line_tokens > max_tokens:
+            if not kept:
+                # Context một dòng (vd. context chung): cắt giữa dòng
+                kept.append(truncate_to_tokens(line, max_tokens))
+            break
+        kept.append(line)
+        used += line_tokens
+    return "\n".join(kept)
+
+
+def prompt_budget():
+    """Số token tối đa cho prompt: giới hạn chi phí, trong context window trừ phần trả lời"""
+    budget = min(
+        PROMPT_SETTINGS['MAX_PROMPT_TOKENS'],
+        PROMPT_SETTINGS['CONTEXT_WINDOW'] - AI_SETTINGS['MAX_TOKENS'],
+    )
+    if _get_encoding() is None:
+        # Số đếm ước lượng có thể thấp hơn số token thật: chừa lề an toàn
+        budget = int(budget * (1 - PROMPT_SETTINGS['ESTIMATE_MARGIN']))
+    return budget
+
+
+class Prompt:
+    """Messages gửi cho model và số token từng phần (để log/đo đạc)"""
+
+    def __init__(self, messages, token_counts, trimmed):
+        self.messages = messages
+        self.token_counts = token_counts
+        self.trimmed = trimmed
+
+    def __repr__(self):
+        return f"<Prompt {self.token_counts} trimmed={self.trimmed}>"
+
+
+def build_prompt(user_message, travel_context="", history=None, summary=""):
+    """Ghép messages trong ngân sách token.
+
+    history là danh sách {"role", "content"} cũ -> mới, summary là tóm tắt các lượt cũ hơn.
+    Khi vượt ngân sách: bỏ các lượt hội thoại cũ nhất trước, rồi cắt summary, sau đó cắt bớt
+    các fact cuối (kém liên quan nhất) của context. System prompt không bao giờ bị cắt;
+    câu hỏi chỉ bị cắt khi vượt USER_MESSAGE_MAX_TOKENS.
+    """
+    history = history or []
+    budget = prompt_budget()
+    trimmed = []
+
+    system_tokens = count_tokens_cached(SYSTEM_PROMPT) + TOKENS_PER_MESSAGE + TOKENS_PER_REPLY
+    question = QUESTION_TEMPLATE.format(user_message=user_message)
+    user_tokens = count_tokens(question) + TOKENS_PER_MESSAGE
+    if user_tokens > PROMPT_SETTINGS['USER_MESSAGE_MAX_TOKENS']:
+        question_overhead = count_tokens_cached(QUESTION_TEMPLATE.format(user_message="")) + TOKENS_PER_MESSAGE
+        user_message = truncate_to_tokens(user_message, PROMPT_SETTINGS['USER_MESSAGE_MAX_TOKENS'] - question_overhead)
+        question = QUESTION_TEMPLATE.format(user_message=user_message)
+        user_tokens = count_tokens(question) + TOKENS_PER_MESSAGE
+        trimmed.append("user")
+    remaining = max(0, budget - system_tokens - user_tokens)
+
+    # Context: ưu tiên hơn lịch sử hội thoại
+    travel_context = travel_context or NO_CONTEXT
+    context_budget = min(PROMPT_SETTINGS['CONTEXT_MAX_TOKENS'], remaining)
+    context_overhead = count_tokens_cached(CONTEXT_TEMPLATE.format(travel_context=""))
+    context_tokens = count_tokens_cached(travel_context) + context_overhead
+    if context_tokens > context_budget:
+        travel_context = trim_lines(travel_context, context_budget - context_overhead) or NO_CONTEXT
+        context_tokens = count_tokens(travel_context) + context_overhead
+        trimmed.append("context")
+    remaining -= context_tokens
+
+    # Summary: ưu tiên hơn các lượt nguyên văn
+    summary_tokens = 0
+    if summary:
+        summary_overhead = count_tokens_cached(SUMMARY_TEMPLATE.format(summary=""))
+        summary_budget = min(PROMPT_SETTINGS['SUMMARY_MAX_TOKENS'], max(0, remaining)) - summary_overhead
+        summary_tokens = count_tokens(summary)
+        if summary_tokens > summary_budget:
+            summary = truncate_to_tokens(summary, summary_budget)
+            summary_tokens = count_tokens(summary)
+            trimmed.append("summary")
+        if summary:
+            summary_tokens += summary_overhead
+            remaining -= summary_tokens
+
+    # Lịch sử: giữ các lượt mới nhất vừa ngân sách còn lại
+    history_budget = min(PROMPT_SETTINGS['HISTORY_MAX_TOKENS'], max(0, remaining))
+    kept_history, history_tokens = [], 0
+    for message in reversed(history):
+        message_tokens = count_tokens(message["content"]) + TOKENS_PER_MESSAGE
+        if history_tokens + message_tokens > history_budget:
+            trimmed.append("history")
+            break
+        kept_history.append(message)
+        history_tokens += message_tokens
+    kept_history.reverse()
+
+    system_content = SYSTEM_PROMPT + CONTEXT_TEMPLATE.format(travel_context=travel_context)
+    if summary:
+        system_content += SUMMARY_TEMPLATE.format(summary=summary)
+    messages = [{"role": "system", "content": system_content}]
+    messages += [{"role": m["role"], "content": m["content"]} for m in kept_history]
+    messages.append({"role": "user", "content": question})
+
+    token_counts = {
+        "system": system_tokens,
+        "context": context_tokens,
+        "summary": summary_tokens,
+        "history": history_tokens,
+        "user": user_tokens,
+        "total": system_tokens + context_tokens + summary_tokens + history_tokens + user_tokens,
+        "budget": budget,
+    }
+    return Prompt(messages, token_counts, trimmed)
@@ -0,0 +1,257 @@
+# Rate limiting: sliding window log / token bucket, atomic trên locmem và Redis
+import functools
+import ipaddress
+import math
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from . import chat_session, metrics
+from .config import RATE_LIMIT_SETTINGS
+
+RateLimitResult = namedtuple("RateLimitResult", "allowed limit remaining reset retry_after window")
+
+RATE_LIMITED_REPLY = "Quá nhiều yêu cầu. Vui lòng thử lại sau {seconds} giây."
+
+
+class LocalBackend:
+    """Backend trong process (tương đương LocMemCache): mọi thao tác nằm trong một lock"""
+
+    SWEEP_INTERVAL = 60
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._logs = {}     # key -> [deque[timestamp], window]
+        self._buckets = {}  # key -> [tokens, updated_at, expires_at]
+        self._last_sweep = time.time()
+
+    def sliding_window(self, key, limit, window, now):
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._logs.setdefault(key, [deque(), window])
+            entry[1] = window
+            log = entry[0]
+            while log and log[0] <= now - window:
+                log.popleft()
+            if len(log) < limit:
+                log.append(now)
+                return True, limit - len(log), log[0] + window - now
+            return False, 0, log[0] + window - now
+
+    def token_bucket(self, key, limit, window, now):
+        rate = limit / window
+        with self._lock:
+            self._maybe_sweep(now)
+            tokens, updated_at, _ = self._buckets.get(key, (limit, now, 0))
+            tokens = min(limit, tokens + max(0, now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+                reset = (limit - tokens) / rate  # thời gian để bucket đầy lại
+            else:
+                reset = (1 - tokens) / rate      # thời gian tới khi có token tiếp theo
+            self._buckets[key] = [tokens, now, now + window]
+            return allowed, int(tokens), reset
+
+    def _maybe_sweep(self, now):
+        # Dọn các key không còn hoạt động để bộ nhớ không tăng mãi
+        if now - self._last_sweep < self.SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        # Log chỉ bị bỏ khi request mới nhất đã ra khỏi window của scope (window có thể dài hơn chu kỳ dọn)
+        for key in [k for k, (log, window) in self._logs.items() if not log or log[-1] <= now - window]:
+            del self._logs[key]
+        for key in [k for k, bucket in self._buckets.items() if bucket[2] < now]:
+            del self._buckets[key]
+
+    def reset(self):
+        with self._lock:
+            self._logs.clear()
+            self._buckets.clear()
+
+
+class RedisBackend:
+    """Backend Redis dùng Lua script để kiểm tra và cập nhật trong một bước atomic"""
+
+    SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+local allowed = 0
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    count = count + 1
+    allowed = 1
+end
+redis.call('PEXPIRE', key, math.ceil(window * 1000))
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {allowed, limit - count, tostring(tonumber(oldest[2]) + window - now)}
+"""
+
+    TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local data = redis.call('HMGET', key, 'tokens', 'ts')
+local tokens = tonumber(data[1]) or capacity
+local ts = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local reset
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+    reset = (capacity - tokens) / rate
+else
+    reset = (1 - tokens) / rate
+end
+redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, math.floor(tokens), tostring(reset)}
+"""
+
+    def __init__(self, alias="default"):
+        from django_redis import get_redis_connection
+        self._redis = get_redis_connection(alias)
+        self._sliding_window = self._redis.register_script(self.SLIDING_WINDOW_SCRIPT)
+        self._token_bucket = self._redis.register_script(self.TOKEN_BUCKET_SCRIPT)
+
+    def sliding_window(self, key, limit, window, now):
+        allowed, remaining, reset = self._sliding_window(
+            keys=[key], args=[now, window, limit, f"{now}:{uuid.uuid4().hex[:8]}"]
+        )
+        return bool(allowed), max(0, int(remaining)), float(reset)
+
+    def token_bucket(self, key, limit, window, now):
+        allowed, remaining, reset = self._token_bucket(keys=[key], args=[now, limit / window, limit])
+        return bool(allowed), int(remaining), float(reset)
+
+    def reset(self):
+        pass
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Redis nếu cache mặc định là django_redis, ngược lại dùng backend trong process"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                cache_backend = settings.CACHES.get("default", {}).get("BACKEND", "")
+                _backend = RedisBackend() if "django_redis" in cache_backend else LocalBackend()
+    return _backend
+
+
+def _is_trusted_proxy(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _trusted_networks())
+
+
+@functools.lru_cache(maxsize=1)
+def _trusted_networks():
+    return [ipaddress.ip_network(p, strict=False) for p in RATE_LIMIT_SETTINGS['TRUSTED_PROXIES']]
+
+
+def get_client_ip(request):
+    """IP thật của client: chỉ tin X-Forwarded-For khi request đi qua proxy tin cậy"""
+    remote_addr = request.META.get("REMOTE_ADDR", "") or "unknown"
+    if not _is_trusted_proxy(remote_addr):
+        return remote_addr
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    # Duyệt từ phải sang trái, bỏ qua các proxy tin cậy
+    for address in reversed([a.strip() for a in forwarded.split(",") if a.strip()]):
+        if not _is_trusted_proxy(address):
+            return address
+    return remote_addr
+
+
+def get_rate_limit_identity(request):
+    """User đã đăng nhập giới hạn theo user, khách giới hạn theo IP"""
+    session = chat_session.peek(request)
+    if session is not None and session.user_id is not None:
+        # peek() đã đối chiếu user id trong token với user đăng nhập của request
+        return f"user:{session.user_id}"
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{get_client_ip(request)}"
+
+
+def check_rate_limit(request, scope):
+    """Ghi nhận một request cho scope và trả về RateLimitResult"""
+    limit, window = RATE_LIMIT_SETTINGS['RATES'][scope]
+    algorithm = RATE_LIMIT_SETTINGS['ALGORITHM']
+    key = f"rl:{scope}:{algorithm}:{get_rate_limit_identity(request)}"
+    backend = get_backend()
+    now = time.time()
+    try:
+        if algorithm == "token_bucket":
+            allowed, remaining, reset = backend.token_bucket(key, limit, window, now)
+        else:
+            allowed, remaining, reset = backend.sliding_window(key, limit, window, now)
+    except Exception as e:
+        # Không chặn người dùng khi backend rate limit gặp lỗi
+        print(f"Rate limit backend error: {str(e)}")
+        return RateLimitResult(True, limit, limit, 0, 0, window)
+    reset = max(0, reset)
+    retry_after = 0 if allowed else max(1, math.ceil(reset))
+    return RateLimitResult(allowed, limit, max(0, remaining), reset, retry_after, window)
+
+
+def set_rate_limit_headers(response, result):
+    """Header RateLimit-* theo draft IETF và Retry-After khi bị chặn"""
+    response["RateLimit-Limit"] = str(result.limit)
+    response["RateLimit-Remaining"] = str(result.remaining)
+    response["RateLimit-Reset"] = str(math.ceil(result.reset))
+    response["RateLimit-Policy"] = f"{result.limit};w={result.window}"
+    if not result.allowed:
+        response["Retry-After"] = str(result.retry_after)
+    return response
+
+
+def rate_limited_response(result):
+    response = JsonResponse({
+        "reply": RATE_LIMITED_REPLY.format(seconds=result.retry_after),
+        "error": "rate_limit_exceeded",
+        "retry_after": result.retry_after,
+    }, status=429)
+    return set_rate_limit_headers(response, result)
+
+
+def ratelimit(scope):
+    """Decorator giới hạn tần suất cho view sync hoặc async"""
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @functools.wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                with metrics.span("ratelimit"):
+                    result = await sync_to_async(check_rate_limit)(request, scope)
+                if not result.allowed:
+                    return rate_limited_response(result)
+                response = await view_func(request, *args, **kwargs)
+                return set_rate_limit_headers(response, result)
+            return async_wrapper
+
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            with metrics.span("ratelimit"):
+                result = check_rate_limit(request, scope)
+            if not result.allowed:
+                return rate_limited_response(result)
+            response = view_func(request, *args, **kwargs)
+            return set_rate_limit_headers(response, result)
+        return wrapper
+    return decorator
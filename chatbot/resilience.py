@@ -0,0 +1,341 @@
+# Lớp chống chịu quanh lời gọi model: circuit breaker theo lỗi + độ trễ, hedged request, model dự phòng
+#
+# - Mỗi model có một breaker: tỉ lệ lỗi hoặc tỉ lệ lời gọi chậm (> SLOW_CALL_SECONDS) vượt ngưỡng
+#   trong WINDOW giây thì mở mạch OPEN_SECONDS giây; trong lúc đó gọi model bị từ chối ngay,
+#   worker không phải chờ hết timeout. Hết hạn thì cho vài lời gọi thử (half-open).
+# - Hedging: lời gọi chưa xong sau p95 latency gần đây thì gửi thêm một bản sao, lấy kết quả về trước.
+#   Số bản sao bị giới hạn bởi HEDGE_BUDGET để upstream đang chậm không bị nhân đôi tải; chỉ hedge
+#   khi mạch đóng. Breaker ghi một kết quả cho cả lời gọi (bản sao không được tính riêng).
+# - Model chính lỗi/mở mạch thì thử FALLBACK_MODEL trong phần còn lại của DEADLINE.
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from . import metrics
+from .config import AI_SETTINGS, RESILIENCE_SETTINGS
+
+
+class CircuitOpenError(Exception):
+    """Mọi model đều đang mở mạch (hoặc hết thời gian): không gọi upstream"""
+
+
+class CircuitBreaker:
+    """Breaker closed -> open -> half_open -> closed, tính trên cửa sổ thời gian trượt"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name):
+        self.name = name
+        self.state = self.CLOSED
+        self._calls = deque()  # (thời điểm, lỗi, chậm)
+        self._errors = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        metrics.LLM_CIRCUIT_EVENTS.labels(self.name, state).inc()
+
+    def _open(self, now):
+        self._opened_at = now
+        self._calls.clear()
+        self._errors = self._slow = 0
+        self._set_state(self.OPEN)
+
+    def allow(self, hedge=False):
+        """Có được gọi model không; ở half-open chỉ cho HALF_OPEN_CALLS lời gọi thử cùng lúc.
+
+        hedge=True: bản sao hedge của một lời gọi đang chạy, chỉ được gửi khi mạch đóng
+        (ở half-open bản sao sẽ chiếm thêm một lượt thử của cùng lời gọi).
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < RESILIENCE_SETTINGS['OPEN_SECONDS']:
+                    metrics.LLM_CIRCUIT_EVENTS.labels(self.name, "rejected").inc()
+                    return False
+                self._probes = self._probe_successes = 0
+                self._set_state(self.HALF_OPEN)
+            if hedge:
+                return self.state == self.CLOSED
+            if self.state == self.HALF_OPEN:
+                if self._probes >= RESILIENCE_SETTINGS['HALF_OPEN_CALLS']:
+                    metrics.LLM_CIRCUIT_EVENTS.labels(self.name, "rejected").inc()
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, latency, ok):
+        """Ghi kết quả một lời gọi (một lần cho mỗi lời gọi, dù có gửi bản sao hedge hay không)"""
+        slow = latency > RESILIENCE_SETTINGS['SLOW_CALL_SECONDS']
+        now = time.monotonic()
+        with self._lock:
+            if self.state == self.OPEN:
+                return  # kết quả muộn của lời gọi bắt đầu trước khi mở mạch
+            if self.state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if not ok or slow:
+                    self._open(now)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= RESILIENCE_SETTINGS['HALF_OPEN_CALLS']:
+                    self._set_state(self.CLOSED)
+                return
+
+            self._calls.append((now, not ok, slow))
+            self._errors += not ok
+            self._slow += slow
+            horizon = now - RESILIENCE_SETTINGS['WINDOW']
+            while self._calls and self._calls[0][0] < horizon:
+                _, error, was_slow = self._calls.popleft()
+                self._errors -= error
+                self._slow -= was_slow
+            total = len(self._calls)
+            if total >= RESILIENCE_SETTINGS['MIN_CALLS'] and (
+                self._errors / total >= RESILIENCE_SETTINGS['FAILURE_RATIO']
+                or self._slow / total >= RESILIENCE_SETTINGS['SLOW_CALL_RATIO']
+            ):
+                self._open(now)
+
+
+class LatencyWindow:
+    """N latency thành công gần nhất của một model, để tính ngưỡng hedge"""
+
+    def __init__(self, size):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p):
+        with self._lock:
+            if len(self._samples) < RESILIENCE_SETTINGS['HEDGE_MIN_SAMPLES']:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class _HedgeBudget:
+    """Token bucket: mỗi lời gọi thêm HEDGE_BUDGET token, mỗi bản sao hedge tốn 1 token"""
+
+    def __init__(self):
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(10.0, self._tokens + RESILIENCE_SETTINGS['HEDGE_BUDGET'])
+
+    def spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+_breakers = {}
+_latencies = {}
+_budget = _HedgeBudget()
+_registry_lock = threading.Lock()
+
+
+def breaker(model):
+    if model not in _breakers:
+        with _registry_lock:
+            _breakers.setdefault(model, CircuitBreaker(model))
+    return _breakers[model]
+
+
+def _latency_window(model):
+    if model not in _latencies:
+        with _registry_lock:
+            _latencies.setdefault(model, LatencyWindow(RESILIENCE_SETTINGS['LATENCY_SAMPLES']))
+    return _latencies[model]
+
+
+def circuit_states():
+    """{model: trạng thái breaker}"""
+    return {model: cb.state for model, cb in list(_breakers.items())}
+
+
+metrics.REGISTRY.gauge_callback(
+    "chatbot_llm_circuit_open", "Số model đang mở mạch",
+    lambda: sum(state != CircuitBreaker.CLOSED for state in circuit_states().values()),
+)
+
+
+def models():
+    """Các model theo thứ tự ưu tiên: model chính rồi model dự phòng"""
+    candidates = [AI_SETTINGS['OPENAI_MODEL']]
+    if AI_SETTINGS['FALLBACK_MODEL'] and AI_SETTINGS['FALLBACK_MODEL'] not in candidates:
+        candidates.append(AI_SETTINGS['FALLBACK_MODEL'])
+    return candidates
+
+
+def allow(model, primary):
+    """Breaker của model cho phép gọi không; đếm số lần phải dùng model dự phòng"""
+    if not breaker(model).allow():
+        return False
+    if model != primary:
+        metrics.LLM_FALLBACKS.labels(model).inc()
+    return True
+
+
+def hedge_delay(model):
+    """Sau bao lâu thì gửi bản sao hedge (None: chưa đủ mẫu hoặc tắt hedging)"""
+    if not RESILIENCE_SETTINGS['HEDGE_ENABLED']:
+        return None
+    p = _latency_window(model).percentile(RESILIENCE_SETTINGS['HEDGE_PERCENTILE'])
+    if p is None:
+        return None
+    return max(RESILIENCE_SETTINGS['HEDGE_MIN_DELAY'], p)
+
+
+def record(model, latency, ok):
+    """Ghi kết quả một lời gọi vào breaker (và mẫu latency nếu thành công)"""
+    breaker(model).record(latency, ok)
+    if ok:
+        _latency_window(model).add(latency)
+
+
+# --- Sync ---------------------------------------------------------------------
+
+def _hedged(model, attempt, timeout):
+    """Một lời gọi model (có thể kèm bản sao hedge), ghi một kết quả vào breaker"""
+    start = time.perf_counter()
+    try:
+        result = _race(model, attempt, timeout)
+    except Exception:
+        record(model, time.perf_counter() - start, False)
+        raise
+    record(model, time.perf_counter() - start, True)
+    return result
+
+
+def _race(model, attempt, timeout):
+    delay = hedge_delay(model)
+    if delay is None or delay >= timeout:
+        return attempt(model, timeout)
+
+    results = queue.Queue()
+
+    def run(attempt_timeout):
+        try:
+            results.put((True, attempt(model, attempt_timeout)))
+        except Exception as e:
+            results.put((False, e))
+
+    start = time.monotonic()
+    threading.Thread(target=run, args=(timeout,), daemon=True).start()
+    pending, hedged, error = 1, False, None
+    while pending:
+        limit = (timeout if hedged else delay) - (time.monotonic() - start)
+        try:
+            ok, value = results.get(timeout=max(0.0, limit))
+        except queue.Empty:
+            if hedged:
+                break
+            hedged = True
+            if breaker(model).allow(hedge=True) and _budget.spend():
+                metrics.LLM_HEDGES.labels(model).inc()
+                threading.Thread(target=run, args=(timeout - delay,), daemon=True).start()
+                pending += 1
+            continue
+        if ok:
+            return value
+        pending -= 1
+        error = value
+        if not hedged:
+            break  # lỗi thật (không phải chậm): không hedge
+    # Lời gọi còn chạy sẽ tự kết thúc theo timeout của client
+    raise error or TimeoutError(f"{model} did not answer within {timeout:.1f}s")
+
+
+def call(attempt, candidates):
+    """Gọi attempt(model, timeout) lần lượt với các model qua breaker/hedge, tổng thời gian không quá DEADLINE"""
+    deadline = time.monotonic() + RESILIENCE_SETTINGS['DEADLINE']
+    error = None
+    for model in candidates:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not allow(model, candidates[0]):
+            continue
+        _budget.earn()
+        try:
+            return _hedged(model, attempt, min(RESILIENCE_SETTINGS['ATTEMPT_TIMEOUT'], remaining))
+        except Exception as e:
+            print(f"LLM call error ({model}): {str(e)}")
+            error = e
+    raise CircuitOpenError("No LLM model available") from error
+
+
+# --- Async --------------------------------------------------------------------
+
+async def _ahedged(model, attempt, timeout):
+    start = time.perf_counter()
+    try:
+        result = await _arace(model, attempt, timeout)
+    except Exception:
+        record(model, time.perf_counter() - start, False)
+        raise
+    record(model, time.perf_counter() - start, True)
+    return result
+
+
+async def _arace(model, attempt, timeout):
+    delay = hedge_delay(model)
+    if delay is None or delay >= timeout:
+        return await asyncio.wait_for(attempt(model, timeout), timeout)
+
+    start = time.monotonic()
+    tasks = {asyncio.ensure_future(asyncio.wait_for(attempt(model, timeout), timeout))}
+    hedged, error = False, None
+    try:
+        while tasks:
+            limit = (timeout if hedged else delay) - (time.monotonic() - start)
+            done, tasks = await asyncio.wait(tasks, timeout=max(0.0, limit), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if hedged:
+                    break
+                hedged = True
+                if breaker(model).allow(hedge=True) and _budget.spend():
+                    metrics.LLM_HEDGES.labels(model).inc()
+                    copy_timeout = timeout - delay
+                    tasks.add(asyncio.ensure_future(asyncio.wait_for(attempt(model, copy_timeout), copy_timeout)))
+                continue
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if not hedged:
+                break
+        raise error or asyncio.TimeoutError(f"{model} did not answer within {timeout:.1f}s")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def acall(attempt, candidates):
+    """Phiên bản async của call(): attempt(model, timeout) là coroutine function"""
+    deadline = time.monotonic() + RESILIENCE_SETTINGS['DEADLINE']
+    error = None
+    for model in candidates:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not allow(model, candidates[0]):
+            continue
+        _budget.earn()
+        try:
+            return await _ahedged(model, attempt, min(RESILIENCE_SETTINGS['ATTEMPT_TIMEOUT'], remaining))
+        except Exception as e:
+            print(f"LLM call error ({model}): {str(e)}")
+            error = e
+    raise CircuitOpenError("No LLM model available") from error
@@ -0,0 +1,201 @@
+# Retention cho ChatHistory: giới hạn theo phiên/user/tuổi, chuyển sang bảng archive theo lô nhỏ
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+from . import metrics
+from .config import RETENTION_SETTINGS
+from .models import ArchivedChatHistory, ChatHistory
+
+COPY_FIELDS = (
+    "id", "user_id", "session_id", "user_message", "bot_response",
+    "timestamp", "response_time", "time_to_first_token", "is_cached", "intent",
+)
+LAST_ID_KEY = "chat_retention:last_id"     # id lớn nhất đã xét ở lần chạy trước (kiểm tra giới hạn tăng dần)
+LAST_RUN_KEY = "chat_retention:last_run"   # thời điểm chạy gần nhất (dùng chung giữa các process)
+LOCK_KEY = "chat_retention:lock"
+LOCK_TIMEOUT = 3600
+STATE_TIMEOUT = 30 * 86400
+
+
+def move_chats(ids, reason, archive=True):
+    """Chuyển (hoặc xóa) một lô bản ghi trong một transaction ngắn; trả về số bản ghi đã chuyển"""
+    if not ids:
+        return 0
+    with transaction.atomic():
+        if archive:
+            now = timezone.now()
+            rows = ChatHistory.objects.filter(pk__in=ids).values_list(*COPY_FIELDS)
+            ArchivedChatHistory.objects.bulk_create(
+                [ArchivedChatHistory(archived_at=now, **dict(zip(COPY_FIELDS, row))) for row in rows],
+                ignore_conflicts=True,  # lần chạy trước bị ngắt giữa chừng
+            )
+        moved, _ = ChatHistory.objects.filter(pk__in=ids).delete()
+    metrics.RETENTION_ROWS.labels(reason, "archived" if archive else "deleted").inc(moved)
+    return moved
+
+
+def _drain(next_ids, reason, archive, chunk_pause):
+    """Lặp lấy lô id kế tiếp và chuyển đi cho tới khi hết; nghỉ giữa các lô để không chiếm DB"""
+    total = 0
+    while True:
+        ids = next_ids()
+        if not ids:
+            return total
+        total += move_chats(ids, reason, archive)
+        if chunk_pause:
+            time.sleep(chunk_pause)
+
+
+def archive_older_than(cutoff, chunk_size=500, archive=True, chunk_pause=0):
+    """Chuyển các bản ghi có timestamp < cutoff.
+
+    Bảng chính không có index riêng trên timestamp (thêm index làm chậm ghi), nhưng id tăng
+    gần như theo thời gian: lấy id đầu tiên còn "mới" làm biên rồi quét theo khóa chính phía trước nó.
+    """
+    boundary = ChatHistory.objects.filter(timestamp__gte=cutoff).order_by("pk").values_list("pk", flat=True).first()
+    queryset = ChatHistory.objects.filter(timestamp__lt=cutoff)
+    if boundary is not None:
+        queryset = queryset.filter(pk__lt=boundary)
+
+    def next_ids():
+        return list(queryset.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+
+    return _drain(next_ids, "age", archive, chunk_pause)
+
+
+def enforce_cap(field, value, cap, chunk_size=500, archive=True, chunk_pause=0):
+    """Giữ lại `cap` bản ghi mới nhất của một phiên/user (dùng index (field, timestamp))"""
+    queryset = ChatHistory.objects.filter(**{field: value}).order_by("-timestamp", "-pk")
+
+    def next_ids():
+        return list(queryset.values_list("pk", flat=True)[cap:cap + chunk_size])
+
+    return _drain(next_ids, f"{field.replace('_id', '')}_cap", archive, chunk_pause)
+
+
+def _over_cap(field, cap, since_id):
+    """Các phiên/user có thể vượt giới hạn: chỉ những ai có bản ghi mới từ lần chạy trước"""
+    if since_id is None:
+        # Lần đầu: một lượt GROUP BY toàn bảng
+        return list(
+            ChatHistory.objects.exclude(**{f"{field}__isnull": True}).order_by().values(field)
+            .annotate(n=Count("pk")).filter(n__gt=cap).values_list(field, flat=True)
+        )
+    return list(
+        ChatHistory.objects.filter(pk__gt=since_id).exclude(**{f"{field}__isnull": True})
+        .order_by().values_list(field, flat=True).distinct()
+    )
+
+
+def compact_archive(cutoff, directory, chunk_size=500):
+    """Nén các bản ghi archive cũ hơn cutoff ra file .jsonl.gz rồi xóa khỏi bảng archive"""
+    queryset = ArchivedChatHistory.objects.filter(archived_at__lt=cutoff).order_by("archived_at", "pk")
+    path = None
+    total = 0
+    output = None
+    try:
+        while True:
+            rows = list(queryset.values(*COPY_FIELDS)[:chunk_size])
+            if not rows:
+                break
+            if output is None:
+                os.makedirs(directory, exist_ok=True)
+                path = os.path.join(directory, f"chat_archive_{timezone.now():%Y%m%d%H%M%S}.jsonl.gz")
+                output = gzip.open(path, "at", encoding="utf-8")
+            for row in rows:
+                output.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+            # Ghi xong ra file rồi mới xóa: crash giữa chừng chỉ có thể làm trùng dòng trong file
+            output.flush()
+            ArchivedChatHistory.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+            total += len(rows)
+    finally:
+        if output is not None:
+            output.close()
+    metrics.RETENTION_ROWS.labels("archive_age", "compacted").inc(total)
+    return total, path
+
+
+def run_retention(settings=None, full=False, on_step=None):
+    """Một lượt retention đầy đủ; trả về dict số bản ghi theo từng bước"""
+    settings = dict(RETENTION_SETTINGS, **(settings or {}))
+    chunk_size, archive, pause = settings['CHUNK_SIZE'], settings['ARCHIVE'], settings['CHUNK_PAUSE']
+    now = timezone.now()
+    stats = {"age": 0, "session_cap": 0, "user_cap": 0, "compacted": 0}
+
+    if settings['MAX_AGE_DAYS'] > 0:
+        cutoff = now - timedelta(days=settings['MAX_AGE_DAYS'])
+        stats["age"] = archive_older_than(cutoff, chunk_size, archive, pause)
+        if on_step:
+            on_step("age", stats["age"])
+
+    since_id = None if full else cache.get(LAST_ID_KEY)
+    # Chốt mốc trước khi xét để bản ghi mới ghi trong lúc chạy được xét ở lần sau
+    last_id = ChatHistory.objects.order_by("-pk").values_list("pk", flat=True).first()
+    for field, cap, key in (("session_id", settings['MAX_PER_SESSION'], "session_cap"),
+                            ("user_id", settings['MAX_PER_USER'], "user_cap")):
+        if cap > 0:
+            for value in _over_cap(field, cap, since_id):
+                stats[key] += enforce_cap(field, value, cap, chunk_size, archive, pause)
+            if on_step:
+                on_step(key, stats[key])
+    if last_id is not None:
+        cache.set(LAST_ID_KEY, last_id, STATE_TIMEOUT)
+
+    if settings['ARCHIVE_MAX_AGE_DAYS'] > 0 and settings['ARCHIVE_DIR']:
+        cutoff = now - timedelta(days=settings['ARCHIVE_MAX_AGE_DAYS'])
+        stats["compacted"], path = compact_archive(cutoff, settings['ARCHIVE_DIR'], chunk_size)
+        if on_step:
+            on_step("compacted", stats["compacted"], path)
+    return stats
+
+
+def run_once():
+    """Chạy retention nếu chưa process nào chạy trong RUN_INTERVAL (khóa qua cache)"""
+    interval = RETENTION_SETTINGS['RUN_INTERVAL']
+    last_run = cache.get(LAST_RUN_KEY)
+    if last_run is not None and time.time() - last_run < interval:
+        return None
+    if not cache.add(LOCK_KEY, 1, LOCK_TIMEOUT):
+        return None
+    try:
+        close_old_connections()
+        stats = run_retention()
+        cache.set(LAST_RUN_KEY, time.time(), max(interval * 2, 60))
+        return stats
+    except Exception as e:
+        print(f"Chat retention error: {str(e)}")
+        return None
+    finally:
+        cache.delete(LOCK_KEY)
+        close_old_connections()
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def start(**kwargs):
+    """Khởi động thread retention nền (nối vào request_started); gọi nhiều lần không sao"""
+    global _thread
+    if _thread is not None or not RETENTION_SETTINGS['ENABLED'] or RETENTION_SETTINGS['RUN_INTERVAL'] <= 0:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_loop, name="chat-retention", daemon=True)
+            _thread.start()
+
+
+def _loop():
+    # Chạy sớm sau khi khởi động (process có thể sống ngắn hơn RUN_INTERVAL), lệch ngẫu nhiên giữa các process
+    time.sleep(random.uniform(10, 60))
+    while True:
+        run_once()
+        time.sleep(RETENTION_SETTINGS['RUN_INTERVAL'])
@@ -0,0 +1,284 @@
+# Truy xuất context theo câu hỏi: chọn các thông tin catalog liên quan nhất để đưa vào prompt
+import heapq
+import math
+import threading
+from array import array
+from collections import Counter
+from django.db import connections
+from . import cards, geo
+from .catalog_cache import get_catalog_version
+from .config import CARD_SETTINGS, RETRIEVAL_SETTINGS
+from .models import Destination, Hotel, Restaurant, Attraction
+from .text import fold_text
+
+DESTINATION, HOTEL, RESTAURANT, ATTRACTION = "destination", "hotel", "restaurant", "attraction"
+
+# Từ phổ biến (đã bỏ dấu) không mang nghĩa tìm kiếm
+STOPWORDS = frozenset("""
+toi minh ban la co khong gi nao nhu the thi va voi cho cua mot nhung cac duoc
+o tai den tu di ve ra vao len xuong nay do kia roi se da dang can muon hay hoac
+nen lam bao nhieu may a oi nhe nha ai sao tot nhat rat qua
+""".split())
+
+# Từ khóa gợi ý loại thông tin người dùng quan tâm
+KIND_KEYWORDS = {
+    HOTEL: ("khach san", "hotel", "resort", "nha nghi", "homestay", "luu tru", "o dau", "phong"),
+    RESTAURANT: ("nha hang", "quan an", "an gi", "mon an", "dac san", "am thuc", "restaurant", "an uong"),
+    ATTRACTION: ("tham quan", "vui choi", "choi gi", "dia diem", "gia ve", "ve vao", "bao tang", "cong vien"),
+    DESTINATION: ("diem den", "du lich", "thoi diem", "mua nao", "thang nao", "chi phi", "nen di"),
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_ENTITY_WORDS = 4
+
+
+def _fact_destination(d):
+    return (
+        f"Điểm đến: {d.name} ({d.city}, {d.country}) - đánh giá {d.rating:.1f}/5, "
+        f"chi phí ~{float(d.average_cost):.0f} USD/ngày, thời điểm đẹp: {d.best_time_to_visit}"
+    )
+
+
+def _fact_hotel(h, d):
+    return (
+        f"Khách sạn: {h.name} tại {d.city} - {h.star_rating} sao, "
+        f"{float(h.price_per_night):.0f} USD/đêm, đánh giá {h.rating:.1f}/5"
+    )
+
+
+def _fact_restaurant(r, d):
+    return (
+        f"Nhà hàng: {r.name} tại {d.city} - {r.cuisine_type}, mức giá {r.price_range}, "
+        f"món đặc trưng: {r.specialty[:80]}, đánh giá {r.rating:.1f}/5"
+    )
+
+
+def _fact_attraction(a, d):
+    return (
+        f"Tham quan: {a.name} tại {d.city} - {a.get_category_display()}, "
+        f"vé {float(a.entry_fee):.0f} USD, mở cửa {a.opening_hours}, đánh giá {a.rating:.1f}/5"
+    )
+
+
+class RetrievalIndex:
+    """Inverted index (BM25) và từ điển thực thể (tên/thành phố) dựng sẵn trong bộ nhớ"""
+
+    def __init__(self):
+        self.kinds = []             # doc -> loại
+        self.destination_ids = []   # doc -> destination_id
+        self.object_ids = []        # doc -> id của bản ghi (khách sạn, nhà hàng...)
+        self.ratings = array("f")
+        self.lengths = array("I")
+        self.facts = []
+        self.postings = {}          # term -> (array docs, array tf)
+        self.entities = {}          # cụm từ đã bỏ dấu -> set(destination_id)
+        self.docs_by_destination = {}
+        self.avg_length = 1.0
+
+    def add(self, kind, destination_id, object_id, rating, fact, text):
+        doc = len(self.facts)
+        terms = Counter(t for t in fold_text(text).split() if t not in STOPWORDS)
+        self.kinds.append(kind)
+        self.destination_ids.append(destination_id)
+        self.object_ids.append(object_id)
+        self.ratings.append(rating or 0.0)
+        self.lengths.append(sum(terms.values()) or 1)
+        self.facts.append(fact)
+        for term, tf in terms.items():
+            if term not in self.postings:
+                self.postings[term] = (array("I"), array("H"))
+            docs, tfs = self.postings[term]
+            docs.append(doc)
+            tfs.append(min(tf, 65535))
+        self.docs_by_destination.setdefault(destination_id, []).append(doc)
+
+    def add_entity(self, phrase, destination_id):
+        phrase = fold_text(phrase)
+        if phrase and phrase not in STOPWORDS:
+            self.entities.setdefault(phrase, set()).add(destination_id)
+
+    def finish(self):
+        if self.lengths:
+            self.avg_length = sum(self.lengths) / len(self.lengths)
+
+    def __len__(self):
+        return len(self.facts)
+
+    # --- Truy vấn ----------------------------------------------------------
+
+    def match_entities(self, words):
+        """Các destination_id được nhắc tới trong câu hỏi (khớp cụm 1-4 từ, ưu tiên cụm dài)"""
+        matched = set()
+        i = 0
+        while i < len(words):
+            for n in range(min(MAX_ENTITY_WORDS, len(words) - i), 0, -1):
+                phrase = " ".join(words[i:i + n])
+                if phrase in self.entities:
+                    matched |= self.entities[phrase]
+                    i += n - 1
+                    break
+            i += 1
+        return matched
+
+    @staticmethod
+    def detect_kinds(folded):
+        padded = f" {folded} "
+        return {kind for kind, keywords in KIND_KEYWORDS.items()
+                if any(f" {k} " in padded for k in keywords)}
+
+    def search(self, message, top_k):
+        """Top-k doc liên quan nhất: BM25 + khớp thực thể + loại thông tin + rating"""
+        folded = fold_text(message)
+        words = folded.split()
+        if not words or not self.facts:
+            return []
+
+        n_docs = len(self.facts)
+        scores = {}
+        terms = [t for t in set(words) if t not in STOPWORDS and t in self.postings]
+        # Bỏ qua từ quá phổ biến: ít giá trị phân biệt mà duyệt posting rất tốn
+        max_df = max(1, int(n_docs * RETRIEVAL_SETTINGS['MAX_DF_RATIO']))
+        for term in (t for t in terms if len(self.postings[t][0]) <= max_df):
+            docs, tfs = self.postings[term]
+            df = len(docs)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc, tf in zip(docs, tfs):
+                norm = tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc] / self.avg_length)
+                )
+                scores[doc] = scores.get(doc, 0.0) + idf * norm
+
+        entity_boost = RETRIEVAL_SETTINGS['ENTITY_BOOST']
+        for destination_id in self.match_entities(words):
+            for doc in self.docs_by_destination.get(destination_id, ()):
+                scores[doc] = scores.get(doc, 0.0) + entity_boost
+
+        if not scores:
+            return []
+
+        kinds = self.detect_kinds(folded)
+        kind_boost = RETRIEVAL_SETTINGS['KIND_BOOST']
+        rating_weight = RETRIEVAL_SETTINGS['RATING_WEIGHT']
+
+        def final_score(doc):
+            score = scores[doc] + rating_weight * self.ratings[doc]
+            if self.kinds[doc] in kinds:
+                score += kind_boost
+            return score
+
+        ranked = heapq.nlargest(top_k, scores, key=final_score)
+        # Bỏ các kết quả yếu hơn hẳn kết quả tốt nhất
+        cutoff = final_score(ranked[0]) * RETRIEVAL_SETTINGS['MIN_RELATIVE_SCORE']
+        return [doc for doc in ranked if final_score(doc) >= cutoff]
+
+
+def build_index():
+    """Dựng index từ toàn bộ catalog (mỗi model một query)"""
+    index = RetrievalIndex()
+    destinations = {}
+    for d in Destination.objects.all().iterator(chunk_size=2000):
+        destinations[d.pk] = d
+        index.add(DESTINATION, d.pk, d.pk, d.rating, _fact_destination(d),
+                  f"{d.name} {d.city} {d.country} {d.description[:300]} {d.best_time_to_visit}")
+        index.add_entity(d.name, d.pk)
+        index.add_entity(d.city, d.pk)
+
+    for model, kind, fact, text in (
+        (Hotel, HOTEL, _fact_hotel, lambda h, d: f"{h.name} {d.city} {h.star_rating} sao {h.amenities}"),
+        (Restaurant, RESTAURANT, _fact_restaurant, lambda r, d: f"{r.name} {d.city} {r.cuisine_type} {r.specialty}"),
+        (Attraction, ATTRACTION, _fact_attraction, lambda a, d: f"{a.name} {d.city} {a.category} {a.description[:300]}"),
+    ):
+        for obj in model.objects.all().iterator(chunk_size=2000):
+            d = destinations.get(obj.destination_id)
+            if d is None:
+                continue
+            index.add(kind, d.pk, obj.pk, obj.rating, fact(obj, d), text(obj, d))
+            if kind == ATTRACTION:
+                index.add_entity(obj.name, d.pk)
+    index.finish()
+    return index
+
+
+_index = None
+_index_version = None
+_build_lock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild(version):
+    global _index, _index_version, _rebuilding
+    try:
+        index = build_index()
+        _index, _index_version = index, version
+    except Exception as e:
+        print(f"Retrieval index build error: {str(e)}")
+    finally:
+        _rebuilding = False
+
+
+def _rebuild_in_background(version):
+    try:
+        _rebuild(version)
+    finally:
+        connections.close_all()
+
+
+def get_index():
+    """Index hiện tại; dựng lại khi catalog version đổi (chạy nền nếu đã có index cũ)"""
+    global _rebuilding
+    version = get_catalog_version()
+    if _index is not None and _index_version == version:
+        return _index
+    with _build_lock:
+        if _index is None:
+            _rebuild(version)
+        elif _index_version != version and not _rebuilding:
+            _rebuilding = True
+            threading.Thread(target=_rebuild_in_background, args=(version,), daemon=True).start()
+    return _index
+
+
+def _destination_cards(index, message):
+    """Câu hỏi nhắc tới (ít) điểm đến cụ thể: [(text card, {(loại, id)} các mục card đã nêu)]"""
+    destination_ids = index.match_entities(fold_text(message).split())
+    if not 0 < len(destination_ids) <= CARD_SETTINGS['MAX_IN_CONTEXT']:
+        return []
+    n = CARD_SETTINGS['TEXT_TOP_N']
+    result = []
+    for pk, card in sorted(cards.get_cards(destination_ids).items()):
+        items = {(DESTINATION, pk)}
+        for kind, key in ((HOTEL, "hotels"), (RESTAURANT, "restaurants"), (ATTRACTION, "attractions")):
+            items.update((kind, item["id"]) for item in card.data[key][:n])
+        result.append((card.text, items))
+    return result
+
+
+def retrieve_facts(message, top_k=None, max_chars=None):
+    """Danh sách fact liên quan tới câu hỏi, tổng độ dài không vượt max_chars"""
+    top_k = top_k or RETRIEVAL_SETTINGS['TOP_K']
+    max_chars = max_chars or RETRIEVAL_SETTINGS['MAX_CONTEXT_CHARS']
+    facts, used = [], 0
+    # Câu hỏi "gần X": khoảng cách lấy từ geo index, không để model tự đoán
+    for fact in geo.nearby_facts(message):
+        facts.append(fact)
+        used += len(fact) + 1
+    index = get_index()
+    if index is None:
+        return facts
+    covered = set()
+    for text, items in _destination_cards(index, message):
+        if used + len(text) > max_chars:
+            continue
+        facts.append(text)
+        used += len(text) + 1
+        covered |= items
+    for doc in index.search(message, top_k):
+        if (index.kinds[doc], index.object_ids[doc]) in covered:
+            continue
+        fact = index.facts[doc]
+        if used + len(fact) > max_chars:
+            continue
+        facts.append(fact)
+        used += len(fact) + 1
+    return facts
@@ -0,0 +1,221 @@
+# Full-text search index (SQLite FTS5) cho Destination và Hotel
+from django.db import connection, connections, router, DatabaseError
+from .models import Destination, Hotel
+from .text import fold_text, tokenize
+
+DESTINATION_FTS = "chatbot_destination_fts"
+HOTEL_FTS = "chatbot_hotel_fts"
+
+# Trọng số bm25 theo cột và mức ảnh hưởng của rating lên thứ hạng:
+# điểm = bm25 * (1 + RATING_WEIGHT * rating), rating 5 sao tăng độ liên quan thêm 50%
+DESTINATION_WEIGHTS = (10.0, 6.0, 4.0, 1.0)  # name, city, country, description
+HOTEL_WEIGHTS = (10.0, 4.0)                  # name, place
+RATING_WEIGHT = 0.1
+
+_available = None
+
+
+def create_tables(conn):
+    """Tạo bảng FTS5 (nội dung đã bỏ dấu) nếu chưa có"""
+    global _available
+    _available = None
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {DESTINATION_FTS} "
+            f"USING fts5(name, city, country, description, tokenize='unicode61')"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {HOTEL_FTS} "
+            f"USING fts5(name, place, tokenize='unicode61')"
+        )
+
+
+def drop_tables(conn):
+    global _available
+    _available = None
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {DESTINATION_FTS}")
+        cursor.execute(f"DROP TABLE IF EXISTS {HOTEL_FTS}")
+
+
+def reset_availability():
+    """Kiểm tra lại bảng index ở lần dùng tới (sau migrate tạo/xóa bảng)"""
+    global _available
+    _available = None
+
+
+def is_available():
+    """FTS5 chỉ dùng được trên SQLite đã có bảng index"""
+    global _available
+    if _available is None:
+        if connection.vendor != "sqlite":
+            _available = False
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s, %s)",
+                    [DESTINATION_FTS, HOTEL_FTS],
+                )
+                _available = cursor.fetchone()[0] == 2
+    return _available
+
+
+def _destination_row(destination):
+    return (
+        destination.pk,
+        fold_text(destination.name),
+        fold_text(destination.city),
+        fold_text(destination.country),
+        fold_text(destination.description),
+    )
+
+
+def _hotel_row(hotel, destination):
+    place = " ".join([destination.name, destination.city, destination.country])
+    return (hotel.pk, fold_text(hotel.name), fold_text(place))
+
+
+def index_destination(destination, conn=connection):
+    """Cập nhật index cho một điểm đến và các khách sạn thuộc điểm đến đó"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {DESTINATION_FTS} WHERE rowid = %s", [destination.pk])
+        cursor.execute(
+            f"INSERT INTO {DESTINATION_FTS} (rowid, name, city, country, description) "
+            f"VALUES (%s, %s, %s, %s, %s)",
+            _destination_row(destination),
+        )
+    # Tên/thành phố của điểm đến nằm trong cột "place" của khách sạn
+    for hotel in destination.hotels.all():
+        index_hotel(hotel, destination=destination, conn=conn)
+
+
+def remove_destination(destination_id, conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {DESTINATION_FTS} WHERE rowid = %s", [destination_id])
+
+
+def index_hotel(hotel, destination=None, conn=connection):
+    destination = destination or hotel.destination
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {HOTEL_FTS} WHERE rowid = %s", [hotel.pk])
+        cursor.execute(
+            f"INSERT INTO {HOTEL_FTS} (rowid, name, place) VALUES (%s, %s, %s)",
+            _hotel_row(hotel, destination),
+        )
+
+
+def remove_hotel(hotel_id, conn=connection):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {HOTEL_FTS} WHERE rowid = %s", [hotel_id])
+
+
+def rebuild(destinations, hotels, conn=connection, batch_size=1000):
+    """Xây lại toàn bộ index từ queryset; trả về (số điểm đến, số khách sạn)"""
+    create_tables(conn)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {DESTINATION_FTS}")
+        cursor.execute(f"DELETE FROM {HOTEL_FTS}")
+
+    dest_count = 0
+    batch = []
+    for destination in destinations.iterator(chunk_size=batch_size):
+        batch.append(_destination_row(destination))
+        if len(batch) >= batch_size:
+            dest_count += _insert_many(conn, DESTINATION_FTS, "rowid, name, city, country, description", batch)
+            batch = []
+    dest_count += _insert_many(conn, DESTINATION_FTS, "rowid, name, city, country, description", batch)
+
+    hotel_count = 0
+    batch = []
+    for hotel in hotels.select_related("destination").iterator(chunk_size=batch_size):
+        batch.append(_hotel_row(hotel, hotel.destination))
+        if len(batch) >= batch_size:
+            hotel_count += _insert_many(conn, HOTEL_FTS, "rowid, name, place", batch)
+            batch = []
+    hotel_count += _insert_many(conn, HOTEL_FTS, "rowid, name, place", batch)
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {DESTINATION_FTS} ({DESTINATION_FTS}) VALUES ('optimize')")
+        cursor.execute(f"INSERT INTO {HOTEL_FTS} ({HOTEL_FTS}) VALUES ('optimize')")
+    return dest_count, hotel_count
+
+
+def _insert_many(conn, table, columns, rows):
+    if not rows:
+        return 0
+    placeholders = ", ".join(["%s"] * len(rows[0]))
+    with conn.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
+    return len(rows)
+
+
+def build_match_query(query):
+    """Chuyển câu tìm kiếm thành biểu thức MATCH: mọi từ (đã bỏ dấu) đều phải khớp tiền tố"""
+    tokens = tokenize(query)
+    return " AND ".join(f'"{token}"*' for token in tokens)
+
+
+def search_destination_ids(query, limit=10):
+    """Trả về danh sách id điểm đến theo độ liên quan kết hợp rating, hoặc None nếu không có FTS"""
+    if not is_available():
+        return None
+    match = build_match_query(query)
+    if not match:
+        return []
+    weights = ", ".join(str(w) for w in DESTINATION_WEIGHTS)
+    try:
+        # Chỉ đọc: theo router (replica nếu đang trong db_router.read_replica())
+        with connections[router.db_for_read(Destination)].cursor() as cursor:
+            cursor.execute(
+                f"SELECT d.id FROM {DESTINATION_FTS} f "
+                f"JOIN chatbot_destination d ON d.id = f.rowid "
+                f"WHERE {DESTINATION_FTS} MATCH %s "
+                f"ORDER BY bm25({DESTINATION_FTS}, {weights}) * (1.0 + %s * d.rating) LIMIT %s",
+                [match, RATING_WEIGHT, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError as e:
+        print(f"Search index error: {str(e)}")
+        return None
+
+
+def hotel_match_sql(query):
+    """(sql, params) chọn id mọi khách sạn khớp query, không giới hạn: để lọc/đếm facet trên cả tập khớp"""
+    return f"SELECT rowid FROM {HOTEL_FTS} WHERE {HOTEL_FTS} MATCH %s", [build_match_query(query)]
+
+
+def search_hotel_ids(query, destination_id=None, limit=10, within=None):
+    """Như search_destination_ids cho khách sạn, có thể lọc theo destination_id.
+
+    within: queryset Hotel (vd. đã áp bộ lọc facet); chỉ xếp hạng các khách sạn thuộc queryset đó,
+    lọc trong cùng câu truy vấn trước khi LIMIT.
+    """
+    if not is_available():
+        return None
+    match = build_match_query(query)
+    if not match:
+        return []
+    alias = router.db_for_read(Hotel)
+    weights = ", ".join(str(w) for w in HOTEL_WEIGHTS)
+    sql = (
+        f"SELECT h.id FROM {HOTEL_FTS} f "
+        f"JOIN chatbot_hotel h ON h.id = f.rowid "
+        f"WHERE {HOTEL_FTS} MATCH %s"
+    )
+    params = [match]
+    if destination_id:
+        sql += " AND h.destination_id = %s"
+        params.append(destination_id)
+    if within is not None:
+        within_sql, within_params = within.values("pk").query.get_compiler(using=alias).as_sql()
+        sql += f" AND h.id IN ({within_sql})"
+        params += list(within_params)
+    sql += f" ORDER BY bm25({HOTEL_FTS}, {weights}) * (1.0 + %s * h.rating) LIMIT %s"
+    params += [RATING_WEIGHT, limit]
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+    except DatabaseError as e:
+        print(f"Search index error: {str(e)}")
+        return None
@@ -0,0 +1,139 @@
+# Signal handlers giữ các index/cache đồng bộ với dữ liệu catalog
+from django.db.models.signals import post_migrate, post_save, post_delete, pre_save
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.dispatch import receiver
+from .models import Destination, Hotel, Restaurant, Attraction, HotelFacet
+from . import autocomplete, cards, chat_session, db_router, facets, search_index
+from .catalog_cache import bump_catalog_version
+
+CATALOG_MODELS = (Destination, Hotel, Restaurant, Attraction)
+
+
+def catalog_changed(sender, instance, raw=False, **kwargs):
+    """Mọi thay đổi catalog làm mới version (index truy xuất, cache context...)"""
+    if not raw:
+        # Autocomplete cập nhật từng bản ghi theo version thay vì dựng lại toàn bộ
+        autocomplete.record_change(sender, instance.pk, bump_catalog_version())
+        # Search/context dựng lại theo version mới phải đọc primary, replica có thể chưa có thay đổi
+        db_router.pin("catalog")
+
+
+for _model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=_model, dispatch_uid=f"catalog_saved_{_model.__name__}")
+    post_delete.connect(catalog_changed, sender=_model, dispatch_uid=f"catalog_deleted_{_model.__name__}")
+
+
+@receiver(post_save, sender=Destination)
+def destination_saved(sender, instance, raw=False, **kwargs):
+    if not raw and search_index.is_available():
+        search_index.index_destination(instance)
+
+
+@receiver(post_delete, sender=Destination)
+def destination_deleted(sender, instance, **kwargs):
+    if search_index.is_available():
+        search_index.remove_destination(instance.pk)
+
+
+@receiver(post_save, sender=Hotel)
+def hotel_saved(sender, instance, raw=False, **kwargs):
+    if not raw and search_index.is_available():
+        search_index.index_hotel(instance)
+
+
+@receiver(post_delete, sender=Hotel)
+def hotel_deleted(sender, instance, **kwargs):
+    if search_index.is_available():
+        search_index.remove_hotel(instance.pk)
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, **kwargs):
+    # Migration 0006 tạo/xóa bảng FTS bằng SQL riêng: xét lại is_available() sau migrate
+    search_index.reset_availability()
+
+
+# --- Facet khách sạn: cập nhật số đếm theo chênh lệch trước/sau khi lưu ----------
+
+def _facet_state(hotel):
+    return (hotel.destination_id, hotel.star_rating, hotel.price_per_night, hotel.amenity_bits)
+
+
+@receiver(pre_save, sender=Hotel)
+def hotel_pre_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance.amenity_bits = facets.amenity_bits(instance.amenities)
+    old = None
+    if instance.pk is not None:
+        old = Hotel.objects.filter(pk=instance.pk).values_list(
+            "destination_id", "star_rating", "price_per_night", "amenity_bits"
+        ).first()
+    instance._facet_old_state = old
+    instance._card_old_destination_id = old[0] if old else None
+
+
+@receiver(post_save, sender=Hotel)
+def hotel_facets_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.apply_delta(facets.hotel_deltas(getattr(instance, "_facet_old_state", None), _facet_state(instance)))
+
+
+@receiver(post_delete, sender=Hotel)
+def hotel_facets_deleted(sender, instance, **kwargs):
+    facets.apply_delta(facets.hotel_deltas(_facet_state(instance), None))
+
+
+@receiver(post_delete, sender=Destination)
+def destination_facets_deleted(sender, instance, **kwargs):
+    HotelFacet.objects.filter(scope=instance.pk).delete()
+
+
+# --- Thẻ điểm đến: dựng lại card của điểm đến bị ảnh hưởng sau khi commit ----------
+
+def _deleted_with_destination(origin):
+    """Xóa dây chuyền từ điểm đến: card bị xóa cùng điểm đến, không cần dựng lại"""
+    return isinstance(origin, Destination) or getattr(origin, "model", None) is Destination
+
+
+@receiver(post_save, sender=Destination)
+def destination_card_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cards.schedule_rebuild(instance.pk)
+
+
+@receiver(pre_save, sender=Restaurant)
+@receiver(pre_save, sender=Attraction)
+def card_item_pre_save(sender, instance, raw=False, **kwargs):
+    # Khách sạn đã lấy destination_id cũ trong hotel_pre_save
+    if not raw and instance.pk is not None:
+        instance._card_old_destination_id = sender.objects.filter(pk=instance.pk).values_list(
+            "destination_id", flat=True).first()
+
+
+def card_item_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _deleted_with_destination(origin):
+        return
+    cards.schedule_rebuild(instance.destination_id)
+    old_destination_id = getattr(instance, "_card_old_destination_id", None)
+    if old_destination_id not in (None, instance.destination_id):
+        cards.schedule_rebuild(old_destination_id)  # chuyển sang điểm đến khác
+
+
+for _model in (Hotel, Restaurant, Attraction):
+    post_save.connect(card_item_changed, sender=_model, dispatch_uid=f"card_item_saved_{_model.__name__}")
+    post_delete.connect(card_item_changed, sender=_model, dispatch_uid=f"card_item_deleted_{_model.__name__}")
+
+
+# --- Phiên chat: token ký đi theo trạng thái đăng nhập ---------------------------
+
+@receiver(user_logged_in)
+def chat_session_logged_in(sender, request, user, **kwargs):
+    if request is not None:
+        chat_session.bind_user(request, user)
+
+
+@receiver(user_logged_out)
+def chat_session_logged_out(sender, request, user, **kwargs):
+    if request is not None:
+        chat_session.clear(request)
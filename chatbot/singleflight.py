@@ -0,0 +1,194 @@
+# Gộp các lời gọi model giống hệt nhau đang chạy cùng lúc (single-flight)
+#
+# Nhiều session gửi cùng một prompt trong cùng một giây (vd. câu hỏi khuyến mãi đang hot):
+# chỉ lời gọi đầu tiên ("leader") đi tới model, các lời gọi trùng chờ và nhận chung kết quả.
+# Đây không phải cache: xong lời gọi là flight biến mất, request tới sau sẽ gọi lại model.
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from django.core.cache import cache
+from . import metrics
+from .config import COALESCE_SETTINGS
+
+
+class CoalescedCallError(Exception):
+    """Lời gọi leader ở process khác thất bại (chỉ còn thông báo lỗi)"""
+
+
+def prompt_key(kwargs):
+    """Hash của toàn bộ tham số gọi model (model, messages, temperature...)"""
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Flight:
+    __slots__ = ("done", "ok", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+        self.result = None
+        self.error = None
+
+
+_lock = threading.Lock()
+_flights = {}        # key -> _Flight (thread)
+_async_flights = {}  # key -> asyncio.Future (gắn với event loop tạo ra nó)
+
+
+def _keys(key):
+    return f"llm_flight:{key}:lock", f"llm_flight:{key}:result"
+
+
+def _unpack(stored):
+    ok, value = stored
+    metrics.LLM_COALESCED.labels("process").inc()
+    if ok:
+        return value
+    raise CoalescedCallError(value)
+
+
+# --- Sync (thread) ------------------------------------------------------------
+
+def _across_processes(key, fn):
+    """Leader giữa các process qua cache: giá trị lock là token của flight, kết quả lưu theo token"""
+    lock_key, result_key = _keys(key)
+    wait = COALESCE_SETTINGS['WAIT_TIMEOUT']
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, wait):
+            try:
+                result = fn()
+            except Exception as e:
+                cache.set(f"{result_key}:{token}", (False, str(e)), COALESCE_SETTINGS['RESULT_TTL'])
+                raise
+            else:
+                cache.set(f"{result_key}:{token}", (True, result), COALESCE_SETTINGS['RESULT_TTL'])
+                return result
+            finally:
+                cache.delete(lock_key)
+
+        token = cache.get(lock_key)
+        while token is not None and time.monotonic() < deadline:
+            time.sleep(COALESCE_SETTINGS['POLL_INTERVAL'])
+            stored = cache.get(f"{result_key}:{token}")
+            if stored is not None:
+                return _unpack(stored)
+            if cache.get(lock_key) != token:
+                break  # leader chết giữa chừng: thử làm leader
+    return fn()
+
+
+def do(key, fn):
+    """Gọi fn() một lần cho mỗi key đang chạy; các lời gọi trùng chờ và dùng chung kết quả (hoặc lỗi)"""
+    if not COALESCE_SETTINGS['ENABLED']:
+        return fn()
+
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        with metrics.span("llm_coalesce"):
+            finished = flight.done.wait(COALESCE_SETTINGS['WAIT_TIMEOUT'])
+        if not finished:
+            return fn()
+        if flight.ok:
+            metrics.LLM_COALESCED.labels("thread").inc()
+            return flight.result
+        if flight.error is None:
+            return fn()  # leader bị ngắt giữa chừng (không phải lỗi của model)
+        metrics.LLM_COALESCED.labels("thread").inc()
+        raise flight.error
+
+    try:
+        if COALESCE_SETTINGS['CROSS_PROCESS']:
+            flight.result = _across_processes(key, fn)
+        else:
+            flight.result = fn()
+        flight.ok = True
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+# --- Async (event loop) -------------------------------------------------------
+
+async def _aacross_processes(key, afn):
+    """Phiên bản async của _across_processes()"""
+    lock_key, result_key = _keys(key)
+    wait = COALESCE_SETTINGS['WAIT_TIMEOUT']
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        token = uuid.uuid4().hex
+        if await cache.aadd(lock_key, token, wait):
+            try:
+                result = await afn()
+            except Exception as e:
+                await cache.aset(f"{result_key}:{token}", (False, str(e)), COALESCE_SETTINGS['RESULT_TTL'])
+                raise
+            else:
+                await cache.aset(f"{result_key}:{token}", (True, result), COALESCE_SETTINGS['RESULT_TTL'])
+                return result
+            finally:
+                await cache.adelete(lock_key)
+
+        token = await cache.aget(lock_key)
+        while token is not None and time.monotonic() < deadline:
+            await asyncio.sleep(COALESCE_SETTINGS['POLL_INTERVAL'])
+            stored = await cache.aget(f"{result_key}:{token}")
+            if stored is not None:
+                return _unpack(stored)
+            if await cache.aget(lock_key) != token:
+                break
+    return await afn()
+
+
+async def ado(key, afn):
+    """Phiên bản async của do(): afn là hàm async không tham số"""
+    if not COALESCE_SETTINGS['ENABLED']:
+        return await afn()
+
+    loop = asyncio.get_running_loop()
+    with _lock:
+        future = _async_flights.get(key)
+        leader = future is None or future.get_loop() is not loop
+        if leader:
+            future = _async_flights[key] = loop.create_future()
+
+    if not leader:
+        with metrics.span("llm_coalesce"):
+            await asyncio.wait({future}, timeout=COALESCE_SETTINGS['WAIT_TIMEOUT'])
+        if not future.done() or future.cancelled():
+            return await afn()  # leader quá lâu hoặc bị hủy (client ngắt kết nối)
+        metrics.LLM_COALESCED.labels("thread").inc()
+        return future.result()
+
+    try:
+        if COALESCE_SETTINGS['CROSS_PROCESS']:
+            result = await _aacross_processes(key, afn)
+        else:
+            result = await afn()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # đánh dấu đã đọc để asyncio không cảnh báo khi không ai chờ
+        raise
+    finally:
+        if not future.done():
+            future.cancel()
+        with _lock:
+            if _async_flights.get(key) is future:
+                del _async_flights[key]
@@ -1,3 +1,1037 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db import OperationalError
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from . import (
+    answer_cache, cards, catalog_cache, chat_session, db_router, geo, http_cache, prompt, ratelimit, resilience,
+    views,
+)
+from .chat_buffer import DEAD_LETTER_FILE, ChatHistoryBuffer
+from .config import (
+    AI_SETTINGS, ANSWER_CACHE_SETTINGS, CATALOG_CACHE_SETTINGS, CHAT_SESSION_SETTINGS, PROMPT_SETTINGS,
+    RATE_LIMIT_SETTINGS, RESILIENCE_SETTINGS,
+)
+from .models import ArchivedChatHistory, ChatHistory, Destination, DestinationCard, Hotel
+from .pagination import InvalidCursor, decode_cursor, keyset_paginate, parse_per_page
 
-# Create your tests here.
+_model_names = itertools.count()
+
+
+def _destination(**fields):
+    values = {
+        "name": "Phố cổ Hội An", "city": "Hội An", "country": "Việt Nam",
+        "description": "Phố cổ bên sông Hoài với đèn lồng và ẩm thực địa phương.",
+        "best_time_to_visit": "Tháng 2 - Tháng 4", "average_cost": 40, "rating": 4.7,
+    }
+    values.update(fields)
+    return Destination.objects.create(**values)
+
+
+def _model():
+    """Tên model riêng cho mỗi test: breaker/latency của resilience là toàn cục"""
+    return f"test-model-{next(_model_names)}"
+
+
+@mock.patch.dict(RESILIENCE_SETTINGS, {'MIN_CALLS': 4, 'FAILURE_RATIO': 0.5, 'SLOW_CALL_SECONDS': 1.0,
+                                       'SLOW_CALL_RATIO': 0.8, 'OPEN_SECONDS': 15, 'HALF_OPEN_CALLS': 2})
+class CircuitBreakerTests(SimpleTestCase):
+    def _failing(self, cb, calls):
+        for _ in range(calls):
+            cb.record(0.01, False)
+
+    def test_opens_when_failure_ratio_reached(self):
+        cb = resilience.CircuitBreaker(_model())
+        cb.record(0.01, True)
+        self._failing(cb, 2)
+        self.assertEqual(cb.state, cb.CLOSED)  # chưa đủ MIN_CALLS
+        self._failing(cb, 1)
+        self.assertEqual(cb.state, cb.OPEN)
+        self.assertFalse(cb.allow())
+
+    def test_opens_on_slow_calls(self):
+        cb = resilience.CircuitBreaker(_model())
+        for _ in range(4):
+            cb.record(2.0, True)
+        self.assertEqual(cb.state, cb.OPEN)
+
+    def test_stays_closed_below_ratio(self):
+        cb = resilience.CircuitBreaker(_model())
+        for ok in (True, True, True, False, True, False):
+            cb.record(0.01, ok)
+        self.assertEqual(cb.state, cb.CLOSED)
+        self.assertTrue(cb.allow())
+
+    def test_half_open_limits_probes_then_closes(self):
+        cb = resilience.CircuitBreaker(_model())
+        self._failing(cb, 4)
+        with mock.patch.dict(RESILIENCE_SETTINGS, {'OPEN_SECONDS': 0}):
+            self.assertTrue(cb.allow())
+            self.assertEqual(cb.state, cb.HALF_OPEN)
+            self.assertTrue(cb.allow())
+            self.assertFalse(cb.allow())  # hết HALF_OPEN_CALLS lượt thử
+            cb.record(0.01, True)
+            self.assertEqual(cb.state, cb.HALF_OPEN)
+            cb.record(0.01, True)
+        self.assertEqual(cb.state, cb.CLOSED)
+        self.assertTrue(cb.allow())
+
+    def test_failed_probe_reopens(self):
+        cb = resilience.CircuitBreaker(_model())
+        self._failing(cb, 4)
+        with mock.patch.dict(RESILIENCE_SETTINGS, {'OPEN_SECONDS': 0}):
+            self.assertTrue(cb.allow())
+            cb.record(0.01, False)
+        self.assertEqual(cb.state, cb.OPEN)
+        self.assertFalse(cb.allow())
+
+    def test_late_result_ignored_while_open(self):
+        cb = resilience.CircuitBreaker(_model())
+        self._failing(cb, 4)
+        cb.record(0.01, True)
+        self.assertEqual(cb.state, cb.OPEN)
+
+    def test_hedge_only_when_closed(self):
+        cb = resilience.CircuitBreaker(_model())
+        self.assertTrue(cb.allow(hedge=True))
+        self._failing(cb, 4)
+        self.assertFalse(cb.allow(hedge=True))
+        with mock.patch.dict(RESILIENCE_SETTINGS, {'OPEN_SECONDS': 0}):
+            self.assertFalse(cb.allow(hedge=True))
+            self.assertEqual(cb.state, cb.HALF_OPEN)
+            # Bản sao hedge không chiếm lượt thử của half-open
+            self.assertTrue(cb.allow())
+            self.assertTrue(cb.allow())
+
+
+@mock.patch.dict(RESILIENCE_SETTINGS, {'HEDGE_ENABLED': True, 'HEDGE_MIN_DELAY': 0.05, 'HEDGE_MIN_SAMPLES': 5,
+                                       'HEDGE_BUDGET': 1.0, 'DEADLINE': 5, 'ATTEMPT_TIMEOUT': 2,
+                                       'MIN_CALLS': 4, 'OPEN_SECONDS': 15, 'HALF_OPEN_CALLS': 2})
+class HedgedCallTests(SimpleTestCase):
+    def setUp(self):
+        budget = mock.patch.object(resilience, "_budget", resilience._HedgeBudget())
+        budget.start()
+        self.addCleanup(budget.stop)
+        self.record = mock.Mock(wraps=resilience.record)
+        recorder = mock.patch.object(resilience, "record", self.record)
+        recorder.start()
+        self.addCleanup(recorder.stop)
+
+    def _warm(self, model):
+        # Đủ mẫu latency để tính ngưỡng hedge (không đi qua breaker)
+        for _ in range(5):
+            resilience._latency_window(model).add(0.01)
+
+    def _slow_first(self):
+        calls = []
+
+        def attempt(model, timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return "slow"
+            return "fast"
+        return attempt, calls
+
+    def test_slow_call_sends_one_hedge_and_records_once(self):
+        model = _model()
+        self._warm(model)
+        attempt, calls = self._slow_first()
+        self.assertEqual(resilience.call(attempt, [model]), "fast")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.record.call_count, 1)
+        self.assertTrue(self.record.call_args.args[2])
+
+    def test_async_slow_call_sends_one_hedge_and_records_once(self):
+        model = _model()
+        self._warm(model)
+        calls = []
+
+        async def attempt(model, timeout):
+            calls.append(timeout)
+            if len(calls) == 1:
+                await asyncio.sleep(0.5)
+                return "slow"
+            return "fast"
+        self.assertEqual(asyncio.run(resilience.acall(attempt, [model])), "fast")
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.record.call_count, 1)
+
+    def test_no_hedge_in_half_open(self):
+        model = _model()
+        self._warm(model)
+        cb = resilience.breaker(model)
+        for _ in range(4):
+            cb.record(0.01, False)
+        attempt, calls = self._slow_first()
+        with mock.patch.dict(RESILIENCE_SETTINGS, {'OPEN_SECONDS': 0}):
+            self.assertEqual(resilience.call(attempt, [model]), "slow")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.record.call_count, 1)
+
+    def test_no_hedge_without_budget(self):
+        model = _model()
+        self._warm(model)
+        attempt, calls = self._slow_first()
+        with mock.patch.dict(RESILIENCE_SETTINGS, {'HEDGE_BUDGET': 0.0}):
+            self.assertEqual(resilience.call(attempt, [model]), "slow")
+        self.assertEqual(len(calls), 1)
+
+    def test_error_is_not_hedged_and_falls_back(self):
+        primary, fallback = _model(), _model()
+        self._warm(primary)
+        calls = []
+
+        def attempt(model, timeout):
+            calls.append(model)
+            if model == primary:
+                raise ValueError("upstream 500")
+            return "fallback"
+        self.assertEqual(resilience.call(attempt, [primary, fallback]), "fallback")
+        self.assertEqual(calls, [primary, fallback])
+        self.assertEqual([c.args[2] for c in self.record.call_args_list], [False, True])
+
+    def test_open_circuit_skips_model(self):
+        primary, fallback = _model(), _model()
+        cb = resilience.breaker(primary)
+        for _ in range(4):
+            cb.record(0.01, False)
+        calls = []
+
+        def attempt(model, timeout):
+            calls.append(model)
+            return model
+        self.assertEqual(resilience.call(attempt, [primary, fallback]), fallback)
+        self.assertEqual(calls, [fallback])
+        with self.assertRaises(resilience.CircuitOpenError):
+            resilience.call(attempt, [primary])
+
+
+class ReadReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = db_router.ReadReplicaRouter()
+        replicas = mock.patch.object(db_router, "replicas", return_value=["replica_1"])
+        replicas.start()
+        self.addCleanup(replicas.stop)
+
+    def test_reads_replica_only_inside_block(self):
+        self.assertEqual(self.router.db_for_read(ChatHistory), db_router.PRIMARY)
+        with db_router.read_replica() as alias:
+            self.assertEqual(alias, "replica_1")
+            self.assertEqual(self.router.db_for_read(ChatHistory), "replica_1")
+            self.assertEqual(self.router.db_for_write(ChatHistory), db_router.PRIMARY)
+        self.assertEqual(self.router.db_for_read(ChatHistory), db_router.PRIMARY)
+
+    def test_decorator(self):
+        @db_router.read_replica("catalog")
+        def read():
+            return self.router.db_for_read(Destination)
+        self.assertEqual(read(), "replica_1")
+        db_router.pin("catalog")
+        self.assertEqual(read(), db_router.PRIMARY)
+
+    def test_pinned_key_reads_primary(self):
+        db_router.pin("session:a")
+        self.assertTrue(db_router.is_pinned("session:a"))
+        with db_router.read_replica("session:a") as alias:
+            self.assertEqual(alias, db_router.PRIMARY)
+            self.assertEqual(self.router.db_for_read(ChatHistory), db_router.PRIMARY)
+        # Key khác không bị ảnh hưởng
+        with db_router.read_replica("session:b") as alias:
+            self.assertEqual(alias, "replica_1")
+
+    def test_pin_sets_sticky_window_and_skips_empty_keys(self):
+        with mock.patch.object(db_router.cache, "set_many") as set_many:
+            db_router.pin("session:a", None, "user:1")
+        values, timeout = set_many.call_args.args
+        self.assertEqual(set(values), {"db_pin:session:a", "db_pin:user:1"})
+        self.assertEqual(timeout, db_router.DATABASE_SETTINGS['STICKY_SECONDS'])
+
+    def test_no_replicas_reads_primary_and_skips_pin(self):
+        with mock.patch.object(db_router, "replicas", return_value=[]):
+            db_router.pin("session:a")
+            with db_router.read_replica() as alias:
+                self.assertEqual(alias, db_router.PRIMARY)
+                self.assertEqual(self.router.db_for_read(ChatHistory), db_router.PRIMARY)
+        self.assertFalse(db_router.is_pinned("session:a"))
+
+    def test_migrate_only_primary(self):
+        self.assertTrue(self.router.allow_migrate(db_router.PRIMARY, "chatbot"))
+        self.assertFalse(self.router.allow_migrate("replica_1", "chatbot"))
+
+    def test_catalog_write_pins_catalog(self):
+        _destination()
+        self.assertTrue(db_router.is_pinned("catalog"))
+
+    def test_saved_chat_pins_session_and_user(self):
+        with mock.patch.object(views, "save_chat_record"):
+            views._save_chat("session-1", 7, "xin chào", "Chào bạn!", remember=False)
+        self.assertTrue(db_router.is_pinned("session:session-1"))
+        self.assertTrue(db_router.is_pinned("user:7"))
+        self.assertFalse(db_router.is_pinned("session:session-2"))
+
+
+# Dùng TransactionTestCase: trong TestCase, SQLite hoãn kiểm tra khóa ngoại tới cuối test
+# nên bản ghi có user đã bị xóa không lỗi lúc flush
+class ChatHistoryBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("traveller", password="x")
+
+    def _buffer(self, **kwargs):
+        buffer = ChatHistoryBuffer(max_attempts=2, **kwargs)
+        buffer._stopped = True  # không chạy thread nền, test gọi flush() trực tiếp
+        return buffer
+
+    def _record(self, buffer, session_id, user_id=None):
+        return buffer.record(session_id=session_id, user_id=user_id, user_message="hi", bot_response="hello")
+
+    def test_flush_writes_batch(self):
+        buffer = self._buffer()
+        for i in range(3):
+            self._record(buffer, f"s{i}", self.user.pk)
+        self.assertEqual(len(buffer.pending()), 3)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(buffer.pending(), [])
+        self.assertEqual(ChatHistory.objects.count(), 3)
+
+    def test_bad_row_does_not_block_batch_and_is_dropped(self):
+        buffer = self._buffer()
+        self._record(buffer, "good-1", self.user.pk)
+        self._record(buffer, "bad", 999999)  # user không tồn tại
+        self._record(buffer, "good-2")
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(set(ChatHistory.objects.values_list("session_id", flat=True)), {"good-1", "good-2"})
+        self.assertEqual([c.session_id for c in buffer.pending()], ["bad"])
+        # Lỗi max_attempts lần thì bỏ khỏi buffer
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending(), [])
+        self.assertEqual(ChatHistory.objects.count(), 2)
+
+    def test_bad_row_goes_to_dead_letter_spool(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            buffer = self._buffer(spool_dir=spool_dir)
+            self._record(buffer, "good", self.user.pk)
+            self._record(buffer, "bad", 999999)
+            buffer.flush()
+            buffer.flush()
+            self.assertEqual(buffer.pending(), [])
+            with open(os.path.join(spool_dir, DEAD_LETTER_FILE), encoding="utf-8") as dead_letter:
+                entries = [json.loads(line) for line in dead_letter]
+            self.assertEqual([e["record"]["session_id"] for e in entries], ["bad"])
+            self.assertTrue(entries[0]["error"])
+            # Spool của process chỉ còn bản ghi chưa ghi (không còn gì)
+            with open(buffer._spool_path(), encoding="utf-8") as spool:
+                self.assertEqual(spool.read(), "")
+            buffer._spool_file.close()
+
+    def test_db_outage_keeps_rows_without_counting_attempts(self):
+        buffer = self._buffer()
+        self._record(buffer, "s1", self.user.pk)
+        self._record(buffer, "s2")
+        with mock.patch.object(ChatHistory.objects, "bulk_create", side_effect=OperationalError("database is locked")):
+            for _ in range(buffer.max_attempts + 1):
+                self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(buffer.pending()), 2)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(ChatHistory.objects.count(), 2)
+
+    def test_user_deleted_while_pending(self):
+        buffer = self._buffer()
+        self._record(buffer, "s1", self.user.pk)
+        User.objects.filter(pk=self.user.pk).delete()
+        self._record(buffer, "s2")
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(list(ChatHistory.objects.values_list("session_id", flat=True)), ["s2"])
+
+    def test_history_keeps_record_flushed_during_read(self):
+        # Thread nền flush ngay trước hoặc ngay sau truy vấn DB của trang:
+        # lượt chat phải hiện đúng một lần
+        for flush_after_query in (False, True):
+            with self.subTest(flush_after_query=flush_after_query):
+                ChatHistory.objects.all().delete()
+                buffer = self._buffer()
+                self._record(buffer, "s1")
+                paginate = views.keyset_paginate
+
+                def paginate_with_flush(*args, **kwargs):
+                    if not flush_after_query:
+                        buffer.flush()
+                    page = paginate(*args, **kwargs)
+                    if flush_after_query:
+                        buffer.flush()
+                    return page
+                headers = {CHAT_SESSION_SETTINGS['HEADER']: chat_session.ChatSession("s1").issue().token}
+                with mock.patch.object(views, "pending_chats", buffer.pending), \
+                        mock.patch.object(views, "keyset_paginate", paginate_with_flush):
+                    data = self.client.get("/chat/history/", headers=headers).json()
+                self.assertEqual([h["user_message"] for h in data["history"]], ["hi"])
+
+    def test_replay_dead_process_spool(self):
+        with tempfile.TemporaryDirectory() as spool_dir:
+            dead = self._buffer(spool_dir=spool_dir)
+            rows = [self._record(dead, "s1", self.user.pk), self._record(dead, "s2", 999999)]
+            dead._spool_file.close()
+            # Giả lập spool của một process đã chết
+            os.rename(dead._spool_path(), dead._spool_path(pid=999999999))
+
+            buffer = self._buffer(spool_dir=spool_dir)
+            self.assertEqual(buffer.replay_spools(), 1)
+            self.assertEqual(ChatHistory.objects.get().timestamp, rows[0].timestamp)
+            self.assertEqual(sorted(os.listdir(spool_dir)), [DEAD_LETTER_FILE])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() - timedelta(days=1)
+        # Từng cặp bản ghi cùng timestamp: thứ tự phải dựa thêm vào id
+        ChatHistory.objects.bulk_create([
+            ChatHistory(session_id="s", user_message=f"q{i}", bot_response="a", timestamp=start + timedelta(seconds=i // 2))
+            for i in range(25)
+        ])
+        ChatHistory.objects.create(session_id="other", user_message="x", bot_response="y")
+        cls.ordered = list(ChatHistory.objects.filter(session_id="s").order_by("timestamp", "pk"))
+
+    def _queryset(self):
+        return ChatHistory.objects.filter(session_id="s")
+
+    def _walk(self, descending=False, per_page=10):
+        pages, cursor = [], None
+        while True:
+            page = keyset_paginate(self._queryset(), cursor, per_page, descending=descending)
+            pages.append(page)
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_forward_pages_cover_all_rows_once(self):
+        pages = self._walk()
+        self.assertEqual([len(p.items) for p in pages], [10, 10, 5])
+        self.assertEqual([c.pk for p in pages for c in p], [c.pk for c in self.ordered])
+        self.assertFalse(pages[0].has_previous)
+        self.assertIsNone(pages[0].prev_cursor)
+        self.assertTrue(pages[-1].has_previous)
+        self.assertIsNone(pages[-1].next_cursor)
+
+    def test_descending(self):
+        pages = self._walk(descending=True)
+        self.assertEqual([c.pk for p in pages for c in p], [c.pk for c in reversed(self.ordered)])
+
+    def test_prev_cursor_returns_previous_page(self):
+        first, second, third = self._walk()
+        back = keyset_paginate(self._queryset(), third.prev_cursor, 10)
+        self.assertEqual([c.pk for c in back], [c.pk for c in second])
+        self.assertTrue(back.has_next)
+        self.assertTrue(back.has_previous)
+        back = keyset_paginate(self._queryset(), back.prev_cursor, 10)
+        self.assertEqual([c.pk for c in back], [c.pk for c in first])
+        self.assertFalse(back.has_previous)
+
+    def test_merges_archived_rows(self):
+        oldest = self.ordered[0].timestamp - timedelta(hours=1)
+        ArchivedChatHistory.objects.bulk_create([
+            ArchivedChatHistory(id=100000 + i, session_id="s", user_message="old", bot_response="a",
+                                timestamp=oldest + timedelta(seconds=i))
+            for i in range(5)
+        ])
+        archived = ArchivedChatHistory.objects.filter(session_id="s")
+        page = keyset_paginate(self._queryset(), None, 8, also=(archived,))
+        self.assertEqual([c.user_message for c in page][:5], ["old"] * 5)
+        page = keyset_paginate(self._queryset(), page.next_cursor, 8, also=(archived,))
+        self.assertEqual([c.pk for c in page], [c.pk for c in self.ordered[3:11]])
+
+    def test_invalid_cursor(self):
+        for cursor in ("not-a-cursor", "eyJ0IjoieCJ9", "e30"):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(self._queryset(), "garbage", 10)
+
+    def test_parse_per_page(self):
+        self.assertEqual(parse_per_page(None), 20)
+        self.assertEqual(parse_per_page("abc"), 20)
+        self.assertEqual(parse_per_page("0"), 1)
+        self.assertEqual(parse_per_page("500"), 100)
+        self.assertEqual(parse_per_page("15"), 15)
+
+    def test_history_view(self):
+        token = chat_session.ChatSession("s").issue().token
+        headers = {CHAT_SESSION_SETTINGS['HEADER']: token}
+        data = self.client.get("/chat/history/", {"per_page": 20, "count": "exact"}, headers=headers).json()
+        self.assertEqual(len(data["history"]), 20)
+        self.assertEqual(data["total"], 25)
+        self.assertTrue(data["has_next"])
+        data = self.client.get("/chat/history/", {"per_page": 20, "cursor": data["next"]}, headers=headers).json()
+        self.assertEqual([h["user_message"] for h in data["history"]], [c.user_message for c in self.ordered[20:]])
+        self.assertFalse(data["has_next"])
+        response = self.client.get("/chat/history/", {"cursor": "garbage"}, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "invalid_cursor")
+
+
+class HttpCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.destination = _destination()
+
+    def setUp(self):
+        cache.clear()
+
+    def _search(self, query="hoi an", **headers):
+        return self.client.get("/api/search/destinations/", {"q": query}, headers=headers)
+
+    def test_etag_and_not_modified(self):
+        response = self._search()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["count"], 1)
+        etag = response["ETag"]
+        self.assertIn("max-age", response["Cache-Control"])
+        self.assertIn("public", response["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            response = self._search(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response.content, b"")
+        # ETag yếu (GZipMiddleware thêm W/) vẫn khớp
+        self.assertEqual(self._search(**{"If-None-Match": f"W/{etag}"}).status_code, 304)
+        self.assertEqual(self._search(**{"If-None-Match": '"stale"'}).status_code, 200)
+
+    def test_equivalent_queries_share_entry(self):
+        etag = self._search("Hoi  An")["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/search/destinations/", {"q": " hoi an", "_": "12345"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_catalog_change_invalidates(self):
+        etag = self._search()["ETag"]
+        self.destination.rating = 4.9
+        with self.captureOnCommitCallbacks(execute=True):  # card dựng lại sau commit
+            self.destination.save()
+        response = self._search(**{"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["results"][0]["rating"], 4.9)
+
+    def test_error_responses_not_cached(self):
+        response = self.client.get("/api/search/hotels/", {"min_stars": "abc"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header("ETag"))
+        response = self.client.get("/api/search/hotels/", {"min_stars": "abc"}, headers={"If-None-Match": "*"})
+        self.assertEqual(response.status_code, 400)
+
+
+class HttpCacheRefreshTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        _destination()
+
+    def test_refresh_ahead_rebuilds_from_params(self):
+        threads = []
+
+        class _Thread(threading.Thread):
+            def start(self):
+                threads.append(self)
+                super().start()
+
+        calls = []
+        builder = views.search_destinations.__wrapped__.__wrapped__  # bỏ ratelimit, cached_api
+
+        def recording_builder(**params):
+            calls.append(params)
+            return builder(**params)
+
+        with mock.patch.dict(CATALOG_CACHE_SETTINGS, {'REFRESH_RATIO': 0}), \
+                mock.patch.object(catalog_cache.threading, "Thread", _Thread), \
+                mock.patch.object(catalog_cache, "close_old_connections") as close_old:
+            view = http_cache.cached_api("search_destinations", ("q",))(recording_builder)
+            first = view(RequestFactory().get("/", {"q": "Hoi  An"}))
+            second = view(RequestFactory().get("/", {"q": "hoi an"}))
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(threads), 1)
+        close_old.assert_called_once()
+        # Thread nền dựng lại chỉ từ tham số đã chuẩn hóa, không dùng HttpRequest
+        self.assertEqual(calls, [{"q": "hoi an"}, {"q": "hoi an"}])
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(json.loads(second.content)["count"], 1)
+
+
+class AnswerCacheTests(SimpleTestCase):
+    QUESTION = "Nên đi Đà Nẵng vào mùa nào trong năm?"
+
+    def setUp(self):
+        self.cache = answer_cache.AnswerCache(max_entries=3, ttl=60)
+        self.cache.set(self.QUESTION, 1, "Tháng 3 - tháng 8")
+
+    def test_exact_match_ignores_accents_and_punctuation(self):
+        self.assertEqual(self.cache.get("nen di da nang vao mua nao trong nam", 1), "Tháng 3 - tháng 8")
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_near_duplicate_hits(self):
+        for question in ("Nên đi Đà Nẵng vào mùa nào trong năm nhỉ?", "Nen di Da Nang vao mua nao trong nam vay"):
+            self.assertEqual(self.cache.get(question, 1), "Tháng 3 - tháng 8")
+        self.assertEqual(self.cache.stats()["similar_hits"], 2)
+
+    def test_different_question_misses(self):
+        self.assertIsNone(self.cache.get("Nên đi Hội An vào mùa nào trong năm?", 1))
+        self.assertIsNone(self.cache.get("Khách sạn nào ở Huế rẻ nhất?", 1))
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    def test_numbers_must_match(self):
+        self.cache.set("Thời tiết Đà Lạt tháng 3 thế nào?", 1, "Mát")
+        self.assertIsNone(self.cache.get("Thời tiết Đà Lạt tháng 5 thế nào?", 1))
+
+    def test_context_version_and_ttl(self):
+        self.assertIsNone(self.cache.get(self.QUESTION, 2))
+        with mock.patch.object(answer_cache.time, "time", return_value=time.time() + 61):
+            self.assertIsNone(self.cache.get(self.QUESTION, 1))
+
+    def test_lru_eviction(self):
+        for i in range(3):
+            self.cache.set(f"Câu hỏi số {i} về du lịch Phú Quốc", 1, str(i))
+        self.assertIsNone(self.cache.get(self.QUESTION, 1))
+        self.assertEqual(self.cache.stats()["entries"], 3)
+
+    def test_disabled(self):
+        with mock.patch.object(answer_cache, "answer_cache", self.cache), \
+                mock.patch.dict(ANSWER_CACHE_SETTINGS, {'ENABLED': False}):
+            self.assertIsNone(answer_cache.get_cached_answer(self.QUESTION, 1))
+
+
+class LocalRateLimitBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = ratelimit.LocalBackend()
+        self.now = time.time()
+
+    def test_sliding_window(self):
+        results = [self.backend.sliding_window("k", 3, 10, self.now + i) for i in range(4)]
+        self.assertEqual([r[0] for r in results], [True, True, True, False])
+        self.assertEqual([r[1] for r in results], [2, 1, 0, 0])
+        self.assertAlmostEqual(results[-1][2], 7.0)  # request đầu tiên ra khỏi window sau 7 giây
+        self.assertFalse(self.backend.sliding_window("k", 3, 10, self.now + 9.9)[0])
+        self.assertTrue(self.backend.sliding_window("k", 3, 10, self.now + 10.5)[0])
+        # Key khác có quota riêng
+        self.assertTrue(self.backend.sliding_window("other", 3, 10, self.now + 3)[0])
+
+    def test_sweep_keeps_logs_inside_long_window(self):
+        for i in range(2):
+            self.backend.sliding_window("hourly", 2, 3600, self.now + i)
+        # Sau chu kỳ dọn (60s) log vẫn còn hiệu lực trong window 1 giờ
+        later = self.now + 2 * self.backend.SWEEP_INTERVAL
+        self.backend.sliding_window("other", 2, 10, later)
+        self.assertFalse(self.backend.sliding_window("hourly", 2, 3600, later + 1)[0])
+
+    def test_sweep_drops_expired_logs(self):
+        self.backend.sliding_window("short", 2, 10, self.now)
+        self.backend.sliding_window("other", 2, 10, self.now + self.backend.SWEEP_INTERVAL + 1)
+        self.assertNotIn("short", self.backend._logs)
+
+    def test_token_bucket(self):
+        # 4 request / 8 giây: burst 4, sau đó 1 token mỗi 2 giây
+        results = [self.backend.token_bucket("k", 4, 8, self.now) for _ in range(5)]
+        self.assertEqual([r[0] for r in results], [True, True, True, True, False])
+        self.assertAlmostEqual(results[-1][2], 2.0)
+        self.assertFalse(self.backend.token_bucket("k", 4, 8, self.now + 1.5)[0])
+        self.assertTrue(self.backend.token_bucket("k", 4, 8, self.now + 2.1)[0])
+        # Lâu không dùng thì bucket đầy lại nhưng không vượt quá limit
+        allowed, remaining, _ = self.backend.token_bucket("k", 4, 8, self.now + 100)
+        self.assertTrue(allowed)
+        self.assertEqual(remaining, 3)
+
+
+@mock.patch.dict(RATE_LIMIT_SETTINGS, {'TRUSTED_PROXIES': ["10.0.0.0/8", "127.0.0.1"]})
+class ClientIpTests(SimpleTestCase):
+    def setUp(self):
+        ratelimit._trusted_networks.cache_clear()
+        self.addCleanup(ratelimit._trusted_networks.cache_clear)
+        self.factory = RequestFactory()
+
+    def _ip(self, remote_addr, forwarded=None):
+        extra = {"REMOTE_ADDR": remote_addr}
+        if forwarded is not None:
+            extra["HTTP_X_FORWARDED_FOR"] = forwarded
+        return ratelimit.get_client_ip(self.factory.get("/", **extra))
+
+    def test_untrusted_peer_ignores_forwarded_header(self):
+        self.assertEqual(self._ip("203.0.113.9", "198.51.100.1"), "203.0.113.9")
+
+    def test_trusted_proxy_uses_rightmost_untrusted_address(self):
+        # Client tự thêm 1.2.3.4 vào header; chỉ địa chỉ proxy tin cậy ghi nhận mới được dùng
+        self.assertEqual(self._ip("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.5"), "198.51.100.7")
+
+    def test_only_trusted_hops(self):
+        self.assertEqual(self._ip("127.0.0.1", "10.1.1.1"), "127.0.0.1")
+        self.assertEqual(self._ip("127.0.0.1", "not-an-ip"), "not-an-ip")
+        self.assertEqual(self._ip("10.0.0.2"), "10.0.0.2")
+
+
+@mock.patch.dict(RATE_LIMIT_SETTINGS, {'ALGORITHM': 'sliding_window', 'TRUSTED_PROXIES': [],
+                                       'RATES': {'test': (2, 60)}})
+class RateLimitDecoratorTests(SimpleTestCase):
+    def setUp(self):
+        ratelimit._trusted_networks.cache_clear()
+        backend = mock.patch.object(ratelimit, "_backend", ratelimit.LocalBackend())
+        backend.start()
+        self.addCleanup(backend.stop)
+        self.factory = RequestFactory()
+        self.view = ratelimit.ratelimit("test")(lambda request: JsonResponse({"ok": True}))
+
+    def _get(self, ip):
+        return self.view(self.factory.get("/", REMOTE_ADDR=ip))
+
+    def test_limits_per_client(self):
+        first, second, third = (self._get("203.0.113.1") for _ in range(3))
+        self.assertEqual([first.status_code, second.status_code, third.status_code], [200, 200, 429])
+        self.assertEqual(first["RateLimit-Remaining"], "1")
+        self.assertEqual(first["RateLimit-Policy"], "2;w=60")
+        self.assertEqual(third["Retry-After"], "60")
+        self.assertEqual(json.loads(third.content)["error"], "rate_limit_exceeded")
+        self.assertEqual(self._get("203.0.113.2").status_code, 200)
+
+    def test_backend_error_fails_open(self):
+        with mock.patch.object(ratelimit._backend, "sliding_window", side_effect=ConnectionError("redis down")):
+            for _ in range(3):
+                self.assertEqual(self._get("203.0.113.1").status_code, 200)
+
+
+class _WordEncoding:
+    """Tokenizer giả: mỗi từ một token"""
+
+    def encode(self, text):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+
+@mock.patch.dict(PROMPT_SETTINGS, {'MAX_PROMPT_TOKENS': 800, 'CONTEXT_WINDOW': 128000, 'CONTEXT_MAX_TOKENS': 250,
+                                   'HISTORY_MAX_TOKENS': 300, 'SUMMARY_MAX_TOKENS': 80,
+                                   'USER_MESSAGE_MAX_TOKENS': 100, 'ESTIMATE_MARGIN': 0.1})
+class BuildPromptTests(SimpleTestCase):
+    def setUp(self):
+        # Đếm bằng ước lượng cho kết quả ổn định dù máy có tiktoken hay không
+        encoding = mock.patch.object(prompt, "_get_encoding", return_value=None)
+        encoding.start()
+        self.addCleanup(encoding.stop)
+        # Số đếm đã cache phụ thuộc tokenizer đang dùng
+        prompt.count_tokens_cached.cache_clear()
+        self.addCleanup(prompt.count_tokens_cached.cache_clear)
+
+    def _sent_tokens(self, built):
+        # Đếm lại trên messages thực sự gửi đi
+        return sum(prompt.count_tokens(m["content"]) + prompt.TOKENS_PER_MESSAGE
+                   for m in built.messages) + prompt.TOKENS_PER_REPLY
+
+    def _history(self, turns):
+        history = []
+        for i in range(turns):
+            history.append({"role": "user", "content": f"Câu hỏi số {i} về lịch trình Đà Nẵng Hội An ba ngày"})
+            history.append({"role": "assistant", "content": f"Trả lời số {i}: " + "ngày một đi Bà Nà, " * 8})
+        return history
+
+    def test_small_prompt_is_untouched(self):
+        built = prompt.build_prompt("Đi Huế tháng mấy đẹp?", "Huế: mùa khô tháng 1-8", self._history(1), "Khách hỏi về miền Trung")
+        self.assertEqual(built.trimmed, [])
+        self.assertEqual(len(built.messages), 4)
+        self.assertEqual(built.token_counts["budget"], 720)  # trừ ESTIMATE_MARGIN khi đếm ước lượng
+        self.assertLessEqual(built.token_counts["total"], built.token_counts["budget"])
+
+    def test_large_inputs_stay_within_budget(self):
+        context = "\n".join(f"Fact {i}: khách sạn ven biển Mỹ Khê hạng {i % 5 + 1} sao, giá tốt" for i in range(80))
+        history = self._history(30)
+        summary = "Khách đang lên kế hoạch du lịch miền Trung cùng gia đình. " * 40
+        question = "Gợi ý lịch trình chi tiết " * 80
+        built = prompt.build_prompt(question, context, history, summary)
+
+        budget = built.token_counts["budget"]
+        self.assertLessEqual(built.token_counts["total"], budget)
+        self.assertLessEqual(self._sent_tokens(built), budget)
+        self.assertEqual(set(built.trimmed), {"user", "context", "summary", "history"})
+        system = built.messages[0]["content"]
+        self.assertTrue(system.startswith(prompt.SYSTEM_PROMPT))
+        # Giữ fact xếp hạng cao nhất và các lượt mới nhất
+        self.assertIn("Fact 0:", system)
+        self.assertNotIn("Fact 79:", system)
+        self.assertEqual(built.messages[-2], history[-1])
+        self.assertEqual(built.messages[-1]["role"], "user")
+
+    def test_history_dropped_before_context(self):
+        context = "\n".join(f"Fact {i}: nhà hàng hải sản" for i in range(5))
+        with mock.patch.dict(PROMPT_SETTINGS, {'MAX_PROMPT_TOKENS': 400}):
+            built = prompt.build_prompt("Ăn gì ở Đà Nẵng?", context, self._history(10))
+        self.assertNotIn("context", built.trimmed)
+        self.assertIn("history", built.trimmed)
+        self.assertLessEqual(self._sent_tokens(built), built.token_counts["budget"])
+
+    def test_budget_with_tokenizer_and_context_window(self):
+        with mock.patch.object(prompt, "_get_encoding", return_value=_WordEncoding()):
+            self.assertEqual(prompt.prompt_budget(), 800)
+            with mock.patch.dict(PROMPT_SETTINGS, {'CONTEXT_WINDOW': AI_SETTINGS['MAX_TOKENS'] + 500}):
+                self.assertEqual(prompt.prompt_budget(), 500)
+            built = prompt.build_prompt("xin chào " * 200, "", self._history(20))
+            self.assertLessEqual(self._sent_tokens(built), 800)
+
+
+@mock.patch.dict(CATALOG_CACHE_SETTINGS, {'REFRESH_AHEAD': False})
+class CatalogVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def _builder(self):
+        self.builds += 1
+        return f"build-{self.builds}"
+
+    def test_catalog_writes_bump_version(self):
+        version = catalog_cache.get_catalog_version()
+        destination = _destination()
+        self.assertEqual(catalog_cache.get_catalog_version(), version + 1)
+        hotel = Hotel.objects.create(
+            name="Khách sạn Sông Hoài", destination=destination, address="1 Bạch Đằng",
+            star_rating=4, price_per_night=80, amenities="wifi,pool", rating=4.5,
+        )
+        destination.rating = 4.8
+        destination.save()
+        hotel.delete()
+        self.assertEqual(catalog_cache.get_catalog_version(), version + 4)
+        # Dữ liệu ngoài catalog không làm mới cache
+        ChatHistory.objects.create(session_id="s", user_message="hi", bot_response="hello")
+        self.assertEqual(catalog_cache.get_catalog_version(), version + 4)
+
+    def test_bump_after_cache_cleared(self):
+        catalog_cache.bump_catalog_version()
+        cache.clear()
+        self.assertEqual(catalog_cache.bump_catalog_version(), 2)
+
+    def test_versioned_key_rebuilds_after_save(self):
+        self.assertEqual(catalog_cache.get_or_build("test:k", self._builder), "build-1")
+        self.assertEqual(catalog_cache.get_or_build("test:k", self._builder), "build-1")
+        version = catalog_cache.get_catalog_version()
+        self.assertIsNotNone(cache.get(f"test:k:v{version}"))
+
+        _destination()
+        self.assertEqual(catalog_cache.get_or_build("test:k", self._builder), "build-2")
+        self.assertIsNotNone(cache.get(f"test:k:v{version + 1}"))
+        self.assertEqual(self.builds, 2)
+
+    def test_stale_value_while_other_request_rebuilds(self):
+        catalog_cache.get_or_build("test:k", self._builder)
+        catalog_cache.bump_catalog_version()
+        cache.add("test:k:lock", 1)  # request khác đang dựng lại
+        self.assertEqual(catalog_cache.get_or_build("test:k", self._builder), "build-1")
+        self.assertEqual(self.builds, 1)
+        cache.delete("test:k:lock")
+        self.assertEqual(catalog_cache.get_or_build("test:k", self._builder), "build-2")
+
+    def test_refresh_ahead(self):
+        with mock.patch.dict(CATALOG_CACHE_SETTINGS, {'REFRESH_AHEAD': True}), \
+                mock.patch.object(catalog_cache.threading, "Thread") as thread:
+            catalog_cache.get_or_build("test:k", self._builder, timeout=60)
+            with mock.patch.object(catalog_cache.time, "time", return_value=time.time() + 50):
+                self.assertEqual(catalog_cache.get_or_build("test:k", self._builder, timeout=60), "build-1")
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+
+class HotelSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        destination = _destination()
+        for i in range(30):
+            Hotel.objects.create(
+                name=f"Hotel Sông Hoài {i}", destination=destination, address=f"{i} Bạch Đằng",
+                star_rating=i % 5 + 1, price_per_night=40 + i * 10,
+                amenities="wifi, hồ bơi" if i % 3 == 0 else "wifi", rating=5 - i / 10,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def _search(self, **params):
+        response = self.client.get("/api/search/hotels/", {"q": "hotel song hoai", **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_results_and_facets_from_same_filtered_set(self):
+        data = self._search(min_stars="5", amenities="pool")
+        expected = Hotel.objects.filter(star_rating__gte=5, amenities__contains="hồ bơi").count()
+        self.assertEqual(expected, 2)
+        self.assertEqual(data["count"], expected)
+        self.assertEqual(sum(data["facets"]["star_rating"].values()), expected)
+        self.assertEqual(data["facets"]["amenities"]["pool"], expected)
+        for hotel in data["results"]:
+            self.assertEqual(hotel["star_rating"], 5)
+            self.assertIn("pool", hotel["amenity_keys"])
+
+    def test_facets_count_full_match_set(self):
+        data = self._search()
+        self.assertEqual(data["count"], 10)
+        self.assertEqual(sum(data["facets"]["star_rating"].values()), 30)
+        self.assertEqual(data["facets"]["amenities"]["pool"], 10)
+        # Xếp hạng theo bm25 kết hợp rating: cùng độ khớp thì rating cao đứng trước
+        self.assertEqual(data["results"][0]["name"], "Hotel Sông Hoài 0")
+
+    def test_filter_without_matches(self):
+        data = self._search(min_price="1000")
+        self.assertEqual(data["count"], 0)
+        self.assertEqual(sum(data["facets"]["star_rating"].values()), 0)
+
+
+class ChatSessionTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", password="mat-khau-1")
+        cls.bob = User.objects.create_user("bob", password="mat-khau-2")
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def _token(self, response):
+        return response.cookies[CHAT_SESSION_SETTINGS['COOKIE_NAME']].value
+
+    def _login(self, username, password):
+        response = self.client.post("/login/", {"username": username, "password": password})
+        self.assertEqual(response.status_code, 302)
+        return self._token(response)
+
+    def _peek(self, token, user=None):
+        request = self.factory.get("/", **{"HTTP_X_CHAT_SESSION": token})
+        request.user = user or AnonymousUser()
+        return chat_session.peek(request)
+
+    def test_login_keeps_guest_session_and_token_is_accepted(self):
+        guest = chat_session.ChatSession("phien-khach").issue().token
+        self.client.cookies[CHAT_SESSION_SETTINGS['COOKIE_NAME']] = guest
+        token = self._login("alice", "mat-khau-1")
+        session = chat_session.verify(token)
+        self.assertEqual((session.session_id, session.user_id), ("phien-khach", self.alice.pk))
+
+        ChatHistory.objects.create(session_id="phien-khach", user=self.alice, user_message="hi", bot_response="chào")
+        response = self.client.get("/chat/history/")
+        self.assertEqual([c["user_message"] for c in response.json()["history"]], ["hi"])
+
+    def test_login_as_other_user_in_same_browser(self):
+        # login() flush session khi đổi user: token cấp lúc đó vẫn phải dùng được ở request sau
+        self._login("alice", "mat-khau-1")
+        token = self._login("bob", "mat-khau-2")
+        session = chat_session.verify(token)
+        self.assertEqual(session.user_id, self.bob.pk)
+        ChatHistory.objects.create(session_id=session.session_id, user=self.bob, user_message="hi", bot_response="chào")
+        response = self.client.get("/chat/history/")
+        self.assertEqual([c["user_message"] for c in response.json()["history"]], ["hi"])
+
+    def test_tampered_token_rejected(self):
+        token = chat_session.ChatSession("phien-1").issue().token
+        self.assertIsNotNone(self._peek(token))
+        for bad in (token[:-2] + ("aa" if not token.endswith("aa") else "bb"), token.replace(":", ";", 1), "rac"):
+            with self.subTest(bad=bad):
+                self.assertIsNone(self._peek(bad))
+
+    def test_expired_token_rejected(self):
+        token = chat_session.ChatSession("phien-1").issue().token
+        with mock.patch.dict(CHAT_SESSION_SETTINGS, {'MAX_AGE': -1}):
+            self.assertIsNone(self._peek(token))
+
+    def test_token_of_other_user_rejected(self):
+        session = chat_session.ChatSession("phien-alice", self.alice.pk, auth_hash=chat_session.auth_hash(self.alice))
+        token = session.issue().token
+        self.assertIsNotNone(self._peek(token, self.alice))
+        self.assertIsNone(self._peek(token, self.bob))
+        self.assertIsNone(self._peek(token))  # đã đăng xuất
+
+    def test_password_change_invalidates_token(self):
+        session = chat_session.ChatSession("phien-alice", self.alice.pk, auth_hash=chat_session.auth_hash(self.alice))
+        token = session.issue().token
+        self.alice.set_password("mat-khau-moi")
+        self.alice.save()
+        self.assertIsNone(self._peek(token, self.alice))
+
+    def test_logout_clears_cookie(self):
+        self._login("alice", "mat-khau-1")
+        response = self.client.get("/logout/")
+        self.assertEqual(self._token(response), "")
+
+
+class DestinationSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.destination = _destination()
+
+    def _search(self):
+        response = self.client.get("/api/search/destinations/", {"q": "hoi an"})
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_list_returns_summary_only(self):
+        self.assertTrue(DestinationCard.objects.filter(pk=self.destination.pk).exists())
+        [result] = self._search()
+        self.assertEqual(set(result), set(cards.SUMMARY_FIELDS))
+        self.assertEqual(result["name"], self.destination.name)
+
+    def test_missing_card_read_only_fallback(self):
+        DestinationCard.objects.all().delete()
+        with self.captureOnCommitCallbacks() as callbacks:
+            [result] = self._search()
+            # Chi tiết điểm đến khi chưa có card: bản gọn từ bảng Destination
+            response = self.client.get("/api/search/hotels/", {"destination_id": self.destination.pk})
+        self.assertEqual(callbacks, [])
+        self.assertFalse(DestinationCard.objects.exists())
+        self.assertEqual(set(result), set(cards.SUMMARY_FIELDS))
+        self.assertEqual(result["city"], self.destination.city)
+        self.assertEqual(response.json()["destination"], result)
+
+
+class GeoIndexTests(SimpleTestCase):
+    def setUp(self):
+        # Dữ liệu thưa: vài cụm điểm tham quan cách nhau hàng nghìn km, chỉ hai điểm đến
+        self.index = geo.GeoIndex(0.1)
+        pk = itertools.count(1)
+        for city, (lat, lon) in list(geo.CITY_COORDINATES.items())[::3]:
+            for i in range(20):
+                self.index.add(geo.ATTRACTION, next(pk), f"{city} {i}", city,
+                               lat + (i % 5 - 2) * 0.07, lon + (i // 5 - 2) * 0.07, 1)
+        self.index.add(geo.DESTINATION, 1, "Hội An", "Hội An", 15.88, 108.33, 1)
+        self.index.add(geo.DESTINATION, 2, "Paris", "Paris", 48.85, 2.35, 2)
+
+    def _brute(self, lat, lon, radius_km, k, kinds=None):
+        distances = sorted(
+            (geo.haversine_km(lat, lon, self.index.lats[p], self.index.lons[p]), p)
+            for p in range(len(self.index)) if not kinds or self.index.kinds[p] in kinds
+        )
+        return [round(d, 6) for d, _ in distances if d <= radius_km][:k]
+
+    def test_matches_brute_force(self):
+        world = math.pi * geo.EARTH_RADIUS_KM
+        for lat, lon in ((21.0, 105.8), (-40.0, -70.0), (48.0, 179.9), (0.0, -179.95)):
+            for radius_km, k, kinds in ((50, 5, None), (2000, 50, None), (world, 10, {geo.DESTINATION}),
+                                        (world, 1000, None)):
+                with self.subTest(lat=lat, lon=lon, radius_km=radius_km, k=k, kinds=kinds):
+                    found = self.index._search(lat, lon, radius_km, k, kinds)
+                    self.assertEqual([round(d, 6) for d, _ in found], self._brute(lat, lon, radius_km, k, kinds))
+
+    def test_sparse_search_stops_at_populated_cells(self):
+        # Không đủ k điểm đến: trước đây duyệt hết ~1800 vòng ô trống (hàng giây mỗi truy vấn)
+        with mock.patch.object(geo.GeoIndex, "_ring", autospec=True, side_effect=geo.GeoIndex._ring) as ring:
+            started = time.perf_counter()
+            found = self.index.nearest(21.0, 105.8, 10, kinds={geo.DESTINATION})
+            elapsed = time.perf_counter() - started
+        self.assertEqual([self.index.ids[p] for _, p in found], [1, 2])
+        self.assertLessEqual(ring.call_count, math.isqrt(len(self.index.cells)) // 2 + 1)
+        self.assertLess(elapsed, 0.5)
@@ -0,0 +1,24 @@
+# Text normalization helpers (tiếng Việt)
+import re
+import unicodedata
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_D_TABLE = str.maketrans({"đ": "d", "Đ": "D"})
+
+
+def fold_text(text):
+    """Bỏ dấu tiếng Việt, chuyển chữ thường, bỏ dấu câu và khoảng trắng thừa.
+
+    "Đi Đà Nẵng tháng mấy đẹp?" -> "di da nang thang may dep"
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFD", text.translate(_D_TABLE))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _NON_WORD.sub(" ", text.lower())
+    return " ".join(text.split())
+
+
+def tokenize(text):
+    """Tách từ trên văn bản đã bỏ dấu"""
+    return fold_text(text).split()
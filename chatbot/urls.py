@@ -1,15 +1,21 @@
 from django.urls import path
 from . import views
 from . import auth_views
+from .config import AI_SETTINGS
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("test/", views.test_view, name="test"),  # Test URL
-    path("chat/", views.chat, name="chat"),
+    # ASYNC_CHAT=True khi chạy dưới ASGI để /chat/ dùng view async
+    path("chat/", views.chat_async if AI_SETTINGS['ASYNC_CHAT'] else views.chat, name="chat"),
+    path("chat/async/", views.chat_async, name="chat_async"),
     path("chat/history/", views.chat_history, name="chat_history"),
     path("chat/clear/", views.clear_chat, name="clear_chat"),
     path("api/search/destinations/", views.search_destinations, name="search_destinations"),
     path("api/search/hotels/", views.search_hotels, name="search_hotels"),
+    path("api/search/nearby/", views.nearby_search, name="nearby_search"),
+    path("api/autocomplete/", views.autocomplete_search, name="autocomplete"),
+    path("metrics/", views.metrics_view, name="metrics"),
     
     # Authentication URLs
     path("register/", auth_views.register_view, name="register"),
@@ -1,40 +1,39 @@
 from django.shortcuts import render
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.views.decorators.http import require_http_methods
 from django.core.cache import cache
+from django.utils.cache import patch_cache_control
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from asgiref.sync import sync_to_async
 from django.db.models import Q
+from django.db.models.expressions import RawSQL
+import hmac
 import json
 import os
 import uuid
 import time
-# from openai import OpenAI
 from dotenv import load_dotenv
-from .models import ChatHistory, Destination, Hotel, Restaurant, Attraction
+from .models import ArchivedChatHistory, ChatHistory, Destination, Hotel, Restaurant, Attraction
+from . import autocomplete, cards, chat_session, db_router, facets, geo, intents, llm, metrics, search_index
+from .answer_cache import get_cached_answer, cache_answer
+from .ratelimit import ratelimit
+from .http_cache import ApiError, cached_api
+from .chat_buffer import save_chat_record, pending_chats, discard_pending_session, unwritten
+from .catalog_cache import get_catalog_version, get_or_build
+from .retrieval import retrieve_facts
+from .prompt import build_prompt
+from .memory import load_memory, record_turn, clear_memory, is_follow_up
+from .config import (
+    RETRIEVAL_SETTINGS, PROMPT_SETTINGS, CATALOG_CACHE_SETTINGS, METRICS_SETTINGS, GEO_SETTINGS,
+    AUTOCOMPLETE_SETTINGS, HTTP_CACHE_SETTINGS,
+)
+from .pagination import keyset_paginate, count_total, parse_per_page, InvalidCursor
 
 # 🔑 Tải biến môi trường từ file .env
 load_dotenv()
 
-# ✅ Khởi tạo OpenAI client với API Key (commented for now)
-# client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Rate limiting configuration
-RATE_LIMIT_REQUESTS = 10  # Max requests per minute
-RATE_LIMIT_WINDOW = 60   # Window in seconds
-
-def rate_limit_check(request):
-    """Simple rate limiting"""
-    user_ip = request.META.get('REMOTE_ADDR', 'unknown')
-    cache_key = f"rate_limit_{user_ip}"
-    
-    current_requests = cache.get(cache_key, 0)
-    if current_requests >= RATE_LIMIT_REQUESTS:
-        return False
-    
-    cache.set(cache_key, current_requests + 1, RATE_LIMIT_WINDOW)
-    return True
+# ✅ OpenAI client được khởi tạo trong chatbot/llm.py (dùng placeholder nếu chưa có API key)
 
 def validate_message(message):
     """Validate user input"""
@@ -57,6 +56,7 @@ def validate_message(message):
     
     return True, message
 
+@ensure_csrf_cookie
 def index(request):
     """Trang chính của chatbot"""
     return render(request, "chatbot/index.html")
@@ -65,276 +65,688 @@ def test_view(request):
     """Test view để debug"""
     return HttpResponse("<h1>🎯 TEST VIEW WORKING!</h1>")
 
+@db_router.read_replica("catalog")
+def _build_travel_context():
+    context_parts = []
+
+    # Lấy top destinations với optimization
+    destinations = Destination.objects.select_related().filter(
+        rating__gte=4.0
+    ).order_by('-rating')[:10]
+    
+    if destinations:
+        dest_info = "Điểm đến phổ biến: " + ", ".join(
+            [f"{d.name} ({d.city}, {d.country})" for d in destinations]
+        )
+        context_parts.append(dest_info)
+
+    # Lấy top hotels
+    hotels = Hotel.objects.select_related('destination').filter(
+        rating__gte=4.0
+    ).order_by('-rating')[:5]
+    
+    if hotels:
+        hotel_info = "Khách sạn đề xuất: " + ", ".join(
+            [f"{h.name} ({h.destination.city})" for h in hotels]
+        )
+        context_parts.append(hotel_info)
+
+    return " | ".join(context_parts)
+
 def get_travel_context():
     """Lấy thông tin du lịch từ database để bổ sung context cho AI"""
-    # Use caching to improve performance
-    cache_key = "travel_context"
-    context = cache.get(cache_key)
-    
-    if context is None:
-        context_parts = []
-
-        # Lấy top destinations với optimization
-        destinations = Destination.objects.select_related().filter(
-            rating__gte=4.0
-        ).order_by('-rating')[:10]
-        
-        if destinations:
-            dest_info = "Điểm đến phổ biến: " + ", ".join(
-                [f"{d.name} ({d.city}, {d.country})" for d in destinations]
-            )
-            context_parts.append(dest_info)
-
-        # Lấy top hotels
-        hotels = Hotel.objects.select_related('destination').filter(
-            rating__gte=4.0
-        ).order_by('-rating')[:5]
-        
-        if hotels:
-            hotel_info = "Khách sạn đề xuất: " + ", ".join(
-                [f"{h.name} ({h.destination.city})" for h in hotels]
+    # Cache theo version catalog: sửa dữ liệu trong admin có hiệu lực ngay
+    return get_or_build("travel_context", _build_travel_context, CATALOG_CACHE_SETTINGS['CONTEXT_TIMEOUT'])
+
+def get_travel_context_version():
+    """Version của dữ liệu dùng làm context, là một phần khóa cache câu trả lời"""
+    return f"catalog-{get_catalog_version()}"
+
+def get_relevant_context(user_message):
+    """Chỉ lấy các thông tin catalog liên quan tới câu hỏi; fallback về context chung"""
+    if RETRIEVAL_SETTINGS['ENABLED']:
+        facts = retrieve_facts(user_message)
+        if facts:
+            return "\n".join(f"- {fact}" for fact in facts)
+    return get_travel_context()
+
+def build_prompt_messages(user_message, memory=None):
+    """Ghép prompt với context du lịch và bộ nhớ hội thoại trong ngân sách token"""
+    with metrics.span("context"):
+        # Câu hỏi nối tiếp ("còn khách sạn thì sao?") thường không nhắc lại điểm đến
+        retrieval_query = f"{memory.last_user_message} {user_message}" if memory else user_message
+        prompt = build_prompt(
+            user_message, get_relevant_context(retrieval_query),
+            history=memory.history_messages() if memory else None,
+            summary=memory.summary if memory else "",
+        )
+    for section, tokens in prompt.token_counts.items():
+        if section != "budget":
+            metrics.PROMPT_TOKENS.labels(section).observe(tokens)
+    if PROMPT_SETTINGS['LOG_TOKEN_COUNTS']:
+        print(f"Prompt tokens: {prompt.token_counts} trimmed={prompt.trimmed}")
+    return prompt.messages
+
+def _prepare_chat(request):
+    """Parse và validate request chat.
+
+    Trả về (error_response, user_message, session) với session là chat_session.ChatSession;
+    error_response khác None khi request không hợp lệ.
+    """
+    # Parse and validate JSON
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            "reply": "Dữ liệu không hợp lệ.",
+            "error": "invalid_json"
+        }, status=400), None, None
+
+    user_message = data.get("message", "")
+
+    # Validate message
+    is_valid, validated_message = validate_message(user_message)
+    if not is_valid:
+        return JsonResponse({
+            "reply": validated_message,
+            "error": "validation_failed"
+        }, status=400), None, None
+
+    # Phiên chat từ token ký (cấp mới nếu chưa có), không đọc/ghi django_session
+    return None, validated_message, chat_session.get_session(request)
+
+def _save_chat(session_id, user_id, user_message, reply, response_time=None, time_to_first_token=None,
+               is_cached=False, intent="", remember=True):
+    """Lưu một lượt chat vào lịch sử (và bộ nhớ hội thoại nếu remember)"""
+    try:
+        with metrics.span("save"):
+            chat = save_chat_record(
+                session_id=session_id,
+                user_message=user_message,
+                bot_response=reply,
+                response_time=response_time,
+                time_to_first_token=time_to_first_token,
+                is_cached=is_cached,
+                intent=intent,
+                user_id=user_id,
             )
-            context_parts.append(hotel_info)
+            if remember:
+                record_turn(session_id, user_message, reply, chat.timestamp)
+        # Lịch sử của phiên/user này đọc từ primary trong vài giây tới (replica có thể chưa kịp)
+        db_router.pin(f"session:{session_id}", user_id and f"user:{user_id}")
+    except Exception as db_error:
+        print(f"Database error: {str(db_error)}")
+        # Continue even if saving fails
+
+def _save_chat_error(session_id, user_id, user_message, error):
+    """Vẫn lưu lỗi vào lịch sử chat để dễ tra"""
+    try:
+        save_chat_record(
+            session_id=session_id or str(uuid.uuid4()),
+            user_message=user_message or "Unknown",
+            bot_response=f"ERROR: {str(error)}",
+            user_id=user_id,
+        )
+    except:
+        pass
+
+AI_UNAVAILABLE_REPLY = "Xin lỗi, hệ thống AI tạm thời không khả dụng. Vui lòng thử lại sau."
+INTERNAL_ERROR_REPLY = "Xin lỗi, có lỗi xảy ra với hệ thống. Vui lòng thử lại sau."
+DEGRADED_REPLY_INTRO = (
+    "Hệ thống AI đang quá tải nên chưa thể trả lời chi tiết. "
+    "Một số thông tin liên quan từ dữ liệu du lịch của chúng tôi:"
+)
+
+def _degraded_reply(user_message):
+    """Câu trả lời khi không gọi được model: câu trả lời đã cache cho câu hỏi (gần) trùng,
+    nếu không có thì các fact liên quan lấy từ catalog (chỉ đọc DB/bộ nhớ)"""
+    try:
+        cached_reply = get_cached_answer(user_message, get_travel_context_version())
+        if cached_reply is not None:
+            metrics.LLM_DEGRADED.labels("answer_cache").inc()
+            return cached_reply
+        facts = retrieve_facts(user_message) if RETRIEVAL_SETTINGS['ENABLED'] else []
+        if facts:
+            metrics.LLM_DEGRADED.labels("catalog").inc()
+            return DEGRADED_REPLY_INTRO + "\n" + "\n".join(f"- {fact}" for fact in facts[:5])
+    except Exception as e:
+        print(f"Degraded reply error: {str(e)}")
+    metrics.LLM_DEGRADED.labels("none").inc()
+    return AI_UNAVAILABLE_REPLY
+
+def _sse_event(event, payload):
+    """Định dạng một event Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+class _ChatStream:
+    """Gom các đoạn câu trả lời đang stream và đo thời gian tới token đầu tiên"""
+
+    def __init__(self, session_id, user_id, user_message, start_time, context_version):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.user_message = user_message
+        self.start_time = start_time
+        self.context_version = context_version
+        self.chunks = []
+        self.time_to_first_token = None
+        self.failed = False
+        self.completed = False
+
+    def token(self, delta):
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.time() - self.start_time
+        self.chunks.append(delta)
+        return _sse_event("token", {"delta": delta})
+
+    def error(self, error, degraded_reply=None):
+        """Event lỗi; chưa stream được gì thì gửi câu trả lời dự phòng thay cho thông báo lỗi"""
+        print(f"OpenAI API Error: {str(error)}")
+        self.failed = True
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.time() - self.start_time
+        reply = degraded_reply if degraded_reply and not self.chunks else AI_UNAVAILABLE_REPLY
+        self.chunks.append(reply)
+        return _sse_event("error", {
+            "reply": reply, "error": "ai_unavailable", "degraded": reply is not AI_UNAVAILABLE_REPLY,
+        })
 
-        context = " | ".join(context_parts)
-        # Cache for 1 hour
-        cache.set(cache_key, context, 3600)
+    def done(self):
+        self.completed = True
+        response_time = time.time() - self.start_time
+        return _sse_event("done", {
+            "response_time": round(response_time, 2),
+            "time_to_first_token": round(self.time_to_first_token or response_time, 2),
+            "error": self.failed,
+        })
 
-    return context
+    def save(self):
+        # Lưu cả khi client ngắt kết nối giữa chừng
+        if self.chunks:
+            reply = "".join(self.chunks)
+            _save_chat(
+                self.session_id, self.user_id, self.user_message, reply,
+                response_time=time.time() - self.start_time,
+                time_to_first_token=self.time_to_first_token,
+                remember=not self.failed,
+            )
+            if self.completed and not self.failed and llm.is_configured() and self.context_version is not None:
+                cache_answer(self.user_message, self.context_version, reply)
 
-@require_http_methods(["POST"])
-def chat(request):
-    """Chat endpoint với bảo mật và validation tốt hơn"""
+def _stream_chat(chat_stream, messages):
+    """Generator SSE: gửi từng đoạn câu trả lời, cuối cùng lưu lịch sử"""
+    try:
+        try:
+            for delta in llm.stream(messages, user_message=chat_stream.user_message):
+                yield chat_stream.token(delta)
+        except Exception as openai_error:
+            degraded_reply = None if chat_stream.chunks else _degraded_reply(chat_stream.user_message)
+            yield chat_stream.error(openai_error, degraded_reply)
+        yield chat_stream.done()
+    finally:
+        chat_stream.save()
+
+async def _astream_chat(chat_stream, messages):
+    """Phiên bản async của _stream_chat cho ASGI"""
     try:
-        # Rate limiting check
-        if not rate_limit_check(request):
-            return JsonResponse({
-                "reply": "Quá nhiều yêu cầu. Vui lòng thử lại sau 1 phút.",
-                "error": "rate_limit_exceeded"
-            }, status=429)
-
-        # Parse and validate JSON
         try:
-            data = json.loads(request.body)
-        except json.JSONDecodeError:
-            return JsonResponse({
-                "reply": "Dữ liệu không hợp lệ.",
-                "error": "invalid_json"
-            }, status=400)
-
-        user_message = data.get("message", "")
-
-        # Validate message
-        is_valid, validated_message = validate_message(user_message)
-        if not is_valid:
-            return JsonResponse({
-                "reply": validated_message,
-                "error": "validation_failed"
-            }, status=400)
-
-        user_message = validated_message
-
-        # Tạo session ID nếu chưa có
-        session_id = request.session.get("chat_session_id")
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            request.session["chat_session_id"] = session_id
+            async for delta in llm.astream(messages, user_message=chat_stream.user_message):
+                yield chat_stream.token(delta)
+        except Exception as openai_error:
+            degraded_reply = None
+            if not chat_stream.chunks:
+                degraded_reply = await sync_to_async(_degraded_reply)(chat_stream.user_message)
+            yield chat_stream.error(openai_error, degraded_reply)
+        yield chat_stream.done()
+    finally:
+        await sync_to_async(chat_stream.save)()
+
+def _sse_response(streaming_content):
+    """StreamingHttpResponse cho Server-Sent Events"""
+    response = StreamingHttpResponse(streaming_content, content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+def _wants_stream(request):
+    return request.GET.get("stream") in ("1", "true")
+
+def _lookup_cached_answer(user_message, memory=None):
+    """Tìm câu trả lời cho câu hỏi (gần) trùng; trả về (context_version, reply hoặc None).
+
+    context_version là None khi không được dùng cache: câu hỏi nối tiếp, câu trả lời phụ thuộc
+    vào hội thoại trước. Câu hỏi độc lập vẫn dùng cache dù phiên đã có lịch sử.
+    """
+    if memory and is_follow_up(user_message):
+        return None, None
+    with metrics.span("answer_cache"):
+        context_version = get_travel_context_version()
+        cached_reply = get_cached_answer(user_message, context_version)
+    metrics.cache_result("answer", cached_reply is not None)
+    return context_version, cached_reply
+
+def _instant_reply_response(request, reply, response_time, **flags):
+    """Response cho câu trả lời có ngay, không gọi model (JSON hoặc SSE một lần).
+
+    flags: cached=True (answer cache) hoặc routed=<intent> (trả lời bằng mẫu câu)
+    """
+    if _wants_stream(request):
+        body = _sse_event("token", {"delta": reply}) + _sse_event("done", {
+            "response_time": round(response_time, 3),
+            "time_to_first_token": round(response_time, 3),
+            "error": False,
+            **flags,
+        })
+        response = HttpResponse(body, content_type="text/event-stream; charset=utf-8")
+        response["Cache-Control"] = "no-cache"
+        return response
+    return JsonResponse({
+        "reply": reply,
+        "response_time": round(response_time, 3),
+        **flags,
+    })
 
-        # Record start time for response measurement
-        start_time = time.time()
+class _ChatTurn:
+    """Một lượt chat: các bước trước và sau khi gọi model, dùng chung cho chat() và chat_async().
 
-        # Lấy context từ database
-        travel_context = get_travel_context()
+    Hai view chỉ khác nhau ở cách gọi model (sync/async) và cách stream câu trả lời.
+    """
 
-        # Prompt cho chatbot
-        base_prompt = """Bạn là AI assistant chuyên về du lịch Việt Nam và quốc tế với kiến thức sâu rộng.
+    def __init__(self, request):
+        self.request = request
+        self.user_message = self.session_id = self.user_id = None
+        self.start_time = None
+        self.context_version = None
+        self.messages = None
 
-NHIỆM VỤ:
-- Cung cấp thông tin chính xác, hữu ích về du lịch
-- Gợi ý điểm đến, khách sạn, nhà hàng, hoạt động
-- Tư vấn lịch trình, phương tiện, chi phí
-- Chia sẻ kinh nghiệm thực tế
+    def prepare(self):
+        """Validate rồi trả lời ngay nếu được (mẫu câu, answer cache), không thì ghép prompt.
 
-PHONG CÁCH:
-- Thân thiện, nhiệt tình
-- Trả lời chi tiết nhưng dễ hiểu
-- Đưa ra gợi ý cụ thể, thực tế
-- Xuống dòng đúng cách, đúng chỗ
+        Trả về response khi đã có câu trả lời hoặc request không hợp lệ; None khi cần gọi model
+        với self.messages.
+        """
+        with metrics.span("session"):
+            error_response, self.user_message, session = _prepare_chat(self.request)
+        if error_response is not None:
+            return error_response
+        self.session_id, self.user_id = session.session_id, session.user_id
 
-THÔNG TIN BỔ SUNG: {travel_context}
+        # Record start time for response measurement
+        self.start_time = time.time()
+
+        # Câu hỏi tra cứu/chào hỏi: trả lời bằng mẫu câu + truy vấn DB, không gọi model
+        routed = intents.route(self.user_message)
+        if routed is not None:
+            intent, reply = routed
+            return self._instant_reply(reply, intent=intent, routed=intent)
+
+        with metrics.span("memory"):
+            memory = load_memory(self.session_id)
+
+        # Câu hỏi (gần) trùng đã có câu trả lời thì không cần gọi model
+        self.context_version, cached_reply = _lookup_cached_answer(self.user_message, memory)
+        if cached_reply is not None:
+            return self._instant_reply(cached_reply, is_cached=True, cached=True)
+
+        # Lấy context từ database và ghép prompt
+        self.messages = build_prompt_messages(self.user_message, memory)
+        return None
+
+    def _instant_reply(self, reply, is_cached=False, intent="", **flags):
+        # Câu trả lời mẫu/từ cache không vào bộ nhớ hội thoại: bộ nhớ chỉ giữ các lượt model trả lời
+        response_time = time.time() - self.start_time
+        _save_chat(
+            self.session_id, self.user_id, self.user_message, reply,
+            response_time=response_time, time_to_first_token=response_time,
+            is_cached=is_cached, intent=intent, remember=False,
+        )
+        return _instant_reply_response(self.request, reply, response_time, **flags)
 
-Câu hỏi: {user_message}
+    def stream(self):
+        return _ChatStream(self.session_id, self.user_id, self.user_message, self.start_time, self.context_version)
 
-Hãy trả lời một cách chi tiết, hữu ích và thân thiện:"""
+    def finish(self, reply, degraded=False):
+        """Sau khi có câu trả lời (không stream): cache, lưu lịch sử và trả JSON"""
+        if not degraded and llm.is_configured() and self.context_version is not None:
+            cache_answer(self.user_message, self.context_version, reply)
 
-        prompt = base_prompt.format(
-            travel_context=travel_context if travel_context else "Chưa có dữ liệu cụ thể",
-            user_message=user_message,
+        # Calculate response time
+        response_time = time.time() - self.start_time
+
+        # Lưu vào lịch sử chat (không stream nên token đầu tiên đến cùng lúc với cả câu trả lời)
+        _save_chat(
+            self.session_id, self.user_id, self.user_message, reply,
+            response_time=response_time, time_to_first_token=response_time,
+            remember=not degraded,
         )
 
-        # ✅ Gọi GPT-4o với timeout và error handling (temporarily disabled)
+        payload = {
+            "reply": reply,
+            "response_time": round(response_time, 2)
+        }
+        if degraded:
+            payload["degraded"] = True
+        return JsonResponse(payload)
+
+    def fail(self, error):
+        print(f"Error in chat view: {str(error)}")
+        _save_chat_error(self.session_id, self.user_id, self.user_message, error)
+
+        return JsonResponse({
+            "reply": INTERNAL_ERROR_REPLY,
+            "error": "internal_server_error"
+        }, status=500)
+
+@require_http_methods(["POST"])
+@ratelimit("chat")
+def chat(request):
+    """Chat endpoint với bảo mật và validation tốt hơn.
+
+    Thêm ?stream=1 để nhận câu trả lời dạng Server-Sent Events theo từng token.
+    """
+    turn = _ChatTurn(request)
+    try:
+        response = turn.prepare()
+        if response is not None:
+            return response
+
+        if _wants_stream(request):
+            return _sse_response(_stream_chat(turn.stream(), turn.messages))
+
+        # ✅ Gọi model qua breaker/hedging/model dự phòng (llm.py); mạch mở thì trả lời dự phòng ngay
         try:
-            # For now, return a simple response
-            reply = f"Xin chào! Tôi đã nhận được câu hỏi: '{user_message}'. Hiện tại hệ thống AI đang được thiết lập. Vui lòng thử lại sau khi OpenAI API được cấu hình đầy đủ."
-            
-            # Original OpenAI code (commented):
-            # response = client.chat.completions.create(
-            #     model="gpt-4o",
-            #     messages=[{"role": "user", "content": prompt}],
-            #     max_tokens=800,
-            #     temperature=0.7,
-            #     timeout=30  # 30 second timeout
-            # )
-            # reply = response.choices[0].message.content
+            reply = llm.complete(turn.messages, user_message=turn.user_message)
         except Exception as openai_error:
             print(f"OpenAI API Error: {str(openai_error)}")
-            reply = "Xin lỗi, hệ thống AI tạm thời không khả dụng. Vui lòng thử lại sau."
+            return turn.finish(_degraded_reply(turn.user_message), degraded=True)
+        return turn.finish(reply)
 
-        # Calculate response time
-        response_time = time.time() - start_time
+    except Exception as e:
+        return turn.fail(e)
 
-        # Lưu vào lịch sử chat
-        try:
-            ChatHistory.objects.create(
-                session_id=session_id,
-                user_message=user_message,
-                bot_response=reply,
-                response_time=response_time,
-                user=request.user if request.user.is_authenticated else None,
-            )
-        except Exception as db_error:
-            print(f"Database error: {str(db_error)}")
-            # Continue even if saving fails
+@require_http_methods(["POST"])
+@ratelimit("chat")
+async def chat_async(request):
+    """Chat endpoint async cho ASGI: chờ model mà không giữ worker thread.
 
-        return JsonResponse({
-            "reply": reply,
-            "response_time": round(response_time, 2)
-        })
+    Cùng định dạng request/response với chat(), kể cả ?stream=1.
+    """
+    turn = _ChatTurn(request)
+    try:
+        response = await sync_to_async(turn.prepare)()
+        if response is not None:
+            return response
 
-    except Exception as e:
-        error_msg = "Xin lỗi, có lỗi xảy ra với hệ thống. Vui lòng thử lại sau."
-        print(f"Error in chat view: {str(e)}")
+        if _wants_stream(request):
+            return _sse_response(_astream_chat(turn.stream(), turn.messages))
 
-        # Vẫn lưu lỗi vào lịch sử chat để dễ tra
         try:
-            session_id = request.session.get("chat_session_id", str(uuid.uuid4()))
-            ChatHistory.objects.create(
-                session_id=session_id,
-                user_message=user_message if 'user_message' in locals() else "Unknown",
-                bot_response=f"ERROR: {str(e)}",
-                user=request.user if request.user.is_authenticated else None,
+            reply = await llm.acomplete(turn.messages, user_message=turn.user_message)
+        except Exception as openai_error:
+            print(f"OpenAI API Error: {str(openai_error)}")
+            return await sync_to_async(turn.finish)(
+                await sync_to_async(_degraded_reply)(turn.user_message), degraded=True
             )
-        except:
-            pass
+        return await sync_to_async(turn.finish)(reply)
 
-        return JsonResponse({
-            "reply": error_msg,
-            "error": "internal_server_error"
-        }, status=500)
+    except Exception as e:
+        return await sync_to_async(turn.fail)(e)
 
 def chat_history(request):
-    """API để lấy lịch sử chat với pagination"""
-    session_id = request.session.get("chat_session_id")
+    """API để lấy lịch sử chat, phân trang bằng cursor.
+
+    ?cursor=<next/prev cursor>&per_page=20&count=exact|estimate
+    """
+    session_id = chat_session.get_session_id(request)
     if not session_id:
-        return JsonResponse({"history": [], "total": 0})
+        return JsonResponse({"history": [], "total": 0, "next": None, "prev": None})
 
-    # Pagination
-    page = int(request.GET.get('page', 1))
-    per_page = int(request.GET.get('per_page', 20))
-    
-    history_queryset = ChatHistory.objects.filter(
-        session_id=session_id
-    ).order_by("timestamp")
-    
-    paginator = Paginator(history_queryset, per_page)
-    history_page = paginator.get_page(page)
-    
-    history_data = [
-        {
-            "user_message": chat.user_message,
-            "bot_response": chat.bot_response,
-            "timestamp": chat.timestamp.strftime("%H:%M"),
-            "response_time": chat.response_time,
-        }
-        for chat in history_page
-    ]
+    # Đọc từ replica; phiên vừa gửi tin nhắn thì đọc primary (read-your-writes)
+    with db_router.read_replica(f"session:{session_id}"):
+        per_page = parse_per_page(request.GET.get('per_page'), default=20)
+        history_queryset = ChatHistory.objects.filter(session_id=session_id)
+        archived_queryset = ArchivedChatHistory.objects.filter(session_id=session_id)
+        # Các tin nhắn vừa gửi có thể còn trong write-behind buffer (nằm cuối trang cuối);
+        # lấy trước khi đọc DB để bản ghi vừa được flush không bị mất
+        pending = pending_chats(session_id=session_id)
 
-    return JsonResponse({
-        "history": history_data,
-        "total": paginator.count,
-        "page": page,
-        "has_next": history_page.has_next(),
-        "has_previous": history_page.has_previous()
-    })
+        try:
+            history_page = keyset_paginate(
+                history_queryset, request.GET.get('cursor'), per_page, also=(archived_queryset,)
+            )
+        except InvalidCursor as e:
+            return JsonResponse({"error": "invalid_cursor", "message": str(e)}, status=400)
+
+        chats = list(history_page)
+        pending = unwritten(pending, chats)
+        if not history_page.has_next:
+            chats += pending
+
+        history_data = [
+            {
+                "user_message": chat.user_message,
+                "bot_response": chat.bot_response,
+                "timestamp": chat.timestamp.strftime("%H:%M"),
+                "response_time": chat.response_time,
+            }
+            for chat in chats
+        ]
+
+        total = count_total(
+            history_queryset, request.GET.get('count'), f"chat_history_count:{session_id}",
+            also=(archived_queryset,)
+        )
+
+        return JsonResponse({
+            "history": history_data,
+            "total": total + len(pending) if total is not None else None,
+            "next": history_page.next_cursor,
+            "prev": history_page.prev_cursor,
+            "has_next": history_page.has_next,
+            "has_previous": history_page.has_previous
+        })
 
 @require_http_methods(["POST"])
 def clear_chat(request):
     """Clear chat history for current session"""
-    session_id = request.session.get("chat_session_id")
+    session_id = chat_session.get_session_id(request)
     if session_id:
+        discard_pending_session(session_id)
         ChatHistory.objects.filter(session_id=session_id).delete()
+        ArchivedChatHistory.objects.filter(session_id=session_id).delete()
+        clear_memory(session_id)
+        db_router.pin(f"session:{session_id}")
         return JsonResponse({"success": True, "message": "Đã xóa lịch sử chat"})
     return JsonResponse({"success": False, "message": "Không có phiên chat"})
 
-def search_destinations(request):
-    """Search destinations API"""
-    query = request.GET.get('q', '').strip()
-    if not query:
-        return JsonResponse({"results": []})
-    
-    destinations = Destination.objects.filter(
-        Q(name__icontains=query) |
-        Q(city__icontains=query) |
-        Q(country__icontains=query) |
-        Q(description__icontains=query)
-    ).select_related().order_by('-rating')[:10]
-    
-    results = [
-        {
-            "id": dest.id,
-            "name": dest.name,
-            "city": dest.city,
-            "country": dest.country,
-            "description": dest.description[:200] + "..." if len(dest.description) > 200 else dest.description,
-            "rating": dest.rating,
-            "average_cost": float(dest.average_cost),
-            "best_time": dest.best_time_to_visit
-        }
-        for dest in destinations
-    ]
-    
-    return JsonResponse({"results": results, "count": len(results)})
-
-def search_hotels(request):
-    """Search hotels API"""
-    query = request.GET.get('q', '').strip()
-    destination_id = request.GET.get('destination_id')
-    
-    hotels_queryset = Hotel.objects.select_related('destination')
-    
-    if query:
-        hotels_queryset = hotels_queryset.filter(
+def _in_order(objects_by_id, ids):
+    """Giữ đúng thứ tự xếp hạng của danh sách id"""
+    return [objects_by_id[pk] for pk in ids if pk in objects_by_id]
+
+@ratelimit("search")
+@cached_api("search_destinations", ("q",))
+@db_router.read_replica("catalog")
+def search_destinations(q):
+    """Search destinations API (?q=); cached_api truyền tham số đã chuẩn hóa"""
+    if not q:
+        return {"results": []}
+
+    results = _search_destination_results(q)
+    return {"results": results, "count": len(results)}
+
+def _search_destination_results(query):
+    # Full-text index (không phân biệt dấu), fallback sang LIKE nếu không có FTS
+    destination_ids = search_index.search_destination_ids(query, limit=10)
+    if destination_ids is None:
+        destination_ids = list(Destination.objects.filter(
             Q(name__icontains=query) |
-            Q(destination__name__icontains=query) |
-            Q(destination__city__icontains=query)
-        )
-    
+            Q(city__icontains=query) |
+            Q(country__icontains=query) |
+            Q(description__icontains=query)
+        ).order_by('-rating').values_list('pk', flat=True)[:10])
+
+    # Bản gọn của card (không kèm top khách sạn/nhà hàng/tham quan): một truy vấn theo khóa chính
+    return _in_order(cards.get_summaries(destination_ids), destination_ids)
+
+@ratelimit("search")
+@cached_api("search_hotels", ("q", "destination_id", "amenities", "min_stars", "max_stars", "min_price", "max_price"))
+@db_router.read_replica("catalog")
+def search_hotels(q, destination_id, **params):
+    """Search hotels API.
+
+    ?q=&destination_id=&amenities=wifi,pool&min_stars=&max_stars=&min_price=&max_price=
+    Trả kèm số đếm facet (hạng sao, khoảng giá, tiện nghi) của phạm vi tìm kiếm.
+    """
+    destination_id = destination_id or None
+    try:
+        if destination_id and not destination_id.isdigit():
+            raise facets.FilterError("destination_id không hợp lệ")
+        filters = facets.parse_filters(params)
+    except facets.FilterError as e:
+        raise ApiError({"error": "invalid_filter", "message": str(e)})
+
+    data = _search_hotel_results(q, destination_id, filters)
+    payload = {"results": data["results"], "count": len(data["results"]), "facets": data["facets"]}
     if destination_id:
-        hotels_queryset = hotels_queryset.filter(destination_id=destination_id)
-    
-    hotels = hotels_queryset.order_by('-rating')[:10]
-    
+        card = cards.get_cards([int(destination_id)]).get(int(destination_id))
+        payload["destination"] = card.data if card else cards.get_summaries([int(destination_id)]).get(
+            int(destination_id))
+    return payload
+
+def _search_hotel_results(query, destination_id, filters=None):
+    filters = filters or {}
+    hotels_queryset = Hotel.objects.all()
+    # Bộ lọc facet nằm ngay trong câu xếp hạng full-text (bm25, LIMIT 10): kết quả và số đếm facet
+    # cùng tính trên một tập đã lọc
+    filtered = facets.apply_filters(hotels_queryset, filters) if filters else None
+    hotel_ids = search_index.search_hotel_ids(
+        query, destination_id=destination_id, limit=10, within=filtered) if query else None
+
+    if hotel_ids is not None:
+        hotels = _in_order(hotels_queryset.in_bulk(hotel_ids), hotel_ids)
+        # Số đếm facet trên cả tập khớp đã lọc (subquery vào bảng FTS), không chỉ 10 kết quả đầu
+        scope = hotels_queryset.none()
+        if search_index.build_match_query(query):
+            scope = (filtered if filtered is not None else hotels_queryset).filter(
+                pk__in=RawSQL(*search_index.hotel_match_sql(query)))
+            if destination_id:
+                scope = scope.filter(destination_id=destination_id)
+    else:
+        if query:
+            hotels_queryset = hotels_queryset.filter(
+                Q(name__icontains=query) |
+                Q(destination__name__icontains=query) |
+                Q(destination__city__icontains=query)
+            )
+
+        if destination_id:
+            hotels_queryset = hotels_queryset.filter(destination_id=destination_id)
+
+        hotels_queryset = facets.apply_filters(hotels_queryset, filters)
+        scope = hotels_queryset
+        hotels = hotels_queryset.order_by('-rating')[:10]
+
+    if query or filters:
+        facet_counts = facets.filtered_facets(scope)
+    else:
+        # Không lọc gì: số đếm đã tính sẵn, không phải quét bảng khách sạn
+        facet_counts = facets.precomputed_facets(destination_id)
+
+    # Chỉ đọc thành phố/quốc gia theo khóa chính, không join cả bản ghi Destination (có mô tả dài)
+    hotels = list(hotels)
+    places = {
+        pk: f"{city}, {country}"
+        for pk, city, country in Destination.objects.filter(
+            pk__in={hotel.destination_id for hotel in hotels}).values_list("pk", "city", "country")
+    }
     results = [
         {
             "id": hotel.id,
             "name": hotel.name,
-            "destination": f"{hotel.destination.city}, {hotel.destination.country}",
+            "destination": places.get(hotel.destination_id, ""),
             "star_rating": hotel.star_rating,
             "price_per_night": float(hotel.price_per_night),
             "rating": hotel.rating,
-            "amenities": hotel.amenities.split(',') if hotel.amenities else []
+            "amenities": [a.strip() for a in hotel.amenities.split(',') if a.strip()],
+            "amenity_keys": facets.amenity_keys(hotel.amenity_bits),
         }
         for hotel in hotels
     ]
-    
-    return JsonResponse({"results": results, "count": len(results)})
+    return {"results": results, "facets": facet_counts}
+
+@ratelimit("search")
+def nearby_search(request):
+    """Tìm điểm đến/điểm tham quan theo khoảng cách.
+
+    ?lat=&lon= | ?near=<tên địa danh> | ?destination_id=
+    &radius_km= (bỏ trống: k điểm gần nhất) &k=10 &type=destination,attraction
+    """
+    if not GEO_SETTINGS['ENABLED']:
+        return JsonResponse({"error": "disabled"}, status=404)
+    index = geo.get_index()
+    exclude = None
+    try:
+        if request.GET.get('lat') or request.GET.get('lon'):
+            lat, lon = float(request.GET['lat']), float(request.GET['lon'])
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError
+            origin = {"latitude": lat, "longitude": lon}
+        else:
+            if request.GET.get('destination_id'):
+                pk = int(request.GET['destination_id'])
+                row = Destination.objects.filter(pk=pk, latitude__isnull=False, longitude__isnull=False).values_list(
+                    "name", "latitude", "longitude").first()
+                place = (row[1], row[2], geo.DESTINATION, pk, row[0]) if row else None
+            else:
+                place = index.resolve_place(request.GET.get('near', ''))
+            if place is None:
+                return JsonResponse({"error": "unknown_location", "message": "Không tìm thấy tọa độ của địa điểm"},
+                                    status=404)
+            lat, lon, kind, pk, name = place
+            exclude = (kind, pk) if kind else None
+            origin = {"name": name, "type": kind, "id": pk, "latitude": lat, "longitude": lon}
+        k = max(1, min(int(request.GET.get('k') or 10), GEO_SETTINGS['MAX_RESULTS']))
+        radius = request.GET.get('radius_km')
+        radius = min(float(radius), GEO_SETTINGS['MAX_RADIUS_KM']) if radius else None
+        if radius is not None and radius <= 0:
+            raise ValueError
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "invalid_location", "message": "Tọa độ/bán kính không hợp lệ"}, status=400)
+
+    kinds = {t.strip() for t in request.GET.get('type', '').split(',') if t.strip()} or None
+    if radius is None:
+        results = index.nearest(lat, lon, k, kinds, GEO_SETTINGS['MAX_RADIUS_KM'], exclude)
+    else:
+        results = index.within(lat, lon, radius, kinds, k, exclude)
+    return JsonResponse({
+        "origin": origin,
+        "radius_km": radius,
+        "results": [index.describe(distance, point) for distance, point in results],
+        "count": len(results),
+    })
+
+@require_http_methods(["GET"])
+@ratelimit("autocomplete")
+def autocomplete_search(request):
+    """Gợi ý khi gõ: ?q=<chuỗi đang gõ, có dấu hay không đều được>&limit=8
+
+    Chỉ đọc index trong bộ nhớ (autocomplete.py), không truy vấn DB mỗi phím gõ.
+    """
+    if not AUTOCOMPLETE_SETTINGS['ENABLED']:
+        return JsonResponse({"error": "disabled"}, status=404)
+    query = request.GET.get('q', '')[:100]
+    try:
+        limit = int(request.GET.get('limit') or AUTOCOMPLETE_SETTINGS['DEFAULT_LIMIT'])
+    except ValueError:
+        return JsonResponse({"error": "invalid_limit", "message": "limit phải là số nguyên"}, status=400)
+    response = JsonResponse({"query": query, "results": autocomplete.suggest(query, limit)})
+    patch_cache_control(response, public=True, max_age=HTTP_CACHE_SETTINGS['MAX_AGE'])
+    return response
+
+def metrics_view(request):
+    """Metrics trong process theo định dạng Prometheus"""
+    if not METRICS_SETTINGS['ENABLED']:
+        return HttpResponse(status=404)
+    token = METRICS_SETTINGS['TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -46,8 +46,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'chatbot.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'chatbot.middleware.ChatSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -78,12 +80,19 @@ WSGI_APPLICATION = 'travelchatbot.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
+from chatbot.config import get_databases
+
+# DATABASE_URL cho primary, DATABASE_REPLICA_URLS cho các replica chỉ đọc
+DATABASES = get_databases()
+
+# Ghi vào primary; search/lịch sử chat đọc từ replica (chatbot/db_router.py)
+DATABASE_ROUTERS = ['chatbot.db_router.ReadReplicaRouter']
+
+# Cache: Redis khi có REDIS_URL (dùng chung giữa các worker: version catalog, rate limit, lock dựng cache),
+# ngược lại LocMemCache riêng trong từng process
+from chatbot.config import get_cache_config
+
+CACHES = get_cache_config()
 
 
 # Password validation